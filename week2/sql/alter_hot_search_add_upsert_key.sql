@@ -0,0 +1,19 @@
+-- 为已有的baidu_hot_search表增加爬取日期和内容哈希，支持按(日期, 标题)增量upsert
+USE student_management;
+
+ALTER TABLE baidu_hot_search
+    ADD COLUMN crawl_date DATE NULL COMMENT '爬取日期' AFTER source,
+    ADD COLUMN content_hash CHAR(32) COMMENT '内容哈希，用于增量更新' AFTER crawl_date;
+
+UPDATE baidu_hot_search SET crawl_date = DATE(crawl_time) WHERE crawl_date IS NULL;
+
+-- 同一天重复的标题只保留最新一条，否则无法建唯一键
+DELETE old_row FROM baidu_hot_search old_row
+JOIN baidu_hot_search new_row
+    ON old_row.crawl_date = new_row.crawl_date
+    AND old_row.title = new_row.title
+    AND old_row.id < new_row.id;
+
+ALTER TABLE baidu_hot_search
+    MODIFY COLUMN crawl_date DATE NOT NULL COMMENT '爬取日期',
+    ADD UNIQUE KEY uk_date_title (crawl_date, title);
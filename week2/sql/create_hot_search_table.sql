@@ -8,9 +8,12 @@ CREATE TABLE IF NOT EXISTS baidu_hot_search (
     url VARCHAR(500) COMMENT '链接地址',
     hot_value VARCHAR(50) COMMENT '热度值',
     source VARCHAR(50) DEFAULT 'baidu' COMMENT '数据源',
+    crawl_date DATE NOT NULL COMMENT '爬取日期',
+    content_hash CHAR(32) COMMENT '内容哈希，用于增量更新',
     crawl_time DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '爬取时间',
     created_time DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     updated_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    UNIQUE KEY uk_date_title (crawl_date, title),
     INDEX idx_rank (rank_num),
     INDEX idx_crawl_time (crawl_time)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='百度热搜数据表';
\ No newline at end of file
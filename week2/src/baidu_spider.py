@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import urllib.request
 import json
 import os
 import ssl
+import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 from mysql_helper import MySqlHelper
+from query_cache import shared_cache
+from http_client import HttpClient
+from http_cache import HttpCache
+from page_archive import PageArchive, archived_time
 
 # 加载.env文件
 load_dotenv()
@@ -21,11 +25,52 @@ DB_CONFIG = {
     'database': os.getenv('DB_NAME', 'student_management')
 }
 
+# 接口缓存配置，HTTP_CACHE_DIR为空时不使用缓存
+CACHE_CONFIG = {
+    'cache_dir': os.getenv('HTTP_CACHE_DIR', '.http_cache'),
+    'max_bytes': int(os.getenv('HTTP_CACHE_MAX_BYTES', 20 * 1024 * 1024)),
+    'max_age': int(os.getenv('HTTP_CACHE_MAX_AGE', 7 * 24 * 3600)),
+    'cache_only': os.getenv('HTTP_CACHE_ONLY', '0') == '1'
+}
+
+# 原始响应归档目录，PAGE_ARCHIVE_DIR为空时不归档
+ARCHIVE_CONFIG = {
+    'archive_dir': os.getenv('PAGE_ARCHIVE_DIR', '')
+}
+
+HOT_SEARCH_URL = 'https://top.baidu.com/api/board?platform=wise&tab=realtime'
+
+# upsert时参与内容哈希比较、需要更新的列
+HOT_SEARCH_CONTENT_COLUMNS = ['rank_num', 'url', 'hot_value']
+
+
+def parse_hot_search(data):
+    """从接口返回的JSON里取出热搜列表"""
+    hot_list = []
+    if 'data' in data and 'cards' in data['data']:
+        for card in data['data']['cards']:
+            if 'content' in card:
+                for item in card['content'][:10]:
+                    hot_list.append({
+                        'title': item.get('word', ''),
+                        'url': item.get('url', ''),
+                        'hot_value': str(item.get('hotScore', 0))
+                    })
+    return hot_list
+
+
+def parse_archived_hot_search(record):
+    """解析一条归档的接口响应，供归档回放在子进程里调用"""
+    return {
+        'timestamp': record['timestamp'],
+        'hot_list': parse_hot_search(json.loads(record['body'].decode('utf-8')))
+    }
+
 class BaiduSpider:
     """百度热搜爬虫"""
 
-    def __init__(self):
-        self.db = MySqlHelper(**DB_CONFIG)
+    def __init__(self, cache_only=False, archive_dir=None):
+        self.db = MySqlHelper(**DB_CONFIG, cache=shared_cache())
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
         }
@@ -33,83 +78,134 @@ class BaiduSpider:
         self.ssl_context = ssl.create_default_context()
         self.ssl_context.check_hostname = False
         self.ssl_context.verify_mode = ssl.CERT_NONE
+        # 接口响应缓存在磁盘上，再次抓取时发条件请求；cache_only时只用缓存重跑保存
+        cache_dir = CACHE_CONFIG['cache_dir']
+        cache = HttpCache(cache_dir, CACHE_CONFIG['max_bytes'], CACHE_CONFIG['max_age']) if cache_dir else None
+        # 持久连接池，定时多次抓取时复用同一个TLS连接
+        self.http = HttpClient(headers=self.headers, ssl_context=self.ssl_context, cache=cache,
+                               cache_only=cache_only or CACHE_CONFIG['cache_only'])
+        # 从网络拿到的原始响应追加到压缩归档里，改进解析后可以离线回放历史数据
+        archive_dir = archive_dir or ARCHIVE_CONFIG['archive_dir']
+        self.archive = PageArchive(archive_dir, prefix='baidu') if archive_dir else None
+        # 最近一次抓取是否返回304(数据未变化)
+        self.not_modified = False
 
     def fetch_hot_search(self):
         """获取热搜数据"""
+        # 抓取失败时不能沿用上一次的结果
+        self.not_modified = False
         try:
-            url = 'https://top.baidu.com/api/board?platform=wise&tab=realtime'
-            req = urllib.request.Request(url, headers=self.headers)
-
-            # 使用自定义SSL上下文
-            with urllib.request.urlopen(req, timeout=10, context=self.ssl_context) as response:
-                data = json.loads(response.read().decode('utf-8'))
-
-            hot_list = []
-            if 'data' in data and 'cards' in data['data']:
-                for card in data['data']['cards']:
-                    if 'content' in card:
-                        for item in card['content'][:10]:
-                            hot_list.append({
-                                'title': item.get('word', ''),
-                                'url': item.get('url', ''),
-                                'hot_value': str(item.get('hotScore', 0))
-                            })
-            return hot_list
+            response = self.http.get(HOT_SEARCH_URL)
+            # 缓存里的响应上次已经归档过
+            if self.archive and not response.from_cache:
+                self.archive.append(HOT_SEARCH_URL, response.status, response.headers, response.body)
+            if response.status != 200:
+                raise Exception(f"HTTP {response.status}")
+            self.not_modified = response.not_modified
+            return parse_hot_search(response.json())
 
         except Exception as e:
             print(f"爬取失败: {e}")
             return []
 
-    def save_data(self, hot_list):
-        """保存数据"""
+    def save_data(self, hot_list, crawl_time=None):
+        """保存数据，crawl_time为空时按当前时间保存，回放归档时传入归档的时间"""
         if not hot_list:
             return
 
         try:
-            # 清除今日数据
-            today = datetime.now().strftime('%Y-%m-%d')
-            self.db.execute(
-                "DELETE FROM baidu_hot_search WHERE DATE(created_time) = %s",
-                (today,)
-            )
-
-            # 批量插入
-            current_time = datetime.now()
-            for i, item in enumerate(hot_list, 1):
-                self.db.insert('baidu_hot_search', {
-                    'rank_num': i,
-                    'title': item['title'],
-                    'url': item['url'],
-                    'hot_value': item['hot_value'],
-                    'source': 'baidu',
-                    'crawl_time': current_time,
-                    'created_time': current_time
-                })
-
-            print(f"保存成功: {len(hot_list)} 条数据")
+            current_time = crawl_time or datetime.now()
+            today = current_time.date()
+            rows = [{
+                'rank_num': i,
+                'title': item['title'],
+                'url': item['url'],
+                'hot_value': item['hot_value'],
+                'source': 'baidu',
+                'crawl_date': today,
+                'crawl_time': current_time,
+                'created_time': current_time
+            } for i, item in enumerate(hot_list, 1)]
+            titles = [item['title'] for item in hot_list]
+            placeholders = ', '.join(['%s'] * len(titles))
+            # 写入和清理在同一个事务里，中途失败时不会留下新旧榜单混在一起的数据
+            with self.db.transaction():
+                # 按(crawl_date, title)增量更新，排名和热度没变的行不会被改写
+                result = self.db.upsert_many('baidu_hot_search', rows, HOT_SEARCH_CONTENT_COLUMNS)
+                # 清除今天已经掉出榜单的旧数据
+                self.db.execute(
+                    f"DELETE FROM baidu_hot_search WHERE crawl_date = %s AND title NOT IN ({placeholders})",
+                    (today, *titles)
+                )
+            for failed in result['failed']:
+                print(f"保存 {failed['row']['title']} 失败: {failed['error']}")
+
+            print(f"保存成功: {result['written']}/{len(hot_list)} 条数据，实际变更 {result['affected']} 行")
 
         except Exception as e:
             print(f"保存失败: {e}")
 
+    def saved_today(self):
+        """今天的榜单是否已经保存过"""
+        try:
+            return bool(self.db.fetch_one(
+                "SELECT 1 as saved FROM baidu_hot_search WHERE crawl_date = %s LIMIT 1", (datetime.now().date(),)))
+        except Exception as e:
+            print(f"查询今天的数据失败: {e}")
+            return False
+
     def run(self):
         """执行爬取"""
         print("开始爬取百度热搜...")
         hot_list = self.fetch_hot_search()
 
-        if hot_list:
+        # 数据按crawl_date分天保存，304只说明榜单和上次一样，新的一天还没有行时照样保存
+        if self.not_modified and hot_list and self.saved_today():
+            print("热搜数据未变化，跳过保存")
+        elif hot_list:
             self.save_data(hot_list)
+            print(f"HTTP连接统计: {self.http.stats()}")
             print("爬取完成")
         else:
             print("未获取到数据")
 
+    def replay(self, since=None, until=None, workers=2):
+        """回放归档的接口响应：每天取最后一次抓取的结果，按当天的日期重新保存
+
+        since/until为YYYYMMDD格式的日期，解析在进程池里进行，每个子进程用mmap按偏移读取归档记录
+        """
+        if not self.archive:
+            raise ValueError("没有配置归档目录(PAGE_ARCHIVE_DIR)")
+        entries = self.archive.entries(since, until, url_prefix=HOT_SEARCH_URL)
+        # 每天的榜单以当天最后一次抓取为准
+        entries = PageArchive.latest(entries, key=lambda entry: archived_time(entry['timestamp']).date())
+        print(f"开始回放归档数据: {len(entries)} 天")
+
+        for result in self.archive.replay(entries, parse_archived_hot_search, workers=workers):
+            crawl_time = archived_time(result['timestamp'])
+            print(f"回放 {crawl_time:%Y-%m-%d %H:%M:%S}: {len(result['hot_list'])} 条热搜")
+            self.save_data(result['hot_list'], crawl_time)
+        print("回放完成")
+
     def close(self):
         """关闭连接"""
+        self.http.close()
         if self.db:
             self.db.close()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='百度热搜爬虫')
+    parser.add_argument('--replay', action='store_true', help='不发请求，回放归档的接口响应并按当天日期保存')
+    parser.add_argument('--since', help='回放的起始日期，YYYYMMDD')
+    parser.add_argument('--until', help='回放的结束日期，YYYYMMDD')
+    parser.add_argument('--workers', type=int, default=2, help='回放时的解析进程数')
+    args = parser.parse_args()
+
     spider = BaiduSpider()
     try:
-        spider.run()
+        if args.replay:
+            spider.replay(args.since, args.until, args.workers)
+        else:
+            spider.run()
     finally:
         spider.close()
\ No newline at end of file
@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import hashlib
+from contextlib import contextmanager
 import mysql.connector
 from mysql.connector import Error
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Union, Iterable
+from query_cache import QueryCache, sql_tables, ALL_TABLES
 
 
 class MySqlHelper:
     """MySQL数据库操作工具类"""
     
-    def __init__(self, host='localhost', port=3306, user='root', password='', database=''):
-        """初始化数据库连接"""
+    def __init__(self, host='localhost', port=3306, user='root', password='', database='',
+                 cache: Optional[QueryCache] = None):
+        """初始化数据库连接，传入cache时缓存fetch_one/fetch_all的结果，经过本类的写操作让缓存失效"""
         self.config = {
             'host': host,
             'port': port,
@@ -22,6 +26,11 @@ class MySqlHelper:
         }
         self.connection = None
         self.cursor = None
+        # 在transaction()块内时为True，块内的写操作由外层事务统一提交
+        self._in_transaction = False
+        self.cache = cache
+        # 事务内写过的表，事务结束后才让缓存失效，否则别的进程可能在提交前又缓存了旧数据
+        self._written_tables = set()
         self.connect()
     
     def connect(self):
@@ -36,28 +45,108 @@ class MySqlHelper:
         """执行SQL语句，返回影响行数"""
         try:
             self.cursor.execute(sql, params or ())
-            self.connection.commit()
+            if not self._in_transaction:
+                self.connection.commit()
+            self._written(sql_tables(sql) or (ALL_TABLES,))
             return self.cursor.rowcount
         except Error as e:
+            if not self._in_transaction:
+                self.connection.rollback()
+            raise
+    
+    @contextmanager
+    def transaction(self):
+        """把块内的所有写操作放进一个事务，正常结束时提交，抛出异常时整体回滚"""
+        if self._in_transaction:
+            raise RuntimeError("不支持嵌套事务")
+        self.connection.start_transaction()
+        self._in_transaction = True
+        try:
+            yield self
+            self.connection.commit()
+        except BaseException:
             self.connection.rollback()
             raise
+        finally:
+            self._in_transaction = False
+            # 回滚时也作废一次，多失效一次不影响正确性
+            tables, self._written_tables = self._written_tables, set()
+            self._written(tables)
+    
+    def _written(self, tables: Iterable[str]):
+        """记录写过的表：事务外立即让相关缓存失效，事务内等事务结束"""
+        if self.cache is None:
+            return
+        if self._in_transaction:
+            self._written_tables.update(tables)
+        else:
+            self.cache.invalidate(tables)
+    
+    def _cached(self, sql: str, params: Optional[Tuple], load):
+        """有缓存且不在事务里时从缓存读，事务内要看到自己未提交的写入，直接查"""
+        if self.cache is None or self._in_transaction:
+            return load()
+        return self.cache.get_or_load(sql, params, load)
+    
+    def _begin(self):
+        """开始一批写入，在transaction()块内时不单独开事务"""
+        if not self._in_transaction:
+            self.connection.start_transaction()
+    
+    def _commit(self):
+        """提交一批写入，在transaction()块内时留给外层提交"""
+        if not self._in_transaction:
+            self.connection.commit()
+    
+    def _rollback(self, error: Error):
+        """回滚一批写入；在transaction()块内时失败的语句已被MySQL单独撤销，
+        只有整个事务都被回滚(如死锁)时才把错误抛给外层"""
+        if not self._in_transaction:
+            self.connection.rollback()
+        elif not self.connection.in_transaction:
+            raise error
     
     def fetch_one(self, sql: str, params: Optional[Tuple] = None) -> Optional[Dict[str, Any]]:
         """查询单条记录"""
-        try:
+        def load():
             self.cursor.execute(sql, params or ())
             return self.cursor.fetchone()
+        try:
+            return self._cached(sql, params, load)
         except Error as e:
             raise
     
     def fetch_all(self, sql: str, params: Optional[Tuple] = None) -> List[Dict[str, Any]]:
         """查询多条记录"""
-        try:
+        def load():
             self.cursor.execute(sql, params or ())
             return self.cursor.fetchall()
+        try:
+            return self._cached(sql, params, load)
         except Error as e:
             raise
     
+    def fetch_iter(self, sql: str, params: Optional[Tuple] = None, chunk_size: int = 1000,
+                   as_dict: bool = True) -> Iterator[Union[Dict[str, Any], Tuple]]:
+        """流式查询，非缓冲游标按块拉取，as_dict=False时直接返回元组行"""
+        # 非缓冲游标在读完之前会占住连接，所以单独建一个连接
+        connection = mysql.connector.connect(**self.config)
+        cursor = connection.cursor(buffered=False, dictionary=as_dict)
+        try:
+            cursor.execute(sql, params or ())
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            # 调用方提前停止时结果集还没读完，直接断开连接让服务端丢弃剩余数据
+            try:
+                cursor.close()
+            except Error:
+                pass
+            connection.close()
+    
     def insert(self, table: str, data: Dict[str, Any]) -> int:
         """插入单条记录，返回插入ID"""
         columns = ', '.join(data.keys())
@@ -66,6 +155,134 @@ class MySqlHelper:
         self.execute(sql, tuple(data.values()))
         return self.cursor.lastrowid
     
+    def insert_many(self, table: str, rows: List[Dict[str, Any]], batch_size: int = 500) -> Dict[str, Any]:
+        """批量插入记录，每批拼成一条多行INSERT并在一个事务中提交，返回插入行数和失败行"""
+        result = self._write_batches(table, rows, batch_size)
+        return {'inserted': result['written'], 'failed': result['failed']}
+    
+    def insert_rows(self, table: str, columns: List[str], rows: List[Tuple], batch_size: int = 500) -> Dict[str, Any]:
+        """和insert_many一样，但每行直接是按columns顺序排好的参数元组，省掉字典的构造和拆解"""
+        result = self._write_rows(table, columns, rows, batch_size)
+        return {'inserted': result['written'], 'failed': result['failed']}
+    
+    def upsert_many(self, table: str, rows: List[Dict[str, Any]], update_columns: List[str],
+                    hash_column: Optional[str] = 'content_hash', batch_size: int = 500) -> Dict[str, Any]:
+        """批量插入或更新(INSERT ... ON DUPLICATE KEY UPDATE)，有hash_column时只更新内容变化的行"""
+        if not rows:
+            return {'written': 0, 'affected': 0, 'failed': []}
+        columns = list(rows[0].keys())
+        return self.upsert_rows(table, columns, [tuple(row[column] for column in columns) for row in rows],
+                                update_columns, hash_column, batch_size)
+    
+    def upsert_rows(self, table: str, columns: List[str], rows: List[Tuple], update_columns: List[str],
+                    hash_column: Optional[str] = 'content_hash', batch_size: int = 500) -> Dict[str, Any]:
+        """和upsert_many一样，但每行直接是按columns顺序排好的参数元组"""
+        if hash_column:
+            positions = [columns.index(column) for column in update_columns]
+            rows = [row + (self._hash_values(row[i] for i in positions),) for row in rows]
+            columns = columns + [hash_column]
+            # 内容哈希相同则保持原值不动，哈希列必须放在最后赋值，否则前面的比较会看到新值
+            assignments = [f"{column} = IF({hash_column} <=> VALUES({hash_column}), {column}, VALUES({column}))"
+                           for column in update_columns]
+            assignments.append(f"{hash_column} = VALUES({hash_column})")
+        else:
+            assignments = [f"{column} = VALUES({column})" for column in update_columns]
+        suffix = " ON DUPLICATE KEY UPDATE " + ', '.join(assignments)
+        return self._write_rows(table, columns, rows, batch_size, suffix)
+    
+    @staticmethod
+    def content_hash(row: Dict[str, Any], columns: List[str]) -> str:
+        """计算指定列的内容哈希"""
+        return MySqlHelper._hash_values(row[column] for column in columns)
+    
+    @staticmethod
+    def _hash_values(values) -> str:
+        """按顺序拼接各列的值后计算md5"""
+        content = '\x1f'.join('' if value is None else str(value) for value in values)
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+    
+    def _write_batches(self, table: str, rows: List[Dict[str, Any]], batch_size: int, suffix: str = '') -> Dict[str, Any]:
+        """字典行转成参数元组后按批写入"""
+        if not rows:
+            return {'written': 0, 'affected': 0, 'failed': []}
+        columns = list(rows[0].keys())
+        return self._write_rows(table, columns, [tuple(row[column] for column in columns) for row in rows],
+                                batch_size, suffix)
+    
+    def _write_rows(self, table: str, columns: List[str], rows: List[Tuple], batch_size: int,
+                    suffix: str = '') -> Dict[str, Any]:
+        """按批写入，每批一个事务，失败的批次逐行重试以定位失败行"""
+        result = {'written': 0, 'affected': 0, 'failed': []}
+        if not rows:
+            return result
+
+        column_sql = ', '.join(columns)
+        row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        single_sql = f"INSERT INTO {table} ({column_sql}) VALUES {row_placeholder}{suffix}"
+
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            sql = f"INSERT INTO {table} ({column_sql}) VALUES " + ', '.join([row_placeholder] * len(batch)) + suffix
+            params = tuple(value for row in batch for value in row)
+            try:
+                self._begin()
+                self.cursor.execute(sql, params)
+                self._commit()
+                result['written'] += len(batch)
+                result['affected'] += self.cursor.rowcount
+            except Error as e:
+                self._rollback(e)
+                # 整批回滚后逐行重试，找出具体是哪些行失败
+                for index, row in enumerate(batch, offset):
+                    try:
+                        result['affected'] += self.execute(single_sql, tuple(row))
+                        result['written'] += 1
+                    except Error as row_error:
+                        result['failed'].append({'index': index, 'row': dict(zip(columns, row)),
+                                                 'error': str(row_error)})
+        if result['affected']:
+            self._written([table])
+        return result
+    
+    def update_many(self, table: str, rows: List[Dict[str, Any]], key_column: str,
+                    batch_size: int = 500) -> Dict[str, Any]:
+        """按key_column批量更新，每批拼成一条UPDATE ... JOIN派生表并在一个事务中提交"""
+        result = {'updated': 0, 'affected': 0, 'failed': []}
+        if not rows:
+            return result
+
+        columns = [column for column in rows[0].keys() if column != key_column]
+        set_sql = ', '.join(f"t.{column} = v.{column}" for column in columns)
+        # 派生表第一行带列名，后面的行只放占位符
+        first_select = 'SELECT ' + ', '.join(f"%s AS {column}" for column in [key_column] + columns)
+        other_select = 'SELECT ' + ', '.join(['%s'] * (len(columns) + 1))
+        single_sql = f"UPDATE {table} SET " + ', '.join(f"{column} = %s" for column in columns) + f" WHERE {key_column} = %s"
+
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            derived = ' UNION ALL '.join([first_select] + [other_select] * (len(batch) - 1))
+            sql = f"UPDATE {table} t JOIN ({derived}) v ON t.{key_column} = v.{key_column} SET {set_sql}"
+            params = tuple(row[column] for row in batch for column in [key_column] + columns)
+            try:
+                self._begin()
+                self.cursor.execute(sql, params)
+                self._commit()
+                result['updated'] += len(batch)
+                result['affected'] += self.cursor.rowcount
+            except Error as e:
+                self._rollback(e)
+                # 整批回滚后逐行重试，找出具体是哪些行失败
+                for index, row in enumerate(batch, offset):
+                    try:
+                        params = tuple(row[column] for column in columns) + (row[key_column],)
+                        result['affected'] += self.execute(single_sql, params)
+                        result['updated'] += 1
+                    except Error as row_error:
+                        result['failed'].append({'index': index, 'row': row, 'error': str(row_error)})
+        if result['affected']:
+            self._written([table])
+        return result
+    
     def update(self, table: str, data: Dict[str, Any], where: str, where_params: Optional[Tuple] = None) -> int:
         """更新记录，返回影响行数"""
         set_clause = ', '.join([f"{k} = %s" for k in data.keys()])
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import glob
+import gzip
+import hashlib
+import mmap
+import os
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from http import HTTPStatus
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# 归档时丢掉的响应头：响应体已经解压，原来的长度和编码不再对应
+DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+# 索引文件的列，每条记录一行，用制表符分隔
+INDEX_FIELDS = ('timestamp', 'url', 'status', 'offset', 'length', 'sha1')
+
+
+def archived_time(timestamp: str) -> datetime:
+    """把索引里的UTC时间戳转成本地时间(不带时区，和数据库里的时间一致)"""
+    return datetime.strptime(timestamp, '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def _parse_index_line(segment: str, line: str) -> Dict[str, Any]:
+    """把索引文件的一行转成记录信息"""
+    timestamp, url, status, offset, length, sha1 = line.rstrip('\n').split('\t')
+    return {
+        'segment': segment,
+        'timestamp': timestamp,
+        'url': url,
+        'status': int(status),
+        'offset': int(offset),
+        'length': int(length),
+        'sha1': sha1
+    }
+
+
+def parse_record(data: bytes) -> Dict[str, Any]:
+    """解析一条解压后的WARC记录，返回WARC头、HTTP状态码、HTTP头和响应体"""
+    warc_head, _, rest = data.partition(b'\r\n\r\n')
+    warc_headers = dict(line.split(': ', 1) for line in warc_head.decode('utf-8').split('\r\n')[1:])
+    block = rest[:int(warc_headers['Content-Length'])]
+    http_head, _, body = block.partition(b'\r\n\r\n')
+    http_lines = http_head.decode('utf-8', 'replace').split('\r\n')
+    return {
+        'url': warc_headers['WARC-Target-URI'],
+        'date': warc_headers['WARC-Date'],
+        'status': int(http_lines[0].split(' ')[1]),
+        'headers': dict(line.split(': ', 1) for line in http_lines[1:] if ': ' in line),
+        'body': body
+    }
+
+
+def _replay_chunk(segment: str, entries: List[Dict[str, Any]], handler: Callable[[Dict[str, Any]], Any]) -> List[Any]:
+    """在子进程里用mmap读出一组记录并交给handler处理"""
+    results = []
+    with open(segment, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for entry in entries:
+            # 每条记录是一个独立的gzip成员，按偏移切出来单独解压，不用从头读整个文件
+            record = parse_record(gzip.decompress(mm[entry['offset']:entry['offset'] + entry['length']]))
+            record['timestamp'] = entry['timestamp']
+            results.append(handler(record))
+    return results
+
+
+class PageArchive:
+    """只追加的压缩页面归档，格式参照WARC
+
+    每天一个分段文件 <prefix>-YYYYMMDD.warc.gz，每条记录单独压缩成一个gzip成员后追加到末尾，
+    同名的 .idx 文件记录每条记录的时间、URL、状态码、偏移和长度，回放时按偏移直接读取。
+    """
+
+    def __init__(self, root: str, prefix: str = 'pages'):
+        self.root = root
+        self.prefix = prefix
+        os.makedirs(root, exist_ok=True)
+        # 多个抓取线程共用一个实例，追加时加锁保证记录和索引一一对应
+        self._lock = threading.Lock()
+
+    def _segment_path(self, day: str) -> str:
+        """某一天的分段文件路径"""
+        return os.path.join(self.root, f'{self.prefix}-{day}.warc.gz')
+
+    def append(self, url: str, status: int, headers: Any, body: bytes) -> Dict[str, Any]:
+        """追加一条响应记录，返回它在索引中的信息"""
+        now = datetime.now(timezone.utc)
+        header_lines = [f"{name}: {value}" for name, value in (headers.items() if headers else [])
+                        if name.lower() not in DROPPED_HEADERS]
+        reason = HTTPStatus(status).phrase if status in HTTPStatus._value2member_map_ else ''
+        http_block = ('\r\n'.join([f"HTTP/1.1 {status} {reason}".rstrip()] + header_lines) + '\r\n\r\n').encode('utf-8') + body
+        warc_head = '\r\n'.join([
+            'WARC/1.1',
+            'WARC-Type: response',
+            f'WARC-Target-URI: {url}',
+            f'WARC-Date: {now.strftime("%Y-%m-%dT%H:%M:%SZ")}',
+            f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>',
+            'Content-Type: application/http;msgtype=response',
+            f'Content-Length: {len(http_block)}'
+        ]) + '\r\n\r\n'
+        record = gzip.compress(warc_head.encode('utf-8') + http_block + b'\r\n\r\n')
+
+        segment = self._segment_path(now.strftime('%Y%m%d'))
+        with self._lock:
+            with open(segment, 'ab') as f:
+                offset = f.tell()
+                f.write(record)
+            entry = {
+                'segment': segment,
+                'timestamp': now.strftime('%Y%m%d%H%M%S'),
+                'url': url,
+                'status': status,
+                'offset': offset,
+                'length': len(record),
+                'sha1': hashlib.sha1(body).hexdigest()
+            }
+            # 先写记录再写索引，中途崩溃最多留下一条没有索引的记录，不会出现指向空数据的索引
+            with open(segment[:-len('.warc.gz')] + '.idx', 'a', encoding='utf-8') as f:
+                f.write('\t'.join(str(entry[field]) for field in INDEX_FIELDS) + '\n')
+        return entry
+
+    def entries(self, since: Optional[str] = None, until: Optional[str] = None,
+                url_prefix: Optional[str] = None, status: Optional[int] = 200) -> List[Dict[str, Any]]:
+        """按时间顺序列出归档记录，since/until为YYYYMMDD格式的日期(包含)，status为None时不按状态过滤"""
+        result = []
+        for index_path in sorted(glob.glob(os.path.join(self.root, f'{self.prefix}-*.idx'))):
+            day = index_path[-len('YYYYMMDD.idx'):-len('.idx')]
+            if (since and day < since) or (until and day > until):
+                continue
+            segment = index_path[:-len('.idx')] + '.warc.gz'
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = _parse_index_line(segment, line)
+                    if url_prefix and not entry['url'].startswith(url_prefix):
+                        continue
+                    if status is not None and entry['status'] != status:
+                        continue
+                    result.append(entry)
+        result.sort(key=lambda entry: entry['timestamp'])
+        return result
+
+    @staticmethod
+    def latest(entries: List[Dict[str, Any]], key: Callable[[Dict[str, Any]], Any] = None) -> List[Dict[str, Any]]:
+        """每个key(默认URL)只保留最新的一条，结果仍按时间顺序"""
+        key = key or (lambda entry: entry['url'])
+        latest = {}
+        for entry in entries:
+            latest[key(entry)] = entry
+        return sorted(latest.values(), key=lambda entry: entry['timestamp'])
+
+    def read(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """读取单条记录"""
+        return _replay_chunk(entry['segment'], [entry], lambda record: record)[0]
+
+    def replay(self, entries: List[Dict[str, Any]], handler: Callable[[Dict[str, Any]], Any],
+               workers: int = 0, chunk_size: int = 16) -> Iterator[Any]:
+        """按entries的顺序把记录交给handler处理并依次产出结果
+
+        workers大于0时分块交给进程池并行处理，handler必须是模块级函数才能传给子进程
+        """
+        # 同一个分段里相邻的记录分成一块，每块在子进程里只打开一次mmap
+        chunks = []
+        for entry in entries:
+            if chunks and chunks[-1][0] == entry['segment'] and len(chunks[-1][1]) < chunk_size:
+                chunks[-1][1].append(entry)
+            else:
+                chunks.append((entry['segment'], [entry]))
+
+        if workers <= 0:
+            for segment, chunk in chunks:
+                yield from _replay_chunk(segment, chunk, handler)
+            return
+
+        # 最多提前提交两倍进程数的块，调用方消费慢时结果不会全部堆在内存里
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = iter(chunks)
+            pending = deque(executor.submit(_replay_chunk, segment, chunk, handler)
+                            for segment, chunk in islice(chunks, workers * 2))
+            while pending:
+                results = pending.popleft().result()
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    pending.append(executor.submit(_replay_chunk, next_chunk[0], next_chunk[1], handler))
+                yield from results
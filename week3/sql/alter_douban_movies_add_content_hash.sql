@@ -0,0 +1,5 @@
+-- 为已有的douban_movies表增加内容哈希列，支持增量upsert
+USE student_management;
+
+ALTER TABLE douban_movies
+    ADD COLUMN content_hash CHAR(32) COMMENT '内容哈希，用于增量更新' AFTER douban_url;
@@ -0,0 +1,13 @@
+-- 为已有的douban_movies表增加详情页补充的列，detail_crawled_at为空的行由detail_crawler.py抓取
+USE student_management;
+
+ALTER TABLE douban_movies
+    ADD COLUMN full_cast TEXT COMMENT '完整演员表(详情页)' AFTER content_hash,
+    ADD COLUMN writers VARCHAR(1000) COMMENT '编剧(详情页)' AFTER full_cast,
+    ADD COLUMN release_date VARCHAR(500) COMMENT '上映日期(详情页)' AFTER writers,
+    ADD COLUMN languages VARCHAR(500) COMMENT '语言(详情页)' AFTER release_date,
+    ADD COLUMN tags VARCHAR(1000) COMMENT '豆瓣标签(详情页)' AFTER languages,
+    ADD COLUMN runtime_minutes INT COMMENT '片长分钟数(详情页)' AFTER tags,
+    ADD COLUMN imdb_id VARCHAR(20) COMMENT 'IMDb编号(详情页)' AFTER runtime_minutes,
+    ADD COLUMN detail_crawled_at DATETIME COMMENT '详情页抓取时间，为空表示还没抓' AFTER imdb_id,
+    ADD INDEX idx_detail_crawled (detail_crawled_at);
@@ -0,0 +1,9 @@
+-- 为已有的douban_movies表增加详情页抓取结果：条目已删除(404/410)或解析失败的电影也设置detail_crawled_at，
+-- detail_crawler.py不再反复重抓；需要重抓时执行
+-- UPDATE douban_movies SET detail_crawled_at = NULL WHERE detail_status <> 'ok';
+USE student_management;
+
+ALTER TABLE douban_movies
+    ADD COLUMN detail_status VARCHAR(20) COMMENT '详情页抓取结果: ok、http_404、http_410、parse_error' AFTER imdb_id;
+
+UPDATE douban_movies SET detail_status = 'ok' WHERE detail_crawled_at IS NOT NULL;
@@ -0,0 +1,7 @@
+-- 为已有的douban_movies表增加本地海报记录，poster_downloader.py据此跳过没变化的海报
+USE student_management;
+
+ALTER TABLE douban_movies
+    ADD COLUMN poster_sha256 CHAR(64) COMMENT '本地海报文件的SHA-256' AFTER detail_crawled_at,
+    ADD COLUMN poster_source_url VARCHAR(1000) COMMENT '下载本地海报时的海报链接' AFTER poster_sha256,
+    ADD COLUMN poster_downloaded_at DATETIME COMMENT '海报下载时间' AFTER poster_source_url;
@@ -0,0 +1,5 @@
+-- 为douban_movies的更新时间加索引，week5接口用MAX(updated_time)判断数据版本
+USE student_management;
+
+ALTER TABLE douban_movies
+    ADD INDEX idx_updated_time (updated_time);
@@ -0,0 +1,145 @@
+-- 规范化douban_movies：增加整数年份和片长列，国家、类型、导演和主演拆进查找表和关联表(需要MySQL 8.0)
+-- 原来的字符串列保留，过渡期间爬虫两种结构都写(MOVIE_WRITE_RELATIONS=1)，查询都切换后再删
+USE student_management;
+
+ALTER TABLE douban_movies
+    ADD COLUMN release_year SMALLINT COMMENT '上映年份(整数)' AFTER year,
+    ADD COLUMN duration_min SMALLINT COMMENT '片长分钟数' AFTER duration,
+    ADD INDEX idx_release_year_rating (release_year, rating);
+
+UPDATE douban_movies SET release_year = CAST(year AS UNSIGNED) WHERE year REGEXP '^[0-9]{4}$';
+UPDATE douban_movies SET duration_min = CAST(REGEXP_SUBSTR(duration, '[0-9]+(?=\\s*分钟)') AS UNSIGNED)
+WHERE duration REGEXP '[0-9]+\\s*分钟';
+
+CREATE TABLE IF NOT EXISTS country (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(50) COLLATE utf8mb4_bin NOT NULL COMMENT '国家/地区',
+    country_group VARCHAR(20) NOT NULL COMMENT '看板上的国家分组',
+
+    UNIQUE KEY uk_name (name),
+    INDEX idx_group (country_group)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='国家/地区';
+
+CREATE TABLE IF NOT EXISTS genre (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(50) COLLATE utf8mb4_bin NOT NULL COMMENT '类型',
+
+    UNIQUE KEY uk_name (name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='电影类型';
+
+CREATE TABLE IF NOT EXISTS person (
+    id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) COLLATE utf8mb4_bin NOT NULL COMMENT '姓名',
+
+    UNIQUE KEY uk_name (name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='导演和演员';
+
+CREATE TABLE IF NOT EXISTS movie_country (
+    movie_id INT NOT NULL,
+    country_id SMALLINT UNSIGNED NOT NULL,
+    position TINYINT UNSIGNED NOT NULL COMMENT '在原字段中的顺序',
+
+    PRIMARY KEY (movie_id, country_id),
+    INDEX idx_country_movie (country_id, movie_id),
+    FOREIGN KEY (movie_id) REFERENCES douban_movies (id) ON DELETE CASCADE,
+    FOREIGN KEY (country_id) REFERENCES country (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='电影-国家';
+
+CREATE TABLE IF NOT EXISTS movie_genre (
+    movie_id INT NOT NULL,
+    genre_id SMALLINT UNSIGNED NOT NULL,
+    position TINYINT UNSIGNED NOT NULL COMMENT '在原字段中的顺序',
+
+    PRIMARY KEY (movie_id, genre_id),
+    INDEX idx_genre_movie (genre_id, movie_id),
+    FOREIGN KEY (movie_id) REFERENCES douban_movies (id) ON DELETE CASCADE,
+    FOREIGN KEY (genre_id) REFERENCES genre (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='电影-类型';
+
+CREATE TABLE IF NOT EXISTS movie_person (
+    movie_id INT NOT NULL,
+    role ENUM('director', 'actor') NOT NULL COMMENT '导演或主演',
+    person_id INT UNSIGNED NOT NULL,
+    position TINYINT UNSIGNED NOT NULL COMMENT '在原字段中的顺序',
+
+    PRIMARY KEY (movie_id, role, person_id),
+    INDEX idx_person_role_movie (person_id, role, movie_id),
+    FOREIGN KEY (movie_id) REFERENCES douban_movies (id) ON DELETE CASCADE,
+    FOREIGN KEY (person_id) REFERENCES person (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='电影-导演/主演';
+
+-- 把已有的字符串字段拆成(电影, 种类, 顺序, 名称)，拆分规则和爬虫的movie_record.py一致：
+-- 国家按空格和/拆，类型按空格拆，导演和主演按/拆，空片段丢掉后重新编号
+CREATE TEMPORARY TABLE movie_parts (
+    movie_id INT NOT NULL,
+    kind ENUM('country', 'genre', 'director', 'actor') NOT NULL,
+    position SMALLINT UNSIGNED NOT NULL,
+    name VARCHAR(255) COLLATE utf8mb4_bin NOT NULL,
+
+    INDEX idx_kind_name (kind, name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO movie_parts (movie_id, kind, position, name)
+WITH RECURSIVE seq (n) AS (
+    SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < 100
+),
+source AS (
+    SELECT id, 'country' AS kind, ' ' AS sep, REPLACE(country, '/', ' ') AS value FROM douban_movies WHERE country <> ''
+    UNION ALL
+    SELECT id, 'genre', ' ', genre FROM douban_movies WHERE genre <> ''
+    UNION ALL
+    SELECT id, 'director', '/', director FROM douban_movies WHERE director <> ''
+    UNION ALL
+    SELECT id, 'actor', '/', actors FROM douban_movies WHERE actors <> ''
+),
+parts AS (
+    SELECT source.id, source.kind, seq.n,
+           TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(source.value, source.sep, seq.n), source.sep, -1)) AS name
+    FROM source
+    JOIN seq ON seq.n <= 1 + CHAR_LENGTH(source.value) - CHAR_LENGTH(REPLACE(source.value, source.sep, ''))
+)
+SELECT id, kind, ROW_NUMBER() OVER (PARTITION BY id, kind ORDER BY n) - 1, name
+FROM parts
+WHERE name <> '';
+
+-- 国家分组和country_group()的规则一致
+INSERT IGNORE INTO country (name, country_group)
+SELECT DISTINCT name,
+    CASE
+        WHEN name LIKE '%美国%' THEN '美国'
+        WHEN name LIKE '%中国%' OR name LIKE '%香港%' OR name LIKE '%台湾%' THEN '中国'
+        WHEN name LIKE '%日本%' THEN '日本'
+        WHEN name LIKE '%英国%' THEN '英国'
+        WHEN name LIKE '%法国%' THEN '法国'
+        WHEN name LIKE '%意大利%' THEN '意大利'
+        WHEN name LIKE '%德国%' THEN '德国'
+        ELSE '其他'
+    END
+FROM movie_parts WHERE kind = 'country';
+
+INSERT IGNORE INTO genre (name)
+SELECT DISTINCT name FROM movie_parts WHERE kind = 'genre';
+
+INSERT IGNORE INTO person (name)
+SELECT DISTINCT name FROM movie_parts WHERE kind IN ('director', 'actor');
+
+-- 同一部电影里重复的名称只保留第一次的顺序
+INSERT IGNORE INTO movie_country (movie_id, country_id, position)
+SELECT p.movie_id, c.id, p.position
+FROM movie_parts p JOIN country c ON c.name = p.name
+WHERE p.kind = 'country'
+ORDER BY p.movie_id, p.position;
+
+INSERT IGNORE INTO movie_genre (movie_id, genre_id, position)
+SELECT p.movie_id, g.id, p.position
+FROM movie_parts p JOIN genre g ON g.name = p.name
+WHERE p.kind = 'genre'
+ORDER BY p.movie_id, p.position;
+
+INSERT IGNORE INTO movie_person (movie_id, role, person_id, position)
+SELECT p.movie_id, p.kind, ps.id, p.position
+FROM movie_parts p JOIN person ps ON ps.name = p.name
+WHERE p.kind IN ('director', 'actor')
+ORDER BY p.movie_id, p.kind, p.position;
+
+DROP TEMPORARY TABLE movie_parts;
@@ -1,7 +1,17 @@
 -- 豆瓣电影Top100数据表
 USE student_management;
 
+-- 关联表有指向douban_movies的外键，要先删
+DROP TABLE IF EXISTS movie_country;
+DROP TABLE IF EXISTS movie_genre;
+DROP TABLE IF EXISTS movie_person;
+DROP TABLE IF EXISTS country;
+DROP TABLE IF EXISTS genre;
+DROP TABLE IF EXISTS person;
 DROP TABLE IF EXISTS douban_movies;
+DROP TABLE IF EXISTS movie_stats_rating;
+DROP TABLE IF EXISTS movie_stats_decade;
+DROP TABLE IF EXISTS movie_stats_country;
 
 CREATE TABLE douban_movies (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -11,15 +21,30 @@ CREATE TABLE douban_movies (
     director VARCHAR(1000) COMMENT '导演',
     actors TEXT COMMENT '主演列表',
     year VARCHAR(10) COMMENT '上映年份',
+    release_year SMALLINT COMMENT '上映年份(整数)',
     country VARCHAR(500) COMMENT '制片国家/地区',
     genre VARCHAR(500) COMMENT '类型',
     rating DECIMAL(3,1) COMMENT '豆瓣评分',
     rating_count INT COMMENT '评分人数',
     duration VARCHAR(50) COMMENT '片长',
+    duration_min SMALLINT COMMENT '片长分钟数',
     poster_url VARCHAR(1000) COMMENT '海报链接',
     summary TEXT COMMENT '剧情简介',
     douban_id VARCHAR(50) COMMENT '豆瓣ID',
     douban_url VARCHAR(500) COMMENT '豆瓣链接',
+    content_hash CHAR(32) COMMENT '内容哈希，用于增量更新',
+    full_cast TEXT COMMENT '完整演员表(详情页)',
+    writers VARCHAR(1000) COMMENT '编剧(详情页)',
+    release_date VARCHAR(500) COMMENT '上映日期(详情页)',
+    languages VARCHAR(500) COMMENT '语言(详情页)',
+    tags VARCHAR(1000) COMMENT '豆瓣标签(详情页)',
+    runtime_minutes INT COMMENT '片长分钟数(详情页)',
+    imdb_id VARCHAR(20) COMMENT 'IMDb编号(详情页)',
+    detail_status VARCHAR(20) COMMENT '详情页抓取结果: ok、http_404、http_410、parse_error',
+    detail_crawled_at DATETIME COMMENT '详情页抓取时间，为空表示还没抓，抓取失败的也会设置',
+    poster_sha256 CHAR(64) COMMENT '本地海报文件的SHA-256',
+    poster_source_url VARCHAR(1000) COMMENT '下载本地海报时的海报链接',
+    poster_downloaded_at DATETIME COMMENT '海报下载时间',
     crawl_time DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '爬取时间',
     created_time DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     updated_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
@@ -27,7 +52,90 @@ CREATE TABLE douban_movies (
     UNIQUE KEY uk_douban_id (douban_id),
     INDEX idx_rank (rank_num),
     INDEX idx_year (year),
+    INDEX idx_release_year_rating (release_year, rating),
     INDEX idx_rating (rating),
     INDEX idx_genre (genre),
-    INDEX idx_country (country)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='豆瓣电影Top100数据表';
\ No newline at end of file
+    INDEX idx_country (country),
+    INDEX idx_detail_crawled (detail_crawled_at),
+    INDEX idx_updated_time (updated_time)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='豆瓣电影Top100数据表';
+
+-- 国家、类型和人员的查找表，名称区分大小写
+CREATE TABLE country (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(50) COLLATE utf8mb4_bin NOT NULL COMMENT '国家/地区',
+    country_group VARCHAR(20) NOT NULL COMMENT '看板上的国家分组',
+
+    UNIQUE KEY uk_name (name),
+    INDEX idx_group (country_group)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='国家/地区';
+
+CREATE TABLE genre (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(50) COLLATE utf8mb4_bin NOT NULL COMMENT '类型',
+
+    UNIQUE KEY uk_name (name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='电影类型';
+
+CREATE TABLE person (
+    id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) COLLATE utf8mb4_bin NOT NULL COMMENT '姓名',
+
+    UNIQUE KEY uk_name (name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='导演和演员';
+
+-- 关联表：主键按电影查，反向索引按国家/类型/人员查，两个方向的统计都只读索引
+CREATE TABLE movie_country (
+    movie_id INT NOT NULL,
+    country_id SMALLINT UNSIGNED NOT NULL,
+    position TINYINT UNSIGNED NOT NULL COMMENT '在原字段中的顺序',
+
+    PRIMARY KEY (movie_id, country_id),
+    INDEX idx_country_movie (country_id, movie_id),
+    FOREIGN KEY (movie_id) REFERENCES douban_movies (id) ON DELETE CASCADE,
+    FOREIGN KEY (country_id) REFERENCES country (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='电影-国家';
+
+CREATE TABLE movie_genre (
+    movie_id INT NOT NULL,
+    genre_id SMALLINT UNSIGNED NOT NULL,
+    position TINYINT UNSIGNED NOT NULL COMMENT '在原字段中的顺序',
+
+    PRIMARY KEY (movie_id, genre_id),
+    INDEX idx_genre_movie (genre_id, movie_id),
+    FOREIGN KEY (movie_id) REFERENCES douban_movies (id) ON DELETE CASCADE,
+    FOREIGN KEY (genre_id) REFERENCES genre (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='电影-类型';
+
+CREATE TABLE movie_person (
+    movie_id INT NOT NULL,
+    role ENUM('director', 'actor') NOT NULL COMMENT '导演或主演',
+    person_id INT UNSIGNED NOT NULL,
+    position TINYINT UNSIGNED NOT NULL COMMENT '在原字段中的顺序',
+
+    PRIMARY KEY (movie_id, role, person_id),
+    INDEX idx_person_role_movie (person_id, role, movie_id),
+    FOREIGN KEY (movie_id) REFERENCES douban_movies (id) ON DELETE CASCADE,
+    FOREIGN KEY (person_id) REFERENCES person (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='电影-导演/主演';
+
+-- 看板用的汇总表，爬虫写电影时在同一个事务里增量维护(MOVIE_WRITE_STATS=1)，和create_movie_stats_tables.sql一致。
+-- 这里和douban_movies一起重建为空表；不经过爬虫导入或改动douban_movies后，
+-- 要执行 python douban_spider.py --rebuild-stats，否则week5的分布接口返回的是旧的计数
+CREATE TABLE movie_stats_rating (
+    bucket VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '评分分段',
+    movie_count INT NOT NULL DEFAULT 0 COMMENT '电影数',
+    updated_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='按评分分段的电影数';
+
+CREATE TABLE movie_stats_decade (
+    bucket VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '年代',
+    movie_count INT NOT NULL DEFAULT 0 COMMENT '电影数',
+    updated_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='按年代的电影数';
+
+CREATE TABLE movie_stats_country (
+    bucket VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '国家分组',
+    movie_count INT NOT NULL DEFAULT 0 COMMENT '电影数，合拍片只计入排在最前面的分组',
+    updated_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='按国家分组的电影数';
@@ -0,0 +1,27 @@
+-- 看板用的汇总表：爬虫写电影时在同一个事务里按变化的行增量维护
+-- 给已有数据的库补建汇总表用，新库执行create_douban_movies_table.sql时已经一起建好
+-- 建表后执行 python douban_spider.py --rebuild-stats 按已有数据初始化；
+-- 以后重建、恢复或不经过爬虫导入douban_movies后也要重新执行，否则week5的分布接口返回旧的计数
+USE student_management;
+
+DROP TABLE IF EXISTS movie_stats_rating;
+DROP TABLE IF EXISTS movie_stats_decade;
+DROP TABLE IF EXISTS movie_stats_country;
+
+CREATE TABLE movie_stats_rating (
+    bucket VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '评分分段',
+    movie_count INT NOT NULL DEFAULT 0 COMMENT '电影数',
+    updated_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='按评分分段的电影数';
+
+CREATE TABLE movie_stats_decade (
+    bucket VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '年代',
+    movie_count INT NOT NULL DEFAULT 0 COMMENT '电影数',
+    updated_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='按年代的电影数';
+
+CREATE TABLE movie_stats_country (
+    bucket VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '国家分组',
+    movie_count INT NOT NULL DEFAULT 0 COMMENT '电影数，合拍片只计入排在最前面的分组',
+    updated_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='按国家分组的电影数';
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""信息行分类基准：对比原来逐片段线性扫描词表和预编译分类器的耗时，并校验结果一致
+
+用法: python bench_classifier.py [--lines N]
+"""
+
+import argparse
+import random
+import time
+from movie_classifier import DEFAULT_CLASSIFIER, YEAR, DURATION, COUNTRY, GENRE
+
+EXTRA_PARTS = ['142分钟', '1890', '2050', '中国大陆 中国香港', '美国 英国', '剧情 爱情', '其他', 'TV Movie']
+
+
+def legacy_classify(part):
+    """原来_parse_movie_details_with_soup里的判断逻辑，作为对照"""
+    if len(part) == 4 and part.isdigit():
+        return YEAR if 1900 <= int(part) <= 2030 else None
+    elif '分钟' in part:
+        return DURATION
+    elif any(country in part for country in [
+        '中国大陆', '美国', '英国', '法国', '德国', '日本', '韩国',
+        '意大利', '西班牙', '加拿大', '澳大利亚', '中国香港', '中国台湾',
+        '俄罗斯', '印度', '瑞典', '丹麦', '挪威', '芬兰', '荷兰', '比利时'
+    ]):
+        return COUNTRY
+    elif any(genre in part for genre in [
+        '剧情', '喜剧', '动作', '爱情', '科幻', '悬疑', '惊悚', '恐怖',
+        '犯罪', '战争', '动画', '纪录片', '传记', '历史', '音乐', '家庭',
+        '冒险', '奇幻', '西部', '运动', '短片'
+    ]):
+        return GENRE
+    return None
+
+
+def legacy_tag_line(line):
+    return [(part, legacy_classify(part)) for part in (p.strip() for p in line.split('/')) if part]
+
+
+def synthetic_lines(count, rng):
+    """生成"1994 / 美国 / 犯罪 剧情"格式的信息行"""
+    countries = DEFAULT_CLASSIFIER.countries
+    genres = DEFAULT_CLASSIFIER.genres
+    lines = []
+    for _ in range(count):
+        parts = [str(rng.randint(1920, 2025)),
+                 ' '.join(rng.sample(countries, rng.randint(1, 3))),
+                 ' '.join(rng.sample(genres, rng.randint(1, 3)))]
+        if rng.random() < 0.3:
+            parts.append(rng.choice(EXTRA_PARTS))
+        lines.append('\xa0/\xa0'.join(parts))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比信息行分类的耗时')
+    parser.add_argument('--lines', type=int, default=20000, help='合成信息行的数量')
+    args = parser.parse_args()
+
+    lines = synthetic_lines(args.lines, random.Random(42))
+
+    for line in lines:
+        if DEFAULT_CLASSIFIER.tag_line(line) != legacy_tag_line(line):
+            raise SystemExit(f"分类结果不一致: {line}")
+    print(f"结果校验通过: {len(lines)} 行")
+
+    for name, tag_line in (('legacy', legacy_tag_line), ('compiled', DEFAULT_CLASSIFIER.tag_line)):
+        start = time.perf_counter()
+        for line in lines:
+            tag_line(line)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>8}: 总计 {elapsed * 1000:.1f} ms，每行 {elapsed / len(lines) * 1e6:.2f} us")
+
+
+if __name__ == '__main__':
+    main()
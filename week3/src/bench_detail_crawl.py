@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""详情页爬虫压测：在本地起一个返回合成详情页的测试服务，用不同并发跑DetailCrawler
+
+用法: python bench_detail_crawl.py [--movies N] [--concurrency 10,50,100] [--rate R] [--latency 秒]
+      python bench_detail_crawl.py --serve 8000   # 只启动测试服务，配合 detail_crawler.py --base-url 使用
+不连数据库(dry_run)，只统计抓取吞吐量和延迟
+"""
+
+import argparse
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from detail_crawler import DetailCrawler
+from detail_parser import parse_detail
+
+DETAIL_TEMPLATE = '''<html><head><meta charset="utf-8"><title>电影{douban_id} (豆瓣)</title></head><body>
+<div id="info">
+    <span ><span class='pl'>导演</span>: <span class='attrs'><a href="/celebrity/1{douban_id}/" rel="v:directedBy">导演{douban_id}</a></span></span><br/>
+    <span ><span class='pl'>编剧</span>: <span class='attrs'>{writers}</span></span><br/>
+    <span class="actor"><span class='pl'>主演</span>: <span class='attrs'>{cast}</span></span><br/>
+    <span class="pl">类型:</span> <span property="v:genre">剧情</span> / <span property="v:genre">犯罪</span><br/>
+    <span class="pl">制片国家/地区:</span> 美国<br/>
+    <span class="pl">语言:</span> {languages}<br/>
+    <span class="pl">上映日期:</span> <span property="v:initialReleaseDate" content="{year}-09-10(多伦多电影节)">{year}-09-10(多伦多电影节)</span> / <span property="v:initialReleaseDate" content="{year}-10-14(美国)">{year}-10-14(美国)</span><br/>
+    <span class="pl">片长:</span> <span property="v:runtime" content="{runtime}">{runtime}分钟</span><br/>
+    <span class="pl">又名:</span> 别名{douban_id}<br/>
+    <span class="pl">IMDb:</span> tt{imdb:07d}<br>
+</div>
+<div class="tags-body">{tags}</div>
+</body></html>'''
+
+LANGUAGES = ['英语', '汉语普通话', '粤语', '日语', '法语', '意大利语', '德语']
+TAGS = ['经典', '剧情', '人性', '美国', '励志', '犯罪', '文艺', '感人', '黑色幽默', '成长']
+SUBJECT_PATTERN = re.compile(r'^/subject/(\d+)/?$')
+
+
+def synthetic_detail(douban_id):
+    """按douban_id生成固定的详情页，同一个id每次内容相同"""
+    rng = random.Random(douban_id)
+    links = lambda prefix, n, rel: ' / '.join(
+        f'<a href="/celebrity/{prefix}{douban_id}{i}/"{rel}>{prefix}{douban_id}-{i}</a>' for i in range(n))
+    return DETAIL_TEMPLATE.format(
+        douban_id=douban_id,
+        writers=links('编剧', rng.randint(1, 3), ''),
+        cast=links('演员', rng.randint(5, 30), ' rel="v:starring"'),
+        languages=' / '.join(rng.sample(LANGUAGES, rng.randint(1, 3))),
+        year=rng.randint(1931, 2024),
+        runtime=rng.randint(80, 200),
+        imdb=rng.randint(100000, 9999999),
+        tags=''.join(f'<a href="/tag/{tag}" class="">{tag}</a> ' for tag in rng.sample(TAGS, 6))
+    ).encode('utf-8')
+
+
+def start_fixture_server(port=0, latency=0.05):
+    """在后台线程启动测试服务，每个请求模拟latency秒左右的服务端耗时，返回服务对象"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            match = SUBJECT_PATTERN.match(self.path)
+            if not match:
+                self.send_error(404)
+                return
+            time.sleep(random.uniform(latency * 0.5, latency * 1.5))
+            body = synthetic_detail(int(match.group(1)))
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # 默认的监听队列只有5，高并发时连接被丢弃，客户端要等1秒重传SYN，会把p99拉高
+        request_queue_size = 1024
+
+    server = Server(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用本地测试服务压测详情页爬虫')
+    parser.add_argument('--movies', type=int, default=500, help='抓取的详情页数')
+    parser.add_argument('--concurrency', default='10,50,100', help='逗号分隔的并发数，逐个测试')
+    parser.add_argument('--rate', type=float, default=1000.0, help='每秒请求数上限')
+    parser.add_argument('--latency', type=float, default=0.05, help='测试服务每个请求的平均耗时(秒)')
+    parser.add_argument('--parse-workers', type=int, default=2, help='解析进程数，0表示用线程解析')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='只启动测试服务并一直运行')
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        server = start_fixture_server(args.serve, args.latency)
+        print(f"测试服务已启动: http://127.0.0.1:{server.server_port}/subject/<douban_id>/ (Ctrl+C退出)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    # 先确认解析结果完整
+    detail = parse_detail(synthetic_detail(1292052))
+    missing = [key for key, value in detail.items() if value is None]
+    if missing:
+        raise SystemExit(f"合成详情页解析缺少字段: {missing}")
+
+    server = start_fixture_server(latency=args.latency)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    movies = [{'douban_id': str(1290000 + i), 'douban_url': None} for i in range(args.movies)]
+    results = []
+    try:
+        for concurrency in (int(value) for value in args.concurrency.split(',')):
+            crawler = DetailCrawler(concurrency=concurrency, rate=args.rate, burst=concurrency,
+                                    parse_workers=args.parse_workers, base_url=base_url, dry_run=True)
+            results.append((concurrency, crawler.run(movies)))
+    finally:
+        server.shutdown()
+
+    print(f"\n{args.movies} 个详情页，服务端平均耗时 {args.latency * 1000:.0f} ms")
+    for concurrency, stats in results:
+        print(f"并发 {concurrency:>4}: {stats['pages_per_sec']:>8.1f} 页/秒  "
+              f"p50 {stats['p50_ms']:>7.1f} ms  p99 {stats['p99_ms']:>7.1f} ms  解析 {stats['parsed']}/{stats['pages']}")
+
+
+if __name__ == '__main__':
+    main()
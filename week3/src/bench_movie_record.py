@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""电影记录微基准：对比字典列表、Movie列表和MovieBatch三种表示的内存占用、生成写库参数的速度和跨进程传递的大小
+
+用法: python bench_movie_record.py [--count N] [--rounds N]
+数据来自合成的Top250页面，重复到N部电影
+"""
+
+import argparse
+import pickle
+import random
+import time
+import tracemalloc
+from bench_parse import synthetic_page
+from movie_parser import get_parser
+from movie_record import Movie, MovieBatch, MOVIE_COLUMNS
+
+
+def load_dicts(count):
+    """解析合成页面得到字典，重复到count部，每部的rank和id不同"""
+    rng = random.Random(42)
+    parser = get_parser('lxml')
+    base = [movie for start in range(0, 250, 25) for movie in parser.parse_movies(synthetic_page(start, rng))]
+    movies = []
+    for index in range(count):
+        movie = dict(base[index % len(base)])
+        movie['rank_num'] = index + 1
+        movie['douban_id'] = str(1290000 + index)
+        # 数据库里的字段都是独立的字符串，这里也复制一份，不让重复的电影共用同一个对象
+        for key in ('title', 'director', 'actors', 'country', 'genre', 'summary', 'douban_url', 'poster_url'):
+            movie[key] = ''.join(list(movie[key]))
+        if index % 10 == 0:
+            # 拆分后拼不回原文的写法，校验写库参数时要和原文一致
+            movie['duration'] = f"{100 + index % 60}分钟(中国大陆)"
+            movie['country'] = movie['country'].replace(' ', '/')
+            movie['year'] = movie['year'] + '(中国大陆)'
+        movies.append(movie)
+    return movies
+
+
+def measure(build):
+    """返回build()的结果和它占用的内存(字节)"""
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def dict_rows(movies):
+    """原来的写库方式：每部电影从字典里按列取值"""
+    return [tuple(movie[column] for column in MOVIE_COLUMNS) for movie in movies]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比电影记录的几种内存表示')
+    parser.add_argument('--count', type=int, default=100000, help='电影数')
+    parser.add_argument('--rounds', type=int, default=5, help='生成写库参数的重复次数')
+    args = parser.parse_args()
+
+    # 解析器产出的字典用完即丢，只比较各种表示最终留在内存里的大小
+    dicts, dict_size = measure(lambda: load_dicts(args.count))
+    records, record_size = measure(lambda: [Movie.from_dict(movie) for movie in load_dicts(args.count)])
+    batch, batch_size = measure(lambda: MovieBatch.from_dicts(load_dicts(args.count)))
+
+    if batch.rows() != dict_rows(dicts):
+        raise SystemExit("MovieBatch生成的写库参数与字典不一致")
+    print(f"结果校验通过: {len(batch)} 部电影，写库参数完全一致")
+
+    for name, size in (('字典', dict_size), ('Movie', record_size), ('MovieBatch', batch_size)):
+        print(f"{name:>10}: 内存 {size / 1024 / 1024:.1f} MiB，每部 {size / len(batch):.0f} 字节")
+
+    for name, data in (('字典', dicts), ('Movie', records), ('MovieBatch', batch)):
+        print(f"{name:>10}: pickle后 {len(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)) / 1024 / 1024:.1f} MiB")
+
+    for name, build in (('字典', lambda: dict_rows(dicts)), ('MovieBatch', batch.rows)):
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            build()
+        elapsed = (time.perf_counter() - start) / args.rounds
+        print(f"{name:>10}: 生成写库参数 {elapsed * 1000:.1f} ms，每秒 {len(batch) / elapsed:,.0f} 行")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""解析引擎微基准：对比soup和lxml两种引擎每页的解析耗时，并校验两者结果一致
+
+用法: python bench_parse.py [保存的页面.html ...] [--rounds N]
+不传页面文件时使用合成的Top250页面
+"""
+
+import argparse
+import random
+import time
+from movie_parser import get_parser, PARSERS
+
+# 比较结果时忽略的时间戳字段
+TIME_FIELDS = ('crawl_time', 'created_time', 'updated_time')
+
+ITEM_TEMPLATE = '''
+<li>
+    <div class="item">
+        <div class="pic">
+            <em class="">{rank}</em>
+            <a href="https://movie.douban.com/subject/{douban_id}/">
+                <img width="100" alt="{title}" src="https://img{img}.doubanio.com/view/photo/s_ratio_poster/public/p{douban_id}.webp" class="">
+            </a>
+        </div>
+        <div class="info">
+            <div class="hd">
+                <a href="https://movie.douban.com/subject/{douban_id}/" class="">
+                    <span class="title">{title}</span>
+                    {title_en}
+                    <span class="other">&nbsp;/&nbsp;别名{rank}</span>
+                </a>
+                <span class="playable">[可播放]</span>
+            </div>
+            <div class="bd">
+                <p class="">
+                    导演: {director}&nbsp;&nbsp;&nbsp;主演: {actors} /...<br>
+                    {year}&nbsp;/&nbsp;{country}&nbsp;/&nbsp;{genre}
+                </p>
+                <div class="star">
+                    <span class="rating{star}-t"></span>
+                    <span class="rating_num" property="v:average">{rating}</span>
+                    <span property="v:best" content="10.0"></span>
+                    <span>{rating_count}人评价</span>
+                </div>
+                {quote}
+            </div>
+        </div>
+    </div>
+</li>
+'''
+
+COUNTRIES = ['美国', '中国大陆', '中国香港', '日本', '英国', '法国', '韩国', '意大利', '德国']
+GENRES = ['剧情', '喜剧', '动作', '爱情', '科幻', '悬疑', '犯罪', '动画', '奇幻', '战争']
+
+
+def synthetic_page(start, rng):
+    """生成一页结构与豆瓣Top250相同的HTML"""
+    items = []
+    for rank in range(start + 1, start + 26):
+        items.append(ITEM_TEMPLATE.format(
+            rank=rank,
+            douban_id=1290000 + rank,
+            img=rank % 9,
+            title=f'电影{rank}',
+            title_en=f'<span class="title">&nbsp;/&nbsp;Movie {rank}</span>' if rng.random() < 0.8 else '',
+            director=f'导演{rank} Director {rank}',
+            actors=f'演员{rank}A Actor A / 演员{rank}B',
+            year=rng.randint(1931, 2024),
+            country=' '.join(rng.sample(COUNTRIES, rng.randint(1, 3))),
+            genre=' '.join(rng.sample(GENRES, rng.randint(1, 3))),
+            star=rng.choice([40, 45, 50]),
+            rating=f'{rng.uniform(8.0, 9.8):.1f}',
+            rating_count=rng.randint(10000, 3000000),
+            quote=f'<p class="quote"><span class="inq">简介{rank}。</span></p>' if rng.random() < 0.9 else ''
+        ))
+    return f'<html><head><meta charset="utf-8"></head><body><ol class="grid_view">{"".join(items)}</ol></body></html>'
+
+
+def strip_times(movies):
+    """去掉时间戳字段，便于比较两个引擎的结果"""
+    return [{k: v for k, v in movie.items() if k not in TIME_FIELDS} for movie in movies]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比解析引擎的耗时和结果')
+    parser.add_argument('pages', nargs='*', help='保存的豆瓣Top250页面HTML文件')
+    parser.add_argument('--rounds', type=int, default=20, help='每个页面重复解析的次数')
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, 'r', encoding='utf-8') as f:
+                pages.append(f.read())
+    else:
+        rng = random.Random(42)
+        pages = [synthetic_page(start, rng) for start in range(0, 250, 25)]
+
+    engines = {name: get_parser(name) for name in PARSERS}
+
+    # 先校验结果一致，再计时
+    for index, html in enumerate(pages):
+        results = {name: strip_times(engine.parse_movies(html)) for name, engine in engines.items()}
+        expected = results['soup']
+        for name, movies in results.items():
+            if movies != expected:
+                raise SystemExit(f"第 {index + 1} 页 {name} 引擎的结果与soup不一致")
+    print(f"结果校验通过: {len(pages)} 页，每个引擎解析出的电影信息完全一致")
+
+    for name, engine in engines.items():
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for html in pages:
+                engine.parse_movies(html)
+        elapsed = time.perf_counter() - start
+        per_page = elapsed / (args.rounds * len(pages)) * 1000
+        print(f"{name:>5}: 每页 {per_page:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+
+class CrawlCheckpoint:
+    """基于SQLite的爬取检查点，记录每个start偏移的抓取时间、HTTP状态和内容哈希"""
+
+    def __init__(self, path: str = 'crawl_checkpoint.db'):
+        """打开或创建检查点文件，抓取、解析、写入线程共用一个实例"""
+        self.path = path
+        self.run_id = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS crawl_run (
+                run_id TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS page_checkpoint (
+                start_offset INTEGER PRIMARY KEY,
+                run_id TEXT,
+                fetched_at REAL,
+                status INTEGER,
+                error TEXT,
+                body_hash TEXT,
+                items_hash TEXT,
+                saved INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+        self._conn.commit()
+
+    def begin_run(self) -> bool:
+        """开始一次爬取，上次没有正常结束时沿用上次的run_id，返回是否为续爬"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id FROM crawl_run WHERE finished_at IS NULL ORDER BY started_at DESC LIMIT 1"
+            ).fetchone()
+            if row:
+                self.run_id = row[0]
+                return True
+            self.run_id = uuid.uuid4().hex
+            self._conn.execute("INSERT INTO crawl_run (run_id, started_at) VALUES (?, ?)",
+                               (self.run_id, time.time()))
+            self._conn.commit()
+            return False
+
+    def finish_run(self) -> None:
+        """标记本次爬取正常结束"""
+        with self._lock:
+            self._conn.execute("UPDATE crawl_run SET finished_at = ? WHERE run_id = ?", (time.time(), self.run_id))
+            self._conn.commit()
+
+    def pending_starts(self, starts: List[int], retry_failed: bool = False) -> List[int]:
+        """过滤出本次需要抓取的start：续爬时跳过本轮已保存的页，retry_failed时只抓上次失败的页"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT start_offset, run_id, status, saved FROM page_checkpoint"
+            ).fetchall()
+        state = {start: (run_id, status, saved) for start, run_id, status, saved in rows}
+        pending = []
+        for start in starts:
+            run_id, status, saved = state.get(start, (None, None, 0))
+            if run_id == self.run_id and saved:
+                continue
+            if retry_failed and start in state and status in (200, 304) and saved:
+                continue
+            pending.append(start)
+        return pending
+
+    def record_failure(self, start: int, status: Optional[int], error: str) -> None:
+        """记录抓取失败，保留上次成功时的内容哈希"""
+        with self._lock:
+            self._conn.execute('''
+                INSERT INTO page_checkpoint (start_offset, run_id, fetched_at, status, error, saved)
+                VALUES (?, ?, ?, ?, ?, 0)
+                ON CONFLICT(start_offset) DO UPDATE SET
+                    run_id = excluded.run_id, fetched_at = excluded.fetched_at,
+                    status = excluded.status, error = excluded.error, saved = 0
+            ''', (start, self.run_id, time.time(), status, error))
+            self._conn.commit()
+
+    def record_fetch(self, start: int, status: int, body: Optional[bytes], body_hash: Optional[str] = None) -> bool:
+        """记录抓取成功，返回页面内容是否和上次已保存的一样(一样则不用再解析和保存)
+
+        流式抓取时没有完整的body，由调用方边读边算好body_hash传进来
+        """
+        if body is not None:
+            body_hash = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body_hash, saved FROM page_checkpoint WHERE start_offset = ?", (start,)
+            ).fetchone()
+            # 304没有响应体，视为和上次一样
+            unchanged = bool(row and row[1] and (body_hash is None or row[0] == body_hash))
+            self._conn.execute('''
+                INSERT INTO page_checkpoint (start_offset, run_id, fetched_at, status, error, body_hash, saved)
+                VALUES (?, ?, ?, ?, NULL, ?, ?)
+                ON CONFLICT(start_offset) DO UPDATE SET
+                    run_id = excluded.run_id, fetched_at = excluded.fetched_at, status = excluded.status,
+                    error = NULL, body_hash = COALESCE(excluded.body_hash, body_hash), saved = excluded.saved
+            ''', (start, self.run_id, time.time(), status, body_hash, int(unchanged)))
+            self._conn.commit()
+        return unchanged
+
+    def items_unchanged(self, start: int, digest: str) -> bool:
+        """解析结果和上次保存的一样时直接标记为已保存，返回True表示不用写数据库"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT items_hash FROM page_checkpoint WHERE start_offset = ?", (start,)
+            ).fetchone()
+            if row and row[0] == digest:
+                self._conn.execute("UPDATE page_checkpoint SET saved = 1 WHERE start_offset = ?", (start,))
+                self._conn.commit()
+                return True
+            return False
+
+    def mark_saved(self, start: int, digest: str) -> None:
+        """记录该页已写入数据库及其解析结果哈希"""
+        with self._lock:
+            self._conn.execute("UPDATE page_checkpoint SET saved = 1, items_hash = ? WHERE start_offset = ?",
+                               (digest, start))
+            self._conn.commit()
+
+    def reset_saved(self) -> None:
+        """数据库里的数据被清掉后调用：所有页面标记为未保存，之后的304和内容未变化都不再跳过写入"""
+        with self._lock:
+            self._conn.execute("UPDATE page_checkpoint SET saved = 0, items_hash = NULL")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """关闭检查点文件"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable
+
+# 队列里的结束标记
+_DONE = object()
+
+
+class CrawlPipeline:
+    """流式爬取流水线：页面来源 → 解析 → 批量写入
+
+    各阶段在各自的线程里运行，之间用有界队列连接。下游处理不过来时队列写满，
+    上游的put会阻塞，内存占用只和队列长度有关，和爬取的总页数无关。
+    """
+
+    def __init__(self, source: Iterable[Any], parse: Callable[[Any], Any], write: Callable[[Any], Any],
+                 queue_size: int = 4, parse_threads: int = 1):
+        """source产出待解析的页面，parse把一个页面变成一批数据，write提交一批数据"""
+        self.source = source
+        self.parse = parse
+        self.write = write
+        self.parse_threads = parse_threads
+        self._pages = queue.Queue(maxsize=queue_size)
+        self._batches = queue.Queue(maxsize=queue_size)
+        self._errors = []
+        self._lock = threading.Lock()
+        self.stats = {
+            'pages': 0,
+            'batches': 0,
+            'parse_errors': 0,
+            'write_errors': 0,
+            'elapsed': 0.0
+        }
+
+    def _count(self, key):
+        """线程安全地累加统计项"""
+        with self._lock:
+            self.stats[key] += 1
+
+    def _run_source(self):
+        """把页面来源逐个放进解析队列，结束后给每个解析线程发一个结束标记"""
+        try:
+            for page in self.source:
+                self._pages.put(page)
+                self._count('pages')
+        except Exception as e:
+            # 来源出错时整个流水线停下，错误在run里重新抛出
+            with self._lock:
+                self._errors.append(e)
+        finally:
+            for _ in range(self.parse_threads):
+                self._pages.put(_DONE)
+
+    def _run_parser(self):
+        """从解析队列取页面，解析结果放进写入队列"""
+        try:
+            while True:
+                page = self._pages.get()
+                if page is _DONE:
+                    break
+                try:
+                    batch = self.parse(page)
+                except Exception as e:
+                    print(f"解析失败: {e}")
+                    self._count('parse_errors')
+                    continue
+                if batch is not None:
+                    self._batches.put(batch)
+        finally:
+            self._batches.put(_DONE)
+
+    def run(self) -> Dict[str, Any]:
+        """运行流水线，写入在当前线程执行，返回统计信息"""
+        start = time.monotonic()
+        threads = [threading.Thread(target=self._run_source, name='page-source', daemon=True)]
+        threads += [threading.Thread(target=self._run_parser, name=f'parser-{i}', daemon=True)
+                    for i in range(self.parse_threads)]
+        for thread in threads:
+            thread.start()
+
+        finished = 0
+        while finished < self.parse_threads:
+            batch = self._batches.get()
+            if batch is _DONE:
+                finished += 1
+                continue
+            try:
+                self.write(batch)
+                self._count('batches')
+            except Exception as e:
+                print(f"写入失败: {e}")
+                self._count('write_errors')
+
+        for thread in threads:
+            thread.join()
+        self.stats['elapsed'] = round(time.monotonic() - start, 3)
+        if self._errors:
+            raise self._errors[0]
+        return self.stats
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import math
+import os
+import ssl
+import time
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dotenv import load_dotenv
+import aiohttp
+from mysql_helper import MySqlHelper
+from query_cache import shared_cache
+from rate_limiter import AsyncTokenBucket
+from fetch_policy import RetryPolicy
+from detail_parser import parse_detail
+
+# 加载环境变量
+load_dotenv()
+
+# 数据库配置
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', 3306)),
+    'user': os.getenv('DB_USER', ''),
+    'password': os.getenv('DB_PASSWORD', ''),
+    'database': os.getenv('DB_NAME', '')
+}
+
+# 详情页爬取配置
+DETAIL_CONFIG = {
+    'concurrency': int(os.getenv('DETAIL_CONCURRENCY', 100)),
+    'rate': float(os.getenv('DETAIL_RATE', 2.0)),
+    'burst': int(os.getenv('DETAIL_BURST', 4)),
+    'batch_size': int(os.getenv('DETAIL_BATCH_SIZE', 50)),
+    'parse_workers': int(os.getenv('DETAIL_PARSE_WORKERS', 2))
+}
+
+# 详情页补充的列，写入时按douban_id更新
+DETAIL_COLUMNS = [
+    'full_cast', 'writers', 'release_date', 'languages', 'tags',
+    'runtime_minutes', 'imdb_id', 'detail_status', 'detail_crawled_at'
+]
+# 条目已删除或不存在，重试也不会成功；这些电影和解析失败的一样记下失败状态，以后不再抓
+GONE_STATUSES = (404, 410)
+
+
+def percentile(values, p):
+    """取第p百分位的值(最近秩法)，没有数据时返回0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class DetailCrawler:
+    """基于asyncio的豆瓣电影详情页爬虫
+
+    事件循环里只做网络IO：所有协程共享一个令牌桶限速，页面解析交给进程池，
+    数据库写入交给单独的写线程按批提交，写入跟不上时有界队列会让抓取协程等待。
+    """
+
+    def __init__(self, concurrency=None, rate=None, burst=None, batch_size=None, parse_workers=None,
+                 base_url=None, limit=None, dry_run=False, timeout=15, max_retries=3, insecure=False):
+        self.concurrency = concurrency or DETAIL_CONFIG['concurrency']
+        self.rate_limiter = AsyncTokenBucket(rate or DETAIL_CONFIG['rate'], burst or DETAIL_CONFIG['burst'])
+        self.batch_size = batch_size or DETAIL_CONFIG['batch_size']
+        self.parse_workers = DETAIL_CONFIG['parse_workers'] if parse_workers is None else parse_workers
+        # base_url可以指向本地HTTP服务，详情页地址改成 {base_url}/subject/{douban_id}/
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.limit = limit
+        # 默认校验证书；insecure只用于自签名证书的本地测试服务
+        self.ssl_context = False if insecure else ssl.create_default_context()
+        # dry_run时不连数据库，只抓取和解析，用于压测和本地调试
+        self.dry_run = dry_run
+        self.timeout = timeout
+        self.retry = RetryPolicy(max_retries=max_retries)
+        self.db = None if dry_run else MySqlHelper(**DB_CONFIG, cache=shared_cache())
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+        }
+        self.latencies = []
+        self.statuses = Counter()
+        self.stats = {'pages': 0, 'parsed': 0, 'parse_errors': 0, 'saved': 0, 'save_failed': 0, 'failed': 0,
+                      'marked_failed': 0}
+
+    def pending_movies(self):
+        """读取还没有抓过详情页的电影，记过失败状态的电影也设置了detail_crawled_at，不会再读到"""
+        sql = ("SELECT douban_id, douban_url FROM douban_movies "
+               "WHERE detail_crawled_at IS NULL AND douban_id IS NOT NULL ORDER BY rank_num")
+        if self.limit:
+            sql += f" LIMIT {int(self.limit)}"
+        return self.db.fetch_all(sql)
+
+    def detail_url(self, movie):
+        """返回电影详情页地址"""
+        if self.base_url:
+            return f"{self.base_url}/subject/{movie['douban_id']}/"
+        return movie['douban_url']
+
+    async def fetch(self, session, url):
+        """限速后获取页面，可重试的失败按退避重试，返回(状态码, 页面内容)"""
+        for attempt in range(self.retry.max_retries + 1):
+            await self.rate_limiter.acquire()
+            start = time.monotonic()
+            try:
+                async with session.get(url) as response:
+                    body = await response.read()
+                    status, retry_after = response.status, response.headers.get('Retry-After')
+                error = None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, body, retry_after, error = None, None, None, e
+            # 只统计一次请求本身的耗时，不含排队等令牌的时间
+            self.latencies.append(time.monotonic() - start)
+            self.statuses[status or 'error'] += 1
+
+            if error is None and not self.retry.is_retryable_status(status):
+                return status, body
+            if attempt == self.retry.max_retries:
+                return status, body
+            delay = self.retry.backoff(attempt, retry_after)
+            print(f"请求失败({error or f'HTTP {status}'})，{delay:.1f}秒后第{attempt + 1}次重试: {url}")
+            await asyncio.sleep(delay)
+
+    async def worker(self, movies, session, parse_pool, results):
+        """抓取协程：从待抓队列取电影，抓取并解析后放进结果队列"""
+        loop = asyncio.get_running_loop()
+        while True:
+            movie = await movies.get()
+            try:
+                url = self.detail_url(movie)
+                status, body = await self.fetch(session, url)
+                self.stats['pages'] += 1
+                if status != 200:
+                    self.stats['failed'] += 1
+                    print(f"获取详情页失败: {url} HTTP {status}")
+                    if status in GONE_STATUSES:
+                        await results.put(self.failure(movie, f'http_{status}'))
+                    continue
+                try:
+                    # 解析是CPU密集的，放到进程池里，不阻塞事件循环
+                    detail = await loop.run_in_executor(parse_pool, parse_detail, body)
+                except Exception as e:
+                    self.stats['parse_errors'] += 1
+                    print(f"解析详情页失败: {url} {e}")
+                    await results.put(self.failure(movie, 'parse_error'))
+                    continue
+                self.stats['parsed'] += 1
+                detail['douban_id'] = movie['douban_id']
+                detail['detail_status'] = 'ok'
+                await results.put(detail)
+            finally:
+                movies.task_done()
+
+    @staticmethod
+    def failure(movie, status):
+        """不再重抓的失败记录：只写detail_status和detail_crawled_at"""
+        return {'douban_id': movie['douban_id'], 'detail_status': status, 'detail_crawled_at': datetime.now()}
+
+    async def writer(self, results, write_pool):
+        """写入协程：攒够一批就交给写线程提交，结束标记None到达时写完剩下的"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        while True:
+            detail = await results.get()
+            if detail is not None:
+                batch.append(detail)
+            if batch and (detail is None or len(batch) >= self.batch_size):
+                await loop.run_in_executor(write_pool, self.save_details, batch)
+                batch = []
+            if detail is None:
+                break
+
+    def save_details(self, details):
+        """把一批详情和失败记录写回douban_movies，在写线程里执行"""
+        rows = [{'douban_id': detail['douban_id'], **{column: detail[column] for column in DETAIL_COLUMNS}}
+                for detail in details if detail['detail_status'] == 'ok']
+        failures = [detail for detail in details if detail['detail_status'] != 'ok']
+        if self.dry_run:
+            self.stats['saved'] += len(rows)
+            self.stats['marked_failed'] += len(failures)
+            return
+        # 两种记录的列不同，分开更新
+        for group, key in ((rows, 'saved'), (failures, 'marked_failed')):
+            if not group:
+                continue
+            result = self.db.update_many('douban_movies', group, 'douban_id', batch_size=self.batch_size)
+            self.stats[key] += result['updated']
+            self.stats['save_failed'] += len(result['failed'])
+            for failed in result['failed']:
+                print(f"保存详情 {failed['row']['douban_id']} 失败: {failed['error']}")
+        print(f"已保存 {self.stats['saved']} 部电影的详情，{self.stats['marked_failed']} 部记为失败")
+
+    async def crawl(self, movies):
+        """并发抓取一组电影的详情页"""
+        queue = asyncio.Queue()
+        for movie in movies:
+            queue.put_nowait(movie)
+        # 解析结果队列有界，写入慢时抓取协程在put上等待
+        results = asyncio.Queue(maxsize=self.batch_size * 4)
+
+        parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers) if self.parse_workers > 0 else None
+        # MySQL连接不是线程安全的，写入固定在一个线程里
+        write_pool = ThreadPoolExecutor(max_workers=1)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=self.ssl_context)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        try:
+            async with aiohttp.ClientSession(headers=self.headers, connector=connector, timeout=timeout) as session:
+                writer = asyncio.create_task(self.writer(results, write_pool))
+                workers = [asyncio.create_task(self.worker(queue, session, parse_pool, results))
+                           for _ in range(min(self.concurrency, max(1, len(movies))))]
+                # 写入协程出错退出后没人消费结果队列，抓取协程会在put上一直等，queue.join()永远不返回，
+                # 所以同时等写入协程，它先结束就停掉抓取协程并抛出它的异常
+                joined = asyncio.create_task(queue.join())
+                await asyncio.wait({joined, writer}, return_when=asyncio.FIRST_COMPLETED)
+                for task in workers + [joined]:
+                    task.cancel()
+                await asyncio.gather(*workers, joined, return_exceptions=True)
+                if writer.done():
+                    writer.result()
+                    raise RuntimeError("写入协程提前结束")
+                await results.put(None)
+                await writer
+        finally:
+            if parse_pool:
+                parse_pool.shutdown()
+            write_pool.shutdown()
+
+    def report(self, elapsed):
+        """返回吞吐量和延迟统计"""
+        return {
+            **self.stats,
+            'elapsed': round(elapsed, 3),
+            'pages_per_sec': round(self.stats['pages'] / elapsed, 2) if elapsed > 0 else 0.0,
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 1),
+            'p99_ms': round(percentile(self.latencies, 99) * 1000, 1),
+            'statuses': dict(self.statuses)
+        }
+
+    def run(self, movies=None):
+        """运行爬虫，movies为空时从数据库读取待抓的电影，返回统计信息"""
+        movies = self.pending_movies() if movies is None else movies
+        print(f"待抓取详情页: {len(movies)} 部电影，并发 {self.concurrency}，限速 {self.rate_limiter.rate}/秒")
+        if not movies:
+            return self.report(0.0)
+
+        start = time.monotonic()
+        asyncio.run(self.crawl(movies))
+        stats = self.report(time.monotonic() - start)
+        print(f"\n详情页爬取统计: {stats}")
+        return stats
+
+    def close(self):
+        """关闭数据库连接"""
+        if self.db:
+            self.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并发抓取豆瓣电影详情页，补充演员表、片长、IMDb编号和标签')
+    parser.add_argument('--concurrency', type=int, help='同时进行的请求数上限')
+    parser.add_argument('--rate', type=float, help='每秒请求数')
+    parser.add_argument('--burst', type=int, help='允许的突发请求数')
+    parser.add_argument('--limit', type=int, help='最多抓取的电影数')
+    parser.add_argument('--base-url', help='详情页服务地址，如本地测试服务 http://127.0.0.1:8000')
+    parser.add_argument('--ids', help='逗号分隔的douban_id，指定时不从数据库读取，需配合--base-url')
+    parser.add_argument('--dry-run', action='store_true', help='只抓取和解析，不写数据库')
+    parser.add_argument('--insecure', action='store_true', help='不校验HTTPS证书，只用于自签名证书的本地测试服务')
+    args = parser.parse_args()
+
+    movies = None
+    if args.ids:
+        movies = [{'douban_id': douban_id, 'douban_url': None} for douban_id in args.ids.split(',')]
+    crawler = DetailCrawler(concurrency=args.concurrency, rate=args.rate, burst=args.burst,
+                            base_url=args.base_url, limit=args.limit, dry_run=args.dry_run,
+                            insecure=args.insecure)
+    try:
+        crawler.run(movies)
+    except KeyboardInterrupt:
+        print("\n用户中断爬取")
+    finally:
+        crawler.close()
+
+
+if __name__ == '__main__':
+    main()
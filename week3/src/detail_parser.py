@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+from datetime import datetime
+from lxml import html as lxml_html
+
+# 详情页#info区域里的字段，XPath在导入时编译一次
+INFO_XPATH = {
+    'cast': '//div[@id="info"]//a[@rel="v:starring"]/text()',
+    'writers': '//div[@id="info"]//span[@class="pl"][normalize-space(.)="编剧"]/following-sibling::span[@class="attrs"][1]/a/text()',
+    'runtime': '//div[@id="info"]//span[@property="v:runtime"]/@content',
+    'runtime_text': '//div[@id="info"]//span[@property="v:runtime"]/text()',
+    'release_dates': '//div[@id="info"]//span[@property="v:initialReleaseDate"]/@content',
+    'languages': '//div[@id="info"]/span[@class="pl"][starts-with(normalize-space(.), "语言")]/following-sibling::text()[1]',
+    'imdb': '//div[@id="info"]/span[@class="pl"][starts-with(normalize-space(.), "IMDb")]/following-sibling::text()[1]',
+    'tags': '//div[contains(concat(" ", normalize-space(@class), " "), " tags-body ")]/a/text()'
+}
+COMPILED_XPATH = {name: lxml_html.etree.XPath(path) for name, path in INFO_XPATH.items()}
+
+IMDB_PATTERN = re.compile(r'tt\d+')
+MINUTES_PATTERN = re.compile(r'(\d+)\s*分钟')
+
+
+def _joined(values, sep='/'):
+    """去掉空白后拼接，没有值时返回None"""
+    values = [value.strip() for value in values if value and value.strip()]
+    return sep.join(values) if values else None
+
+
+def parse_detail(html):
+    """解析电影详情页，返回需要补充到douban_movies的字段
+
+    模块级函数，可以直接交给进程池执行
+    """
+    tree = lxml_html.fromstring(html)
+    detail = {
+        'full_cast': _joined(COMPILED_XPATH['cast'](tree)),
+        'writers': _joined(COMPILED_XPATH['writers'](tree)),
+        'release_date': _joined(COMPILED_XPATH['release_dates'](tree)),
+        'languages': _joined(COMPILED_XPATH['languages'](tree)),
+        'tags': _joined(COMPILED_XPATH['tags'](tree)),
+        'runtime_minutes': None,
+        'imdb_id': None,
+        'detail_crawled_at': datetime.now()
+    }
+
+    # 片长优先取content属性，没有时从"142分钟"里取数字
+    runtime = COMPILED_XPATH['runtime'](tree)
+    if runtime and runtime[0].isdigit():
+        detail['runtime_minutes'] = int(runtime[0])
+    else:
+        match = MINUTES_PATTERN.search(' '.join(COMPILED_XPATH['runtime_text'](tree)))
+        if match:
+            detail['runtime_minutes'] = int(match.group(1))
+
+    imdb = IMDB_PATTERN.search(' '.join(COMPILED_XPATH['imdb'](tree)))
+    if imdb:
+        detail['imdb_id'] = imdb.group(0)
+    return detail
@@ -1,16 +1,28 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import urllib.request
-import json
-import time
-import gzip
+import hashlib
 import ssl
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
-from bs4 import BeautifulSoup
+import argparse
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from mysql_helper import MySqlHelper
+from query_cache import shared_cache
+from rate_limiter import TokenBucket
+from fetch_policy import FetchPolicy, RetryPolicy
+from http_client import HttpClient
+from http_cache import HttpCache
+from movie_parser import get_parser, parse_page_batch, parse_archived_page, LxmlMovieParser
+from movie_record import MovieBatch, MOVIE_COLUMNS
+from movie_relations import MovieRelations
+from movie_stats import MovieStats
+from crawl_pipeline import CrawlPipeline
+from crawl_checkpoint import CrawlCheckpoint
+from page_archive import PageArchive
 
 # 加载环境变量
 load_dotenv()
@@ -24,12 +36,79 @@ DB_CONFIG = {
     'database': os.getenv('DB_NAME', '')
 }
 
+# 页面缓存配置，HTTP_CACHE_DIR为空时不使用缓存
+CACHE_CONFIG = {
+    'cache_dir': os.getenv('HTTP_CACHE_DIR', '.http_cache'),
+    'max_bytes': int(os.getenv('HTTP_CACHE_MAX_BYTES', 100 * 1024 * 1024)),
+    'max_age': int(os.getenv('HTTP_CACHE_MAX_AGE', 7 * 24 * 3600)),
+    'cache_only': os.getenv('HTTP_CACHE_ONLY', '0') == '1'
+}
+
+# 检查点配置，CRAWL_RETRY_FAILED=1时只重抓上次失败的页面
+CHECKPOINT_CONFIG = {
+    'path': os.getenv('CRAWL_CHECKPOINT_PATH', 'crawl_checkpoint.db'),
+    'retry_failed': os.getenv('CRAWL_RETRY_FAILED', '0') == '1'
+}
+
+# 原始页面归档目录，PAGE_ARCHIVE_DIR为空时不归档
+ARCHIVE_CONFIG = {
+    'archive_dir': os.getenv('PAGE_ARCHIVE_DIR', '')
+}
+
+# 规范化结构的过渡开关：开启时同时写整数年份/片长列和国家、类型、人员关联表
+# (需要先执行 alter_douban_movies_normalize.sql)，所有查询切换完后旧的字符串列可以删掉
+# MOVIE_WRITE_STATS开启时在同一个事务里维护看板的汇总表：create_douban_movies_table.sql会一起建表，
+# 旧库先执行 create_movie_stats_tables.sql；不经过爬虫改动douban_movies后要运行 --rebuild-stats
+SCHEMA_CONFIG = {
+    'write_relations': os.getenv('MOVIE_WRITE_RELATIONS', '1') == '1',
+    'write_stats': os.getenv('MOVIE_WRITE_STATS', '1') == '1'
+}
+
+# upsert时参与内容哈希比较、需要更新的列
+MOVIE_CONTENT_COLUMNS = [
+    'rank_num', 'title', 'title_en', 'director', 'actors', 'year', 'country',
+    'genre', 'rating', 'rating_count', 'duration', 'poster_url', 'summary', 'douban_url'
+]
+# 规范化结构里的整数列
+MOVIE_TYPED_COLUMNS = ['release_year', 'duration_min']
+
 class DoubanMovieSpider:
     """豆瓣电影Top250爬虫"""
     
-    def __init__(self):
-        self.base_url = 'https://movie.douban.com/top250'
-        self.db = MySqlHelper(**DB_CONFIG)
+    def __init__(self, batch_size=100, save_mode='upsert', pages=4, workers=4, rate=1.0, burst=2,
+                 base_url='https://movie.douban.com/top250', cache_dir=None, cache_only=False, engine='soup',
+                 parse_workers=0, queue_size=4, retry_failed=False, max_retries=3, max_rate=None,
+                 archive_dir=None, stream=False):
+        # base_url可以指向本地HTTP服务，用固定的页面做测试
+        self.base_url = base_url
+        # 要爬取的页数，每页25部电影
+        self.pages = pages
+        # 并发抓取的线程数，所有线程共享一个令牌桶限速(每秒rate个请求，最多突发burst个)
+        self.workers = workers
+        self.rate_limiter = TokenBucket(rate, burst)
+        # 抓取策略：失败退避重试、按主机熔断，并根据延迟和错误率AIMD调整速率和并发
+        self.policy = FetchPolicy(self.rate_limiter, max_concurrency=workers,
+                                  retry=RetryPolicy(max_retries=max_retries), max_rate=max_rate)
+        # 解析引擎: soup为BeautifulSoup，lxml为预编译XPath，两者结果一致
+        self.engine = engine
+        self.parser = get_parser(engine)
+        # 流式模式：响应体边下载边解压边解析，每页不再整页读进内存，不经过页面缓存
+        self.stream = stream
+        self.stream_parser = LxmlMovieParser()
+        # 解析进程数，大于0时页面边下载边交给进程池解析
+        self.parse_workers = parse_workers
+        # 流水线各阶段之间队列的长度，下游处理慢时上游在这里阻塞
+        self.queue_size = queue_size
+        # 检查点记录每页的抓取状态和内容哈希，用于断点续爬和跳过没变化的页面
+        self.checkpoint = CrawlCheckpoint(CHECKPOINT_CONFIG['path'])
+        self.retry_failed = retry_failed or CHECKPOINT_CONFIG['retry_failed']
+        self.db = MySqlHelper(**DB_CONFIG, cache=shared_cache())
+        self.relations = MovieRelations(self.db) if SCHEMA_CONFIG['write_relations'] else None
+        self.stats = MovieStats(self.db) if SCHEMA_CONFIG['write_stats'] else None
+        # 每批插入的行数，每批一个事务
+        self.batch_size = batch_size
+        # 保存方式: upsert按douban_id增量更新，replace清除当天数据后重新插入
+        self.save_mode = save_mode
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -42,338 +121,342 @@ class DoubanMovieSpider:
         self.ssl_context = ssl.create_default_context()
         self.ssl_context.check_hostname = False
         self.ssl_context.verify_mode = ssl.CERT_NONE
+        # 页面缓存在磁盘上，再次爬取时发条件请求；cache_only时只用缓存重跑解析和保存
+        cache_dir = cache_dir or CACHE_CONFIG['cache_dir']
+        cache = HttpCache(cache_dir, CACHE_CONFIG['max_bytes'], CACHE_CONFIG['max_age']) if cache_dir else None
+        # 所有抓取线程共享一个持久连接池
+        self.http = HttpClient(headers=self.headers, ssl_context=self.ssl_context,
+                               max_idle_per_host=workers, cache=cache,
+                               cache_only=cache_only or CACHE_CONFIG['cache_only'])
+        # 从网络拿到的原始响应追加到压缩归档里，改进解析器后可以离线回放，不用重新爬取
+        archive_dir = archive_dir or ARCHIVE_CONFIG['archive_dir']
+        self.archive = PageArchive(archive_dir, prefix='douban') if archive_dir else None
         
-    def fetch_page(self, start=0):
-        """获取页面内容"""
+    def fetch_response(self, start=0):
+        """获取页面响应，失败返回None"""
         url = f'{self.base_url}?start={start}&filter='
         print(f"正在获取: {url}")
         
         try:
-            request = urllib.request.Request(url, headers=self.headers)
-            # 使用自定义SSL上下文
-            response = urllib.request.urlopen(request, timeout=10, context=self.ssl_context)
-            
-            # 处理gzip压缩
-            if response.info().get('Content-Encoding') == 'gzip':
-                content = gzip.decompress(response.read())
+            # 复用keep-alive连接，gzip/deflate由客户端解压，有缓存时自动发条件请求
+            if self.http.cache_only:
+                response = self.http.get(url)
             else:
-                content = response.read()
-                
-            return content.decode('utf-8')
+                # 限速、重试和熔断都由抓取策略负责
+                response = self.policy.execute(url, lambda: self.http.get(url))
+            # 缓存里的响应上次已经归档过
+            if self.archive and not response.from_cache:
+                self.archive.append(url, response.status, response.headers, response.body)
+            if response.status != 200:
+                self.checkpoint.record_failure(start, response.status, f"HTTP {response.status}")
+                print(f"获取页面失败: HTTP {response.status}")
+                return None
+            
+            return response
             
         except Exception as e:
+            self.checkpoint.record_failure(start, None, str(e))
             print(f"获取页面失败: {e}")
             return None
     
-    def parse_movies(self, html):
-        """解析电影信息"""
-        if not html:
-            return []
-            
-        soup = BeautifulSoup(html, 'lxml')
-        movies = []
-        
-        # 查找所有电影条目
-        movie_items = soup.find_all('div', class_='item')
-        
-        for item in movie_items:
-            try:
-                movie = self._extract_movie_info(item)
-                if movie:
-                    movies.append(movie)
-            except Exception as e:
-                print(f"解析电影信息失败: {e}")
-                continue
-                
-        return movies
-    
-    def _extract_movie_info(self, item):
-        """提取单个电影信息"""
-        movie = {
-            'rank_num': 0, 'title': '', 'title_en': '', 'director': '',
-            'actors': '', 'year': '', 'country': '', 'genre': '',
-            'rating': 0.0, 'rating_count': 0, 'duration': '',
-            'poster_url': '', 'summary': '', 'douban_id': '',
-            'douban_url': '', 'crawl_time': '', 'created_time': '',
-            'updated_time': ''
-        }
-        
-        # 排名 - 使用find方法
-        rank_elem = item.find('em')
-        if rank_elem:
-            movie['rank_num'] = int(rank_elem.get_text().strip())
-        
-        # 链接和豆瓣ID - 使用find方法查找a标签
-        link_elem = item.find('a')
-        if link_elem and link_elem.get('href'):
-            href = link_elem.get('href')
-            movie['douban_url'] = href
-            # 提取豆瓣ID
-            if '/subject/' in href:
-                movie['douban_id'] = href.split('/subject/')[1].rstrip('/')
-        
-        # 海报 - 使用find方法查找img标签
-        img_elem = item.find('img')
-        if img_elem:
-            movie['poster_url'] = img_elem.get('src', '')
-        
-        # 标题 - 使用find_all方法查找所有title类的span
-        title_elems = item.find_all('span', class_='title')
-        if title_elems:
-            # 第一个span是中文标题
-            movie['title'] = title_elems[0].get_text().strip()
-            # 第二个span是英文标题（如果存在）
-            if len(title_elems) > 1:
-                en_title = title_elems[1].get_text().strip()
-                # 移除开头的斜杠和空格
-                movie['title_en'] = en_title.lstrip('/ ').strip()
-        
-        # 电影详细信息 - 查找bd div下的第一个p标签
-        bd_div = item.find('div', class_='bd')
-        if bd_div:
-            info_p = bd_div.find('p')
-            if info_p:
-                # 获取p标签的所有文本内容
-                info_text = info_p.get_text().strip()
-                self._parse_movie_details_with_soup(movie, info_p)
-        
-        # 评分 - 使用find方法查找rating_num类的span
-        rating_elem = item.find('span', class_='rating_num')
-        if rating_elem:
-            try:
-                movie['rating'] = float(rating_elem.get_text().strip())
-            except ValueError:
-                movie['rating'] = 0.0
-        
-        # 评分人数 - 查找包含"人评价"的span
-        rating_spans = item.find_all('span')
-        for span in rating_spans:
-            text = span.get_text().strip()
-            if '人评价' in text:
-                # 提取数字部分
-                number_text = text.replace('人评价', '').strip()
-                try:
-                    movie['rating_count'] = int(number_text)
-                except ValueError:
-                    movie['rating_count'] = 0
-                break
-        
-        # 简介 - 使用find方法查找inq类的span
-        quote_elem = item.find('span', class_='inq')
-        if quote_elem:
-            movie['summary'] = quote_elem.get_text().strip()
-        
-        # 设置时间戳
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        movie['crawl_time'] = current_time
-        movie['created_time'] = current_time
-        movie['updated_time'] = current_time
-        
-        return movie
+    def fetch_page(self, start=0):
+        """获取页面内容"""
+        response = self.fetch_response(start)
+        return response.text() if response else None
     
-    def _parse_movie_details_with_soup(self, movie, info_p):
-        """使用BeautifulSoup API解析电影详细信息"""
-        # 获取p标签内的所有文本内容
-        full_text = info_p.get_text().strip()
-        
-        # 按行分割处理
-        text_lines = full_text.split('\n')
+    def fetch_movies_stream(self, start=0):
+        """流式获取并解析一页，返回(电影列表, 页面内容哈希)，失败返回None
+
+        响应体按块读取，每块用zlib增量解压后立即交给lxml增量解析器，
+        每个div.item一结束就解析出一部电影，下载和解析同时进行
+        """
+        url = f'{self.base_url}?start={start}&filter='
+        print(f"正在流式获取: {url}")
         
-        # 合并所有文本用于更好的解析
-        combined_text = ' '.join([line.strip() for line in text_lines if line.strip()])
+        def open_stream():
+            stream = self.http.stream(url)
+            if stream.status != 200:
+                # 错误页很小，读完让连接回到连接池，再交给抓取策略判断是否重试
+                stream.read()
+            return stream
         
-        # 解析导演信息
-        if '导演:' in combined_text:
-            director_start = combined_text.find('导演:') + 3
-            director_end = combined_text.find('主演:', director_start)
-            if director_end == -1:
-                # 如果没有主演，找到下一个可能的分隔符
-                for delimiter in ['年', '分钟', '类型']:
-                    temp_end = combined_text.find(delimiter, director_start)
-                    if temp_end != -1:
-                        director_end = temp_end
-                        break
-                if director_end == -1:
-                    director_end = len(combined_text)
+        stream = None
+        try:
+            stream = self.policy.execute(url, open_stream)
+            if stream.status != 200:
+                self.checkpoint.record_failure(start, stream.status, f"HTTP {stream.status}")
+                print(f"获取页面失败: HTTP {stream.status}")
+                return None
             
-            director_text = combined_text[director_start:director_end].strip()
-            if director_text:
-                # 清理导演信息
-                directors = [d.strip() for d in director_text.split('/') if d.strip()]
-                movie['director'] = '/'.join(directors)
-        
-        # 解析主演信息
-        if '主演:' in combined_text:
-            actor_start = combined_text.find('主演:') + 3
-            actor_end = len(combined_text)
+            digest = hashlib.sha1()
+            # 开启归档时才需要保留完整的页面
+            parts = [] if self.archive else None
             
-            # 找到主演信息的结束位置
-            for delimiter in ['年', '分钟', '类型', '剧情', '喜剧', '动作']:
-                temp_end = combined_text.find(delimiter, actor_start)
-                if temp_end != -1 and temp_end < actor_end:
-                    actor_end = temp_end
+            def chunks():
+                for chunk in stream:
+                    digest.update(chunk)
+                    if parts is not None:
+                        parts.append(chunk)
+                    yield chunk
             
-            # 查找年份作为结束标志
-            import re
-            year_match = re.search(r'\b(19|20)\d{2}\b', combined_text[actor_start:])
-            if year_match:
-                year_pos = actor_start + year_match.start()
-                if year_pos < actor_end:
-                    actor_end = year_pos
+            # 解析出一部就追加一部，不保留中间的字典
+            movies = MovieBatch.from_dicts(self.stream_parser.iter_movies(chunks()))
+            if parts is not None:
+                self.archive.append(url, stream.status, stream.headers, b''.join(parts))
+            return movies, digest.hexdigest()
             
-            actor_text = combined_text[actor_start:actor_end].strip()
-            if actor_text:
-                # 清理主演信息
-                actor_text = actor_text.rstrip('...')
-                actors = [a.strip() for a in actor_text.split('/') if a.strip()]
-                if actors:
-                    movie['actors'] = '/'.join(actors)
-        
-        # 解析年份、国家、类型等信息
-        for line in text_lines:
-            line = line.strip()
-            if not line or '导演:' in line or '主演:' in line:
-                continue
-                
-            if any(char.isdigit() for char in line):
-                # 这行包含数字，可能是年份、时长等信息
-                parts = [p.strip() for p in line.split('/') if p.strip()]
-                
-                for part in parts:
-                    # 年份（4位数字）
-                    if len(part) == 4 and part.isdigit():
-                        if 1900 <= int(part) <= 2030:
-                            movie['year'] = part
-                    
-                    # 时长（包含"分钟"）
-                    elif '分钟' in part:
-                        movie['duration'] = part
-                    
-                    # 国家（常见国家名）
-                    elif any(country in part for country in [
-                        '中国大陆', '美国', '英国', '法国', '德国', '日本', '韩国',
-                        '意大利', '西班牙', '加拿大', '澳大利亚', '中国香港', '中国台湾',
-                        '俄罗斯', '印度', '瑞典', '丹麦', '挪威', '芬兰', '荷兰', '比利时'
-                    ]):
-                        if movie['country']:
-                            movie['country'] += '/' + part
-                        else:
-                            movie['country'] = part
-                    
-                    # 类型（常见电影类型）
-                    elif any(genre in part for genre in [
-                        '剧情', '喜剧', '动作', '爱情', '科幻', '悬疑', '惊悚', '恐怖',
-                        '犯罪', '战争', '动画', '纪录片', '传记', '历史', '音乐', '家庭',
-                        '冒险', '奇幻', '西部', '运动', '短片'
-                    ]):
-                        if movie['genre']:
-                            movie['genre'] += ' ' + part
-                        else:
-                            movie['genre'] = part
+        except Exception as e:
+            self.checkpoint.record_failure(start, None, str(e))
+            print(f"获取页面失败: {e}")
+            return None
+        finally:
+            if stream is not None:
+                stream.close()
+    
+    def fetch_pages(self, starts, fetch=None):
+        """并发获取多个页面，按start顺序依次返回(start, fetch的结果)，fetch默认为fetch_response"""
+        fetch = fetch or self.fetch_response
+        # 最多提前提交两倍线程数的页面，调用方消费慢时不会把后面的页面全部下载到内存里
+        window = self.workers * 2
+        starts = iter(starts)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for start in starts:
+                pending.append((start, executor.submit(fetch, start)))
+                if len(pending) >= window:
+                    break
+            while pending:
+                # 按提交顺序返回结果，保证rank_num顺序不乱
+                start, future = pending.popleft()
+                yield start, future.result()
+                next_start = next(starts, None)
+                if next_start is not None:
+                    pending.append((next_start, executor.submit(fetch, next_start)))
+    
+    def parse_movies(self, html):
+        """解析电影信息，返回MovieBatch"""
+        return MovieBatch.from_dicts(self.parser.parse_movies(html))
     
     def save_movies(self, movies):
-        """保存电影数据到数据库"""
+        """保存电影数据到数据库，movies为MovieBatch或解析器产出的字典列表，返回成功保存的电影数"""
         if not movies:
             print("没有电影数据需要保存")
-            return
+            return 0
         
         try:
-            # 获取当前日期
-            today = datetime.now().strftime('%Y-%m-%d')
-            
-            # 清除今天的数据
-            delete_sql = "DELETE FROM douban_movies WHERE DATE(created_time) = %s"
-            self.db.execute(delete_sql, (today,))
-            print(f"已清除今天的历史数据")
-            
-            # 批量插入
+            if not isinstance(movies, MovieBatch):
+                movies = MovieBatch.from_dicts(movies)
             current_time = datetime.now()
-            success_count = 0
+            content_columns = MOVIE_COLUMNS + (MOVIE_TYPED_COLUMNS if self.relations else [])
+            # 按列直接生成参数元组，不再为每部电影拼一个字典
+            columns = content_columns + ['crawl_time', 'created_time', 'updated_time']
+            rows = movies.rows(content_columns, (current_time, current_time, current_time))
             
-            for movie in movies:
-                try:
-                    self.db.insert('douban_movies', {
-                        'rank_num': movie['rank_num'],
-                        'title': movie['title'],
-                        'title_en': movie['title_en'],
-                        'director': movie['director'],
-                        'actors': movie['actors'],
-                        'year': movie['year'],
-                        'country': movie['country'],
-                        'genre': movie['genre'],
-                        'rating': movie['rating'],
-                        'rating_count': movie['rating_count'],
-                        'duration': movie['duration'],
-                        'poster_url': movie['poster_url'],
-                        'summary': movie['summary'],
-                        'douban_id': movie['douban_id'],
-                        'douban_url': movie['douban_url'],
-                        'crawl_time': current_time,
-                        'created_time': current_time,
-                        'updated_time': current_time
-                    })
-                    success_count += 1
-                    
-                except Exception as e:
-                    print(f"保存电影 {movie.get('title', '未知')} 失败: {e}")
-                    continue
+            # 电影行、关联表和汇总表在同一个事务里写，看板不会读到只写了一半的页面
+            with self.db.transaction():
+                # 先锁住这些电影的旧值，写完后汇总表只加上新旧之差
+                before = self.stats.snapshot(movies.douban_id) if self.stats else None
+                if self.save_mode == 'replace':
+                    # 今天的旧数据在run开始时已经清除，关联表的行随之级联删除
+                    result = self.db.insert_rows('douban_movies', columns, rows, batch_size=self.batch_size)
+                    success_count = result['inserted']
+                else:
+                    # 按douban_id增量更新，内容哈希没变的行不会被改写
+                    update_columns = MOVIE_CONTENT_COLUMNS + (MOVIE_TYPED_COLUMNS if self.relations else [])
+                    result = self.db.upsert_rows('douban_movies', columns, rows, update_columns,
+                                                 batch_size=self.batch_size)
+                    success_count = result['written']
+                    # ON DUPLICATE KEY UPDATE 新插入计1行，更新计2行，未变化计0行
+                    print(f"数据库实际变更行数: {result['affected']}")
+                if self.relations:
+                    relation_stats = self.relations.sync(movies)
+                    print(f"关联表新增 {relation_stats['inserted']} 行，删除 {relation_stats['deleted']} 行")
+                if self.stats:
+                    failed = {failed['index'] for failed in result['failed']}
+                    self.stats.apply(before, movies, [index for index in range(len(movies)) if index not in failed])
+            for failed in result['failed']:
+                print(f"保存电影 {failed['row'].get('title', '未知')} 失败: {failed['error']}")
             
             print(f"成功保存 {success_count}/{len(movies)} 部电影数据")
+            return success_count
             
         except Exception as e:
             print(f"保存数据失败: {e}")
+            return 0
+    
+    def clear_today(self):
+        """清除今天的数据，用时间范围代替DATE(created_time)以便走索引"""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        where = "created_time >= %s AND created_time < %s"
+        params = (today, today + timedelta(days=1))
+        with self.db.transaction():
+            if self.stats:
+                # 删掉的电影同时从汇总表里减掉
+                self.stats.remove(where, params)
+            self.db.execute(f"DELETE FROM douban_movies WHERE {where}", params)
+        # 检查点里记着这些页已经保存过，不重置的话304和内容未变化的页面会被跳过，今天的数据就没了
+        self.checkpoint.reset_saved()
+        print(f"已清除今天的历史数据")
     
     def run(self):
-        """运行爬虫"""
-        print("开始爬取豆瓣电影Top100...")
+        """运行爬虫：页面来源 → 解析 → 逐页写入，每页解析完立即提交"""
+        print(f"开始爬取豆瓣电影Top{self.pages * 25}...")
         
-        all_movies = []
+        # 上次没有正常结束时从检查点续爬，跳过已经保存的页面
+        resumed = self.checkpoint.begin_run()
+        if resumed:
+            print("检测到未完成的爬取，从检查点继续")
         
-        # 只爬取前100部电影，共4页，每页25部电影
-        for page in range(4):
-            start = page * 25
-            print(f"\n正在爬取第 {page + 1}/4 页...")
-            
-            # 获取页面内容
-            html = self.fetch_page(start)
-            if not html:
+        # replace模式逐页写入前先一次性清掉今天的旧数据；续爬和只重试失败页时，
+        # 已经保存的页面这次不会再抓，清掉就丢了，所以不清
+        if self.save_mode == 'replace':
+            if resumed or self.retry_failed:
+                print("续爬或只重试失败页，保留今天已经保存的数据")
+            else:
+                self.clear_today()
+        
+        # 每页25部电影，多个页面并发获取，由令牌桶控制请求速率
+        starts = self.checkpoint.pending_starts([page * 25 for page in range(self.pages)], self.retry_failed)
+        print(f"本次需要抓取 {len(starts)}/{self.pages} 页")
+        
+        # parse_workers大于0时解析交给进程池，每个解析线程同时占用一个进程；流式模式不经过解析阶段，不建进程池
+        pool = ProcessPoolExecutor(max_workers=self.parse_workers) if not self.stream and self.parse_workers > 0 else None
+        try:
+            pipeline = CrawlPipeline(
+                # 流式模式在抓取线程里已经解析完，解析阶段直接透传
+                source=self.stream_source(starts) if self.stream else self.page_source(starts),
+                parse=(lambda page: page) if self.stream else (lambda page: self.parse_stage(page, pool)),
+                write=self.write_stage,
+                queue_size=self.queue_size,
+                parse_threads=max(1, self.parse_workers)
+            )
+            stats = pipeline.run()
+        finally:
+            if pool:
+                pool.shutdown()
+        
+        self.checkpoint.finish_run()
+        print(f"\n流水线统计: {stats}")
+        print(f"HTTP连接统计: {self.http.stats()}")
+        print(f"抓取策略统计: {self.policy.stats()}")
+        print("\n爬取完成！")
+    
+    def page_source(self, starts):
+        """页面来源阶段：产出需要解析的(page, start, html)，失败和未变化的页面直接跳过"""
+        for start, response in self.fetch_pages(starts):
+            page = start // 25
+            if not response:
                 print(f"第 {page + 1} 页获取失败，跳过")
                 continue
             
-            # 解析电影信息
-            movies = self.parse_movies(html)
-            if movies:
-                all_movies.extend(movies)
-                print(f"第 {page + 1} 页解析到 {len(movies)} 部电影")
-                
-                # 打印前几部电影的信息用于调试
-                if page == 0:
-                    for i, movie in enumerate(movies[:3]):
-                        print(f"电影{i+1}: {movie['title']} - 导演: {movie['director']} - 主演: {movie['actors']} - 评分: {movie['rating']}")
+            # 服务端返回304或页面内容和上次保存的一样，不用再解析和保存
+            if response.not_modified:
+                unchanged = self.checkpoint.record_fetch(start, 304, None)
             else:
-                print(f"第 {page + 1} 页没有解析到电影数据")
-            
-            # 延时避免请求过快
-            time.sleep(2)
-        
-        # 保存所有电影数据
-        if all_movies:
-            print(f"\n总共爬取到 {len(all_movies)} 部电影，开始保存到数据库...")
-            self.save_movies(all_movies)
+                unchanged = self.checkpoint.record_fetch(start, response.status, response.body)
+            if unchanged:
+                print(f"第 {page + 1} 页未变化，跳过解析和保存")
+                continue
+            yield page, start, response.text()
+    
+    def stream_source(self, starts):
+        """流式模式的页面来源：产出已经解析好的(page, start, movies)"""
+        for start, result in self.fetch_pages(starts, fetch=self.fetch_movies_stream):
+            page = start // 25
+            if not result:
+                print(f"第 {page + 1} 页获取失败，跳过")
+                continue
+            movies, body_hash = result
+            if self.checkpoint.record_fetch(start, 200, None, body_hash=body_hash):
+                print(f"第 {page + 1} 页未变化，跳过保存")
+                continue
+            yield page, start, movies
+    
+    def parse_stage(self, page_html, pool=None):
+        """解析阶段：把一页HTML解析成(page, start, movies)，有进程池时在子进程里解析"""
+        page, start, html = page_html
+        if pool is not None:
+            movies = pool.submit(parse_page_batch, html, self.engine).result()
         else:
-            print("\n没有爬取到任何电影数据")
+            movies = self.parse_movies(html)
+        return page, start, movies
+    
+    def write_stage(self, page_movies):
+        """写入阶段：每页的电影单独保存，解析完一页就提交一页"""
+        page, start, movies = page_movies
+        if not movies:
+            print(f"第 {page + 1} 页没有解析到电影数据")
+            return
+        print(f"第 {page + 1} 页解析到 {len(movies)} 部电影")
         
-        print("\n爬取完成！")
+        # 打印前几部电影的信息用于调试
+        if page == 0:
+            for i in range(min(3, len(movies))):
+                movie = movies[i]
+                print(f"电影{i+1}: {movie.title} - 导演: {'/'.join(movie.directors)} - 主演: {'/'.join(movie.actors)} - 评分: {movie.rating}")
+        
+        # 解析结果和上次保存的一样时不写数据库
+        digest = movies.digest()
+        if self.checkpoint.items_unchanged(start, digest):
+            print(f"第 {page + 1} 页解析结果未变化，跳过保存")
+            return
+        if self.save_movies(movies) == len(movies):
+            self.checkpoint.mark_saved(start, digest)
+    
+    def replay(self, since=None, until=None, workers=4, latest_only=True):
+        """回放归档的页面：不发请求，用当前的解析器重新解析后保存
+
+        since/until为YYYYMMDD格式的日期，latest_only时每个页面只回放最新的一次，
+        解析在进程池里进行，每个子进程用mmap按偏移读取归档记录
+        """
+        if not self.archive:
+            raise ValueError("没有配置页面归档目录(PAGE_ARCHIVE_DIR)")
+        entries = self.archive.entries(since, until, url_prefix=self.base_url)
+        if latest_only:
+            entries = PageArchive.latest(entries)
+        print(f"开始回放归档页面: {len(entries)} 页")
+        
+        if self.save_mode == 'replace':
+            self.clear_today()
+        
+        pages, saved = 0, 0
+        handler = partial(parse_archived_page, engine=self.engine)
+        for result in self.archive.replay(entries, handler, workers=workers):
+            pages += 1
+            print(f"回放 {result['timestamp']} {result['url']}: 解析到 {len(result['movies'])} 部电影")
+            saved += self.save_movies(result['movies'])
+        print(f"\n回放完成: {pages} 页，保存 {saved} 部电影")
     
     def close(self):
-        """关闭数据库连接"""
+        """关闭HTTP连接、检查点和数据库连接"""
+        if hasattr(self, 'http'):
+            self.http.close()
+        if hasattr(self, 'checkpoint'):
+            self.checkpoint.close()
         if hasattr(self, 'db'):
             self.db.close()
 
 if __name__ == '__main__':
-    spider = DoubanMovieSpider()
+    parser = argparse.ArgumentParser(description='豆瓣电影Top250爬虫')
+    parser.add_argument('--replay', action='store_true', help='不发请求，回放归档的页面重新解析并保存')
+    parser.add_argument('--since', help='回放的起始日期，YYYYMMDD')
+    parser.add_argument('--until', help='回放的结束日期，YYYYMMDD')
+    parser.add_argument('--workers', type=int, default=4, help='回放时的解析进程数')
+    parser.add_argument('--all', action='store_true', help='回放每一次归档，而不是每个页面只回放最新的一次')
+    parser.add_argument('--stream', action='store_true', help='流式抓取：边下载边解压边解析')
+    parser.add_argument('--rebuild-stats', action='store_true', help='按已有数据重新计算看板的汇总表')
+    args = parser.parse_args()
+    
+    spider = DoubanMovieSpider(stream=args.stream)
     try:
-        spider.run()
+        if args.rebuild_stats:
+            totals = MovieStats(spider.db).rebuild()
+            for table, counter in totals.items():
+                print(f"{table}: {dict(counter)}")
+        elif args.replay:
+            spider.replay(args.since, args.until, args.workers, latest_only=not args.all)
+        else:
+            spider.run()
     except KeyboardInterrupt:
         print("\n用户中断爬取")
     except Exception as e:
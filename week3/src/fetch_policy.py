@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import http.client
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+from rate_limiter import TokenBucket
+
+
+class CircuitOpenError(Exception):
+    """目标主机处于熔断状态，请求没有发出"""
+
+
+class RetryPolicy:
+    """重试策略：可重试的失败按指数退避加随机抖动重试"""
+
+    # 服务端过载或者开始限制我们时返回的状态码
+    RETRY_STATUS = {403, 429, 500, 502, 503, 504}
+    # 超时、连接被重置、协议错误等网络层异常
+    RETRY_ERRORS = (TimeoutError, ConnectionError, http.client.HTTPException, OSError)
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_retryable_status(self, status: int) -> bool:
+        """判断状态码是否需要重试"""
+        return status in self.RETRY_STATUS
+
+    def is_retryable_error(self, error: Exception) -> bool:
+        """判断异常是否需要重试"""
+        return isinstance(error, self.RETRY_ERRORS)
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """第attempt次重试前等待的秒数，服务端给了Retry-After时以它为下限"""
+        # full jitter：在[0, 上限]之间随机取值，避免多个线程同时醒来再次打满服务端
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.max_delay, float(retry_after)))
+        return delay
+
+
+class CircuitBreaker:
+    """按主机熔断：连续失败达到阈值后暂停请求，冷却后放一个探测请求"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # host -> {'failures': 连续失败次数, 'opened_at': 熔断开始时间, 'probing': 是否已放出探测请求}
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def allow(self, host: str) -> bool:
+        """判断现在能否向该主机发请求"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state['opened_at'] is None:
+                return True
+            if time.monotonic() - state['opened_at'] < self.reset_timeout:
+                return False
+            # 冷却结束进入半开状态，只放一个探测请求
+            if state['probing']:
+                return False
+            state['probing'] = True
+            return True
+
+    def record_success(self, host: str) -> None:
+        """请求成功，关闭熔断"""
+        with self._lock:
+            self._hosts[host] = {'failures': 0, 'opened_at': None, 'probing': False}
+
+    def record_failure(self, host: str) -> None:
+        """请求失败，连续失败达到阈值或探测请求失败时打开熔断"""
+        with self._lock:
+            state = self._hosts.setdefault(host, {'failures': 0, 'opened_at': None, 'probing': False})
+            state['failures'] += 1
+            if state['probing'] or (state['opened_at'] is None and state['failures'] >= self.failure_threshold):
+                state['opened_at'] = time.monotonic()
+                state['probing'] = False
+                self.opened += 1
+
+    def state(self, host: str) -> str:
+        """返回主机的熔断状态: closed, open, half_open"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state['opened_at'] is None:
+                return 'closed'
+            if time.monotonic() - state['opened_at'] < self.reset_timeout:
+                return 'open'
+            return 'half_open'
+
+
+class ConcurrencyLimiter:
+    """上限可以动态调整的并发限制"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """占用一个并发名额，超过上限时等待"""
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify()
+
+    def set_limit(self, limit: int) -> None:
+        """调整并发上限，上限变大时唤醒等待的线程"""
+        with self._cond:
+            self.limit = max(1, limit)
+            self._cond.notify_all()
+
+
+class AimdController:
+    """加性增、乘性减(AIMD)地调整请求速率和并发数
+
+    请求成功且延迟在目标以内时，速率每秒大约增加increase；
+    收到403/429、错误率超过error_threshold或者延迟超标时，速率乘以decrease，
+    冷却期内只减一次，避免一波失败把速率压到底。并发上限按 速率 × 平均延迟 估算(Little定律)。
+    """
+
+    def __init__(self, rate_limiter: TokenBucket, limiter: ConcurrencyLimiter, min_rate: float = 0.2,
+                 max_rate: float = 10.0, max_concurrency: int = 8, increase: float = 0.5,
+                 decrease: float = 0.5, latency_target: float = 2.0, error_threshold: float = 0.1,
+                 cooldown: float = 5.0):
+        self.rate_limiter = rate_limiter
+        self.limiter = limiter
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self._latency = None
+        self._error_rate = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool, throttled: bool = False) -> None:
+        """根据一次请求的结果调整速率和并发，throttled表示服务端明确要求降速(403/429)"""
+        with self._lock:
+            # 延迟和错误率都用指数滑动平均
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            self._error_rate = 0.9 * self._error_rate + 0.1 * (0.0 if ok else 1.0)
+            rate = self.rate_limiter.rate
+            now = time.monotonic()
+            if throttled or self._error_rate > self.error_threshold or self._latency > self.latency_target:
+                if now - self._last_decrease < self.cooldown:
+                    return
+                self._last_decrease = now
+                rate = max(self.min_rate, rate * self.decrease)
+            elif ok:
+                # 每秒大约成功rate次，每次加increase/rate，合计每秒加increase
+                rate = min(self.max_rate, rate + self.increase / rate)
+            else:
+                return
+            self.rate_limiter.set_rate(rate)
+            concurrency = math.ceil(rate * self._latency)
+            self.limiter.set_limit(min(self.max_concurrency, max(1, concurrency)))
+
+    def stats(self) -> Dict[str, Any]:
+        """返回当前速率、并发上限、平均延迟和错误率"""
+        with self._lock:
+            return {
+                'rate': round(self.rate_limiter.rate, 3),
+                'concurrency': self.limiter.limit,
+                'latency_ms': round((self._latency or 0.0) * 1000, 1),
+                'error_rate': round(self._error_rate, 3)
+            }
+
+
+class FetchPolicy:
+    """抓取策略：熔断 → 并发限制 → 令牌桶限速 → 请求，失败时退避重试，结果反馈给AIMD"""
+
+    def __init__(self, rate_limiter: TokenBucket, max_concurrency: int = 4,
+                 retry: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None,
+                 max_rate: Optional[float] = None, latency_target: float = 2.0):
+        self.rate_limiter = rate_limiter
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+        self.aimd = AimdController(rate_limiter, self.limiter, max_rate=max_rate or rate_limiter.rate * 4,
+                                   max_concurrency=max_concurrency, latency_target=latency_target)
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'retries': 0, 'failures': 0, 'rejected': 0}
+
+    def _count(self, key):
+        """线程安全地累加统计项"""
+        with self._lock:
+            self._stats[key] += 1
+
+    def execute(self, url: str, request: Callable[[], Any]) -> Any:
+        """按策略执行request，返回响应；重试用尽后返回最后一次的响应或抛出最后一次的异常"""
+        host = urlsplit(url).hostname
+        for attempt in range(self.retry.max_retries + 1):
+            if not self.breaker.allow(host):
+                self._count('rejected')
+                raise CircuitOpenError(f"{host} 熔断中，暂停请求")
+
+            with self.limiter.slot():
+                self.rate_limiter.acquire()
+                start = time.monotonic()
+                response, error = None, None
+                try:
+                    response = request()
+                except Exception as e:
+                    error = e
+                latency = time.monotonic() - start
+            self._count('requests')
+
+            if error is None and not self.retry.is_retryable_status(response.status):
+                self.breaker.record_success(host)
+                self.aimd.record(latency, True)
+                return response
+
+            self.breaker.record_failure(host)
+            self.aimd.record(latency, False, throttled=response is not None and response.status in (403, 429))
+            if error is not None and not self.retry.is_retryable_error(error):
+                self._count('failures')
+                raise error
+            if attempt == self.retry.max_retries:
+                self._count('failures')
+                if error is not None:
+                    raise error
+                return response
+
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            delay = self.retry.backoff(attempt, retry_after)
+            reason = error if error is not None else f"HTTP {response.status}"
+            print(f"请求失败({reason})，{delay:.1f}秒后第{attempt + 1}次重试: {url}")
+            self._count('retries')
+            time.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回请求、重试、熔断统计和AIMD的当前状态"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['circuit_opened'] = self.breaker.opened
+        stats.update(self.aimd.stats())
+        return stats
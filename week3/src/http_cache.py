@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+
+class CacheMissError(Exception):
+    """离线模式下缓存中没有对应的页面"""
+
+
+class HttpCache:
+    """磁盘HTTP缓存，保存响应体及其ETag/Last-Modified，用于条件请求"""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 100 * 1024 * 1024, max_age: float = 7 * 24 * 3600):
+        """max_bytes为缓存总大小上限，max_age为条目最长保留秒数"""
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        """返回url对应的(响应体文件, 元数据文件)路径"""
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, name)
+        return base + '.body', base + '.json'
+
+    @staticmethod
+    def _write_atomic(path, data):
+        """先写临时文件再替换，避免并发读到写了一半的文件"""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """读取缓存条目，返回元数据和body，不存在或已过期返回None"""
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(body_path, 'rb') as f:
+                entry['body'] = f.read()
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry['stored_at'] > self.max_age:
+            return None
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry: Dict[str, Any]) -> Dict[str, str]:
+        """根据缓存条目生成条件请求头"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url: str, body: bytes, headers) -> None:
+        """保存响应体和校验头，写入后按大小和时间淘汰旧条目"""
+        body_path, meta_path = self._paths(url)
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'size': len(body),
+            'stored_at': time.time()
+        }
+        # 先写body再写元数据，元数据存在就说明body完整
+        self._write_atomic(body_path, body)
+        self._write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+        self.evict()
+
+    def touch(self, url: str) -> None:
+        """收到304后刷新条目的保存时间"""
+        _, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        meta['stored_at'] = time.time()
+        self._write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    def evict(self) -> int:
+        """删除过期条目，总大小超限时从最旧的开始删，返回删除的条目数"""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.json'):
+                    continue
+                meta_path = os.path.join(self.cache_dir, name)
+                try:
+                    with open(meta_path, 'r', encoding='utf-8') as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                entries.append((meta['stored_at'], meta['size'], meta_path[:-len('.json')]))
+
+            entries.sort()
+            now = time.time()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for stored_at, size, base in entries:
+                if now - stored_at <= self.max_age and total <= self.max_bytes:
+                    break
+                for path in (base + '.json', base + '.body'):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+                removed += 1
+            return removed
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import http.client
+import json
+import socket
+import ssl
+import threading
+import time
+import zlib
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+from http_cache import HttpCache, CacheMissError
+
+
+class HttpResponse:
+    """HTTP响应，body已按Content-Encoding解压"""
+
+    def __init__(self, url, status, headers, body, timing, reused, from_cache=False, not_modified=False):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        # 各阶段耗时(毫秒): dns, connect, tls, ttfb, body, total
+        self.timing = timing
+        # 是否复用了已有的keep-alive连接
+        self.reused = reused
+        # 响应体是否来自本地缓存，not_modified表示服务端返回了304
+        self.from_cache = from_cache
+        self.not_modified = not_modified
+
+    def text(self, encoding='utf-8') -> str:
+        """按指定编码解码响应体"""
+        return self.body.decode(encoding)
+
+    def json(self) -> Any:
+        """把响应体解析为JSON"""
+        return json.loads(self.text())
+
+
+class HttpStream:
+    """流式响应：迭代时按块读取响应体，每块到达后立即解压，产出解压后的数据
+
+    读完后连接放回连接池；中途close的连接上还有没读完的数据，只能直接关闭
+    """
+
+    def __init__(self, client, key, conn, response, url, timing, reused, chunk_size):
+        self.url = url
+        self.status = response.status
+        self.headers = response.headers
+        self.timing = timing
+        self.reused = reused
+        self.from_cache = False
+        self.not_modified = False
+        self.bytes_received = 0
+        self._client = client
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._chunk_size = chunk_size
+        self._encoding = (response.getheader('Content-Encoding') or '').lower()
+        self._done = False
+
+    def _decompressor(self, first_chunk):
+        """按Content-Encoding和第一块数据创建增量解压器，不需要解压时返回None"""
+        if self._encoding == 'gzip':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self._encoding == 'deflate':
+            # 带zlib头的deflate第一个字节低4位是8，且前两个字节组成的数能被31整除
+            zlib_header = len(first_chunk) >= 2 and first_chunk[0] & 0x0F == 8 \
+                and (first_chunk[0] * 256 + first_chunk[1]) % 31 == 0
+            return zlib.decompressobj(zlib.MAX_WBITS if zlib_header else -zlib.MAX_WBITS)
+        return None
+
+    def __iter__(self):
+        """依次产出解压后的数据块"""
+        start = time.perf_counter()
+        decompressor = None
+        try:
+            while True:
+                # read1有多少数据就先返回多少，不等凑满chunk_size，让解析尽早开始
+                chunk = self._response.read1(self._chunk_size)
+                if not chunk:
+                    break
+                self.bytes_received += len(chunk)
+                if decompressor is None and self.bytes_received == len(chunk):
+                    decompressor = self._decompressor(chunk)
+                data = decompressor.decompress(chunk) if decompressor else chunk
+                if data:
+                    yield data
+            if decompressor:
+                tail = decompressor.flush()
+                if tail:
+                    yield tail
+            # read1读到Content-Length为止不会自动把响应标记为结束，不关掉的话连接不能发下一个请求
+            self._response.close()
+        except (OSError, http.client.HTTPException, zlib.error):
+            self.close()
+            self._client._record_error()
+            raise
+        self.timing['body'] = (time.perf_counter() - start) * 1000
+        self._done = True
+        self._client._finish(self._key, self._conn, self._response, self.timing, self.reused, self.bytes_received)
+
+    def read(self) -> bytes:
+        """读出全部响应体，和HttpResponse.body一样是解压后的内容"""
+        return b''.join(self)
+
+    def close(self):
+        """放弃没读完的响应体"""
+        if not self._done:
+            self._done = True
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HttpClient:
+    """按主机维护keep-alive连接池的HTTP客户端，线程安全"""
+
+    # 复用的连接可能已被服务端关闭，遇到这些异常时换新连接重试一次
+    STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                    ConnectionResetError, BrokenPipeError)
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None, timeout: float = 10,
+                 ssl_context: Optional[ssl.SSLContext] = None, max_idle_per_host: int = 8,
+                 cache: Optional[HttpCache] = None, cache_only: bool = False):
+        """headers为每个请求默认带上的请求头，cache_only为True时只读缓存不发请求"""
+        self.headers = dict(headers or {})
+        self.headers.setdefault('Accept-Encoding', 'gzip, deflate')
+        self.timeout = timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.max_idle_per_host = max_idle_per_host
+        self.cache = cache
+        self.cache_only = cache_only
+        # (scheme, host, port) -> 空闲连接列表
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'new_connections': 0,
+            'reused_connections': 0,
+            'errors': 0,
+            'not_modified': 0,
+            'cache_only_hits': 0,
+            'bytes_received': 0,
+            'dns_ms': 0.0,
+            'connect_ms': 0.0,
+            'tls_ms': 0.0,
+            'ttfb_ms': 0.0,
+            'body_ms': 0.0
+        }
+
+    def _open(self, scheme, host, port, timing):
+        """建立新连接，分别记录DNS解析、TCP连接和TLS握手耗时"""
+        start = time.perf_counter()
+        family, socktype, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        resolved = time.perf_counter()
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(address)
+            connected = time.perf_counter()
+            if scheme == 'https':
+                sock = self.ssl_context.wrap_socket(sock, server_hostname=host)
+                conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+            else:
+                conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        except OSError:
+            sock.close()
+            raise
+        finished = time.perf_counter()
+        # 直接把建好的socket交给连接对象，http.client发现sock不为空就不会再自己连接
+        conn.sock = sock
+        timing['dns'] = (resolved - start) * 1000
+        timing['connect'] = (connected - resolved) * 1000
+        timing['tls'] = (finished - connected) * 1000
+        return conn
+
+    def _checkout(self, key, timing):
+        """取一个空闲连接，没有则新建，返回(连接, 是否复用)"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._open(*key, timing), False
+
+    def _checkin(self, key, conn):
+        """把连接放回空闲列表，超过上限的直接关闭"""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    @staticmethod
+    def _decode(body, encoding):
+        """按Content-Encoding解压响应体"""
+        encoding = (encoding or '').lower()
+        if encoding == 'gzip':
+            return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        if encoding == 'deflate':
+            # 有的服务端发的是不带zlib头的原始deflate流
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+        return body
+
+    def _send(self, method, url, headers, body):
+        """发送请求并读到响应头，返回(连接键, 连接, 响应, 各阶段耗时, 是否复用)"""
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        request_headers = dict(self.headers)
+        request_headers.update(headers or {})
+
+        for attempt in range(2):
+            timing = {'dns': 0.0, 'connect': 0.0, 'tls': 0.0}
+            try:
+                conn, reused = self._checkout(key, timing)
+            except OSError:
+                self._record_error()
+                raise
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=request_headers)
+                response = conn.getresponse()
+                timing['ttfb'] = (time.perf_counter() - start) * 1000
+            except self.STALE_ERRORS:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                self._record_error()
+                raise
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                self._record_error()
+                raise
+            return key, conn, response, timing, reused
+
+    def _finish(self, key, conn, response, timing, reused, received):
+        """响应体读完后归还连接并累计统计"""
+        timing['total'] = sum(timing.values())
+        if response.will_close:
+            conn.close()
+        else:
+            self._checkin(key, conn)
+
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['reused_connections' if reused else 'new_connections'] += 1
+            self._stats['bytes_received'] += received
+            for phase in ('dns', 'connect', 'tls', 'ttfb', 'body'):
+                self._stats[f'{phase}_ms'] += timing[phase]
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                body: Optional[bytes] = None) -> HttpResponse:
+        """发送请求并读取完整响应"""
+        key, conn, response, timing, reused = self._send(method, url, headers, body)
+        start = time.perf_counter()
+        try:
+            raw = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._record_error()
+            raise
+        timing['body'] = (time.perf_counter() - start) * 1000
+        self._finish(key, conn, response, timing, reused, len(raw))
+
+        content = self._decode(raw, response.getheader('Content-Encoding'))
+        return HttpResponse(url, response.status, response.headers, content, timing, reused)
+
+    def stream(self, url: str, headers: Optional[Dict[str, str]] = None, chunk_size: int = 16 * 1024) -> 'HttpStream':
+        """发送GET请求，只读到响应头，响应体由返回的HttpStream边读边解压
+
+        不经过磁盘缓存，调用方必须把响应体读完或者调用close
+        """
+        key, conn, response, timing, reused = self._send('GET', url, headers, None)
+        return HttpStream(self, key, conn, response, url, timing, reused, chunk_size)
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> HttpResponse:
+        """发送GET请求，配置了缓存时带上条件请求头，304时返回缓存的响应体"""
+        if self.cache is None:
+            return self.request('GET', url, headers=headers)
+
+        entry = self.cache.get(url)
+        if self.cache_only:
+            if entry is None:
+                raise CacheMissError(f"缓存中没有该页面: {url}")
+            with self._lock:
+                self._stats['cache_only_hits'] += 1
+            return HttpResponse(url, 200, {}, entry['body'], {}, False, from_cache=True)
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            request_headers.update(self.cache.conditional_headers(entry))
+        response = self.request('GET', url, headers=request_headers)
+
+        if response.status == 304 and entry is not None:
+            self.cache.touch(url)
+            with self._lock:
+                self._stats['not_modified'] += 1
+            return HttpResponse(url, 200, response.headers, entry['body'], response.timing, response.reused,
+                                from_cache=True, not_modified=True)
+        if response.status == 200:
+            self.cache.put(url, response.body, response.headers)
+        return response
+
+    def _record_error(self):
+        """记录一次失败请求"""
+        with self._lock:
+            self._stats['errors'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回请求数、连接复用情况和各阶段累计耗时"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle_connections'] = sum(len(idle) for idle in self._idle.values())
+        connections = stats['new_connections'] + stats['reused_connections']
+        stats['reuse_ratio'] = round(stats['reused_connections'] / connections, 3) if connections else 0.0
+        for phase in ('dns', 'connect', 'tls', 'ttfb', 'body'):
+            stats[f'{phase}_ms'] = round(stats[f'{phase}_ms'], 3)
+        return stats
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
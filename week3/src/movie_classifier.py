@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+from typing import List, Optional, Tuple
+
+YEAR = 'year'
+DURATION = 'duration'
+COUNTRY = 'country'
+GENRE = 'genre'
+
+DEFAULT_VOCAB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'movie_vocab.json')
+
+
+class MovieClassifier:
+    """电影信息片段分类器，把"1994 / 美国 / 犯罪 剧情"这类片段标成年份、时长、国家或类型"""
+
+    def __init__(self, countries: List[str], genres: List[str], year_range: Tuple[int, int] = (1900, 2030)):
+        """词表在构造时编译成多选正则，同一片段命中多类词时按 时长 > 国家 > 类型 的顺序取"""
+        self.countries = list(countries)
+        self.genres = list(genres)
+        self.min_year, self.max_year = year_range
+        self._country_pattern = re.compile(self._alternation(self.countries))
+        self._pattern = re.compile('|'.join([
+            f'(?P<{DURATION}>分钟)',
+            f'(?P<{COUNTRY}>{self._country_pattern.pattern})',
+            f'(?P<{GENRE}>{self._alternation(self.genres)})'
+        ]))
+
+    @staticmethod
+    def _alternation(words):
+        """长词放前面，避免被它的前缀抢先匹配"""
+        return '|'.join(re.escape(word) for word in sorted(set(words), key=len, reverse=True))
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_VOCAB_PATH) -> 'MovieClassifier':
+        """从JSON词表文件加载"""
+        with open(path, 'r', encoding='utf-8') as f:
+            vocab = json.load(f)
+        return cls(vocab['countries'], vocab['genres'], tuple(vocab.get('year_range', (1900, 2030))))
+
+    def classify(self, part: str) -> Optional[str]:
+        """返回片段的类别，不属于任何类别返回None"""
+        # 4位数字只可能是年份，超出范围的直接丢弃
+        if len(part) == 4 and part.isdigit():
+            return YEAR if self.min_year <= int(part) <= self.max_year else None
+        match = self._pattern.search(part)
+        if match is None:
+            return None
+        tag = match.lastgroup
+        # 最左边命中的词不一定优先级最高，只需再确认后面有没有更高优先级的词
+        if tag != DURATION and '分钟' in part:
+            return DURATION
+        if tag == GENRE and self._country_pattern.search(part, match.end()):
+            return COUNTRY
+        return tag
+
+    def tag_line(self, line: str) -> List[Tuple[str, Optional[str]]]:
+        """把一行按/切分，返回每个片段及其类别"""
+        return [(part, self.classify(part)) for part in (p.strip() for p in line.split('/')) if part]
+
+
+# 导入时按默认词表编译一次，所有解析调用共用
+DEFAULT_CLASSIFIER = MovieClassifier.from_file(os.getenv('MOVIE_VOCAB_PATH', DEFAULT_VOCAB_PATH))
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+from datetime import datetime
+from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
+from movie_classifier import DEFAULT_CLASSIFIER, YEAR, DURATION, COUNTRY, GENRE
+from movie_record import MovieBatch
+
+# 主演信息后面的年份，用来确定主演列表在哪里结束
+YEAR_PATTERN = re.compile(r'\b(19|20)\d{2}\b')
+
+
+def parse_movie_details(movie, full_text):
+    """从信息段落的文本中解析导演、主演、年份、国家、类型等信息"""
+    full_text = full_text.strip()
+    
+    # 按行分割处理
+    text_lines = full_text.split('\n')
+    
+    # 合并所有文本用于更好的解析
+    combined_text = ' '.join([line.strip() for line in text_lines if line.strip()])
+    
+    # 解析导演信息
+    if '导演:' in combined_text:
+        director_start = combined_text.find('导演:') + 3
+        director_end = combined_text.find('主演:', director_start)
+        if director_end == -1:
+            # 如果没有主演，找到下一个可能的分隔符
+            for delimiter in ['年', '分钟', '类型']:
+                temp_end = combined_text.find(delimiter, director_start)
+                if temp_end != -1:
+                    director_end = temp_end
+                    break
+            if director_end == -1:
+                director_end = len(combined_text)
+        
+        director_text = combined_text[director_start:director_end].strip()
+        if director_text:
+            # 清理导演信息
+            directors = [d.strip() for d in director_text.split('/') if d.strip()]
+            movie['director'] = '/'.join(directors)
+    
+    # 解析主演信息
+    if '主演:' in combined_text:
+        actor_start = combined_text.find('主演:') + 3
+        actor_end = len(combined_text)
+        
+        # 找到主演信息的结束位置
+        for delimiter in ['年', '分钟', '类型', '剧情', '喜剧', '动作']:
+            temp_end = combined_text.find(delimiter, actor_start)
+            if temp_end != -1 and temp_end < actor_end:
+                actor_end = temp_end
+        
+        # 查找年份作为结束标志
+        year_match = YEAR_PATTERN.search(combined_text, actor_start)
+        if year_match:
+            year_pos = year_match.start()
+            if year_pos < actor_end:
+                actor_end = year_pos
+        
+        actor_text = combined_text[actor_start:actor_end].strip()
+        if actor_text:
+            # 清理主演信息
+            actor_text = actor_text.rstrip('...')
+            actors = [a.strip() for a in actor_text.split('/') if a.strip()]
+            if actors:
+                movie['actors'] = '/'.join(actors)
+    
+    # 解析年份、国家、类型等信息
+    for line in text_lines:
+        line = line.strip()
+        if not line or '导演:' in line or '主演:' in line:
+            continue
+            
+        if any(char.isdigit() for char in line):
+            # 这行包含数字，可能是年份、时长等信息，每个片段由预编译的分类器一次打标
+            for part, tag in DEFAULT_CLASSIFIER.tag_line(line):
+                if tag == YEAR:
+                    movie['year'] = part
+                elif tag == DURATION:
+                    movie['duration'] = part
+                elif tag == COUNTRY:
+                    if movie['country']:
+                        movie['country'] += '/' + part
+                    else:
+                        movie['country'] = part
+                elif tag == GENRE:
+                    if movie['genre']:
+                        movie['genre'] += ' ' + part
+                    else:
+                        movie['genre'] = part
+
+
+class SoupMovieParser:
+    """BeautifulSoup解析引擎"""
+    
+    def parse_movies(self, html):
+        """解析电影信息"""
+        if not html:
+            return []
+            
+        soup = BeautifulSoup(html, 'lxml')
+        movies = []
+        
+        # 查找所有电影条目
+        movie_items = soup.find_all('div', class_='item')
+        
+        for item in movie_items:
+            try:
+                movie = self._extract_movie_info(item)
+                if movie:
+                    movies.append(movie)
+            except Exception as e:
+                print(f"解析电影信息失败: {e}")
+                continue
+                
+        return movies
+    
+    def _extract_movie_info(self, item):
+        """提取单个电影信息"""
+        movie = {
+            'rank_num': 0, 'title': '', 'title_en': '', 'director': '',
+            'actors': '', 'year': '', 'country': '', 'genre': '',
+            'rating': 0.0, 'rating_count': 0, 'duration': '',
+            'poster_url': '', 'summary': '', 'douban_id': '',
+            'douban_url': '', 'crawl_time': '', 'created_time': '',
+            'updated_time': ''
+        }
+        
+        # 排名 - 使用find方法
+        rank_elem = item.find('em')
+        if rank_elem:
+            movie['rank_num'] = int(rank_elem.get_text().strip())
+        
+        # 链接和豆瓣ID - 使用find方法查找a标签
+        link_elem = item.find('a')
+        if link_elem and link_elem.get('href'):
+            href = link_elem.get('href')
+            movie['douban_url'] = href
+            # 提取豆瓣ID
+            if '/subject/' in href:
+                movie['douban_id'] = href.split('/subject/')[1].rstrip('/')
+        
+        # 海报 - 使用find方法查找img标签
+        img_elem = item.find('img')
+        if img_elem:
+            movie['poster_url'] = img_elem.get('src', '')
+        
+        # 标题 - 使用find_all方法查找所有title类的span
+        title_elems = item.find_all('span', class_='title')
+        if title_elems:
+            # 第一个span是中文标题
+            movie['title'] = title_elems[0].get_text().strip()
+            # 第二个span是英文标题（如果存在）
+            if len(title_elems) > 1:
+                en_title = title_elems[1].get_text().strip()
+                # 移除开头的斜杠和空格
+                movie['title_en'] = en_title.lstrip('/ ').strip()
+        
+        # 电影详细信息 - 查找bd div下的第一个p标签
+        bd_div = item.find('div', class_='bd')
+        if bd_div:
+            info_p = bd_div.find('p')
+            if info_p:
+                # 获取p标签的所有文本内容
+                self._parse_movie_details_with_soup(movie, info_p)
+        
+        # 评分 - 使用find方法查找rating_num类的span
+        rating_elem = item.find('span', class_='rating_num')
+        if rating_elem:
+            try:
+                movie['rating'] = float(rating_elem.get_text().strip())
+            except ValueError:
+                movie['rating'] = 0.0
+        
+        # 评分人数 - 查找包含"人评价"的span
+        rating_spans = item.find_all('span')
+        for span in rating_spans:
+            text = span.get_text().strip()
+            if '人评价' in text:
+                # 提取数字部分
+                number_text = text.replace('人评价', '').strip()
+                try:
+                    movie['rating_count'] = int(number_text)
+                except ValueError:
+                    movie['rating_count'] = 0
+                break
+        
+        # 简介 - 使用find方法查找inq类的span
+        quote_elem = item.find('span', class_='inq')
+        if quote_elem:
+            movie['summary'] = quote_elem.get_text().strip()
+        
+        # 设置时间戳
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        movie['crawl_time'] = current_time
+        movie['created_time'] = current_time
+        movie['updated_time'] = current_time
+        
+        return movie
+    
+    def _parse_movie_details_with_soup(self, movie, info_p):
+        """使用BeautifulSoup API解析电影详细信息"""
+        # 获取p标签内的所有文本内容
+        parse_movie_details(movie, info_p.get_text())
+
+
+def _class_xpath(tag, class_name):
+    """按class匹配元素的XPath，效果和BeautifulSoup的class_参数一样"""
+    return f".//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+class LxmlMovieParser:
+    """lxml解析引擎，在lxml.html树上直接执行预编译的XPath，结果与SoupMovieParser一致"""
+    
+    # XPath只编译一次，所有页面共用
+    _items = etree.XPath(_class_xpath('div', 'item'))
+    _rank = etree.XPath('(.//em)[1]')
+    _link = etree.XPath('(.//a)[1]/@href')
+    _poster = etree.XPath('(.//img)[1]')
+    _titles = etree.XPath(_class_xpath('span', 'title'))
+    _info_p = etree.XPath(f"(({_class_xpath('div', 'bd')})[1]//p)[1]")
+    _rating = etree.XPath(f"({_class_xpath('span', 'rating_num')})[1]")
+    _rating_count = etree.XPath("(.//span[contains(., '人评价')])[1]")
+    _quote = etree.XPath(f"({_class_xpath('span', 'inq')})[1]")
+    
+    def parse_movies(self, html):
+        """解析电影信息"""
+        if not html:
+            return []
+        
+        tree = lxml_html.document_fromstring(html)
+        movies = []
+        
+        for item in self._items(tree):
+            try:
+                movie = self._extract_movie_info(item)
+                if movie:
+                    movies.append(movie)
+            except Exception as e:
+                print(f"解析电影信息失败: {e}")
+                continue
+        
+        return movies
+    
+    def iter_movies(self, chunks, encoding='utf-8'):
+        """增量解析：边接收HTML数据块边解析，每个div.item结束时立即产出这部电影
+        
+        chunks是解压后的字节块，解析完的条目会从树上删掉，内存占用和页面大小无关
+        """
+        parser = etree.HTMLPullParser(events=('end',), tag='div', encoding=encoding)
+        # 让增量解析器生成lxml.html的元素，和parse_movies用同一套XPath和text_content
+        parser.set_element_class_lookup(lxml_html.HtmlElementClassLookup())
+        
+        def ready_movies():
+            for _, element in parser.read_events():
+                if 'item' not in (element.get('class') or '').split():
+                    continue
+                try:
+                    movie = self._extract_movie_info(element)
+                    if movie:
+                        yield movie
+                except Exception as e:
+                    print(f"解析电影信息失败: {e}")
+                # 已经解析完的条目和它前面的兄弟节点都删掉
+                element.clear(keep_tail=True)
+                holder = element.getparent()
+                while holder is not None and holder.getprevious() is not None:
+                    del holder.getparent()[0]
+        
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from ready_movies()
+        parser.close()
+        yield from ready_movies()
+    
+    def _extract_movie_info(self, item):
+        """提取单个电影信息"""
+        movie = {
+            'rank_num': 0, 'title': '', 'title_en': '', 'director': '',
+            'actors': '', 'year': '', 'country': '', 'genre': '',
+            'rating': 0.0, 'rating_count': 0, 'duration': '',
+            'poster_url': '', 'summary': '', 'douban_id': '',
+            'douban_url': '', 'crawl_time': '', 'created_time': '',
+            'updated_time': ''
+        }
+        
+        rank_elems = self._rank(item)
+        if rank_elems:
+            movie['rank_num'] = int(rank_elems[0].text_content().strip())
+        
+        hrefs = self._link(item)
+        if hrefs and hrefs[0]:
+            href = str(hrefs[0])
+            movie['douban_url'] = href
+            if '/subject/' in href:
+                movie['douban_id'] = href.split('/subject/')[1].rstrip('/')
+        
+        img_elems = self._poster(item)
+        if img_elems:
+            movie['poster_url'] = img_elems[0].get('src', '')
+        
+        title_elems = self._titles(item)
+        if title_elems:
+            movie['title'] = title_elems[0].text_content().strip()
+            if len(title_elems) > 1:
+                en_title = title_elems[1].text_content().strip()
+                movie['title_en'] = en_title.lstrip('/ ').strip()
+        
+        info_elems = self._info_p(item)
+        if info_elems:
+            parse_movie_details(movie, info_elems[0].text_content())
+        
+        rating_elems = self._rating(item)
+        if rating_elems:
+            try:
+                movie['rating'] = float(rating_elems[0].text_content().strip())
+            except ValueError:
+                movie['rating'] = 0.0
+        
+        count_elems = self._rating_count(item)
+        if count_elems:
+            number_text = count_elems[0].text_content().strip().replace('人评价', '').strip()
+            try:
+                movie['rating_count'] = int(number_text)
+            except ValueError:
+                movie['rating_count'] = 0
+        
+        quote_elems = self._quote(item)
+        if quote_elems:
+            movie['summary'] = quote_elems[0].text_content().strip()
+        
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        movie['crawl_time'] = current_time
+        movie['created_time'] = current_time
+        movie['updated_time'] = current_time
+        
+        return movie
+
+
+# 可选的解析引擎
+PARSERS = {
+    'soup': SoupMovieParser,
+    'lxml': LxmlMovieParser
+}
+
+
+def get_parser(engine='soup'):
+    """按名称创建解析引擎"""
+    if engine not in PARSERS:
+        raise ValueError(f"未知的解析引擎: {engine}，可选: {', '.join(PARSERS)}")
+    return PARSERS[engine]()
+
+
+# 每个进程里缓存的解析引擎实例，进程池中的子进程各自创建一次
+_parser_cache = {}
+
+
+def parse_page(html, engine='soup'):
+    """解析一页HTML，模块级函数，可以直接提交给进程池"""
+    if engine not in _parser_cache:
+        _parser_cache[engine] = get_parser(engine)
+    return _parser_cache[engine].parse_movies(html)
+
+
+def parse_page_batch(html, engine='soup'):
+    """解析一页HTML并转成MovieBatch，跨进程传回时比字典列表小得多"""
+    return MovieBatch.from_dicts(parse_page(html, engine))
+
+
+def parse_archived_page(record, engine='soup'):
+    """解析一条归档的页面记录，供归档回放在子进程里调用"""
+    return {
+        'url': record['url'],
+        'timestamp': record['timestamp'],
+        'movies': parse_page_batch(record['body'].decode('utf-8'), engine)
+    }
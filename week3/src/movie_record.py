@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import re
+import sys
+from array import array
+from itertools import repeat
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MINUTES_PATTERN = re.compile(r'(\d+)\s*分钟')
+# 详情页地址的固定格式，符合这个格式的地址不单独存
+SUBJECT_URL = 'https://movie.douban.com/subject/{}/'
+
+# MovieBatch.rows默认输出的列，和douban_movies的列名一致
+MOVIE_COLUMNS = [
+    'rank_num', 'title', 'title_en', 'director', 'actors', 'year', 'country',
+    'genre', 'rating', 'rating_count', 'duration', 'poster_url', 'summary',
+    'douban_id', 'douban_url'
+]
+
+
+def _split(text: str, sep: str = '/') -> Tuple[str, ...]:
+    """把"a/b"这样的字段拆成元组，国家、类型这类取值有限的字符串驻留后所有电影共用一份"""
+    return tuple(sys.intern(part.strip()) for part in text.split(sep) if part.strip()) if text else ()
+
+
+def split_countries(text: str) -> Tuple[str, ...]:
+    """拆分国家字段：豆瓣上多个国家之间是空格，分类器拼接不同片段时用的是/"""
+    return _split(text.replace('/', ' '), ' ') if text else ()
+
+
+def _to_int(text: Any) -> Optional[int]:
+    """转成整数，空值或格式不对返回None"""
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _year_text(year: Optional[int]) -> str:
+    return '' if year is None else str(year)
+
+
+def _duration_text(minutes: Optional[int]) -> str:
+    return '' if minutes is None else f'{minutes}分钟'
+
+
+# 由拆分后的字段拼回数据库里的字符串：列名 -> (Movie的字段, 拼接函数)。
+# 拼回的结果和原文不同时(如"142分钟(中国大陆)"、分类器用/拼接的国家)原文另存，写库的内容和解析器产出的完全一致
+TEXT_COLUMNS = {
+    'director': ('directors', '/'.join),
+    'actors': ('actors', '/'.join),
+    'country': ('countries', ' '.join),
+    'genre': ('genres', ' '.join),
+    'year': ('year', _year_text),
+    'duration': ('minutes', _duration_text)
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Movie:
+    """一部电影，数值字段是真正的数值，多值字段是元组"""
+    rank_num: int
+    title: str
+    title_en: str
+    directors: Tuple[str, ...]
+    actors: Tuple[str, ...]
+    year: Optional[int]
+    countries: Tuple[str, ...]
+    genres: Tuple[str, ...]
+    rating: float
+    rating_count: int
+    minutes: Optional[int]
+    poster_url: str
+    summary: str
+    douban_id: str
+    douban_url: str
+    # 拼不回原文的列：((列名, 原文), ...)，大多数电影为空
+    texts: Tuple[Tuple[str, str], ...] = ()
+
+    @classmethod
+    def from_dict(cls, movie: Dict[str, Any]) -> 'Movie':
+        """从解析器产出的字典转换"""
+        match = MINUTES_PATTERN.search(movie.get('duration') or '')
+        fields = {
+            'directors': _split(movie['director']),
+            'actors': _split(movie['actors']),
+            'year': _to_int(movie['year']),
+            'countries': split_countries(movie['country']),
+            'genres': _split(movie['genre'], ' '),
+            'minutes': int(match.group(1)) if match else None
+        }
+        texts = tuple((column, movie.get(column) or '') for column, (field, join) in TEXT_COLUMNS.items()
+                      if join(fields[field]) != (movie.get(column) or ''))
+        return cls(
+            rank_num=int(movie['rank_num']),
+            title=movie['title'],
+            title_en=movie['title_en'],
+            rating=float(movie['rating']),
+            rating_count=int(movie['rating_count']),
+            poster_url=movie['poster_url'],
+            summary=movie['summary'],
+            douban_id=movie['douban_id'],
+            douban_url=movie['douban_url'],
+            texts=texts,
+            **fields
+        )
+
+
+class MovieBatch:
+    """按列存放的一批电影
+
+    数值列放在array里，字符串和元组列放在list里，不为每部电影建字典。
+    解析器往里追加，写库时直接按列生成参数元组；跨进程传递时也比字典列表小得多。
+    详情页地址能由douban_id拼出来时不单独存，多值字段拼不回原文时原文存在texts里。
+    """
+
+    # array里用-1表示没有值(年份、片长)
+    _MISSING = -1
+
+    def __init__(self):
+        self.rank_num = array('i')
+        self.year = array('i')
+        self.minutes = array('i')
+        self.rating = array('d')
+        self.rating_count = array('q')
+        self.title: List[str] = []
+        self.title_en: List[str] = []
+        self.directors: List[Tuple[str, ...]] = []
+        self.actors: List[Tuple[str, ...]] = []
+        self.countries: List[Tuple[str, ...]] = []
+        self.genres: List[Tuple[str, ...]] = []
+        self.poster_url: List[str] = []
+        self.summary: List[str] = []
+        self.douban_id: List[str] = []
+        self.douban_url: List[Optional[str]] = []
+        # 列名 -> {电影下标: 原文}
+        self.texts: Dict[str, Dict[int, str]] = {}
+
+    @classmethod
+    def from_dicts(cls, movies: Iterable[Dict[str, Any]]) -> 'MovieBatch':
+        """从解析器产出的字典转换，字典用完即丢"""
+        batch = cls()
+        for movie in movies:
+            batch.append(Movie.from_dict(movie))
+        return batch
+
+    def append(self, movie: Movie) -> None:
+        """追加一部电影"""
+        for column, text in movie.texts:
+            self.texts.setdefault(column, {})[len(self)] = text
+        self.rank_num.append(movie.rank_num)
+        self.year.append(self._MISSING if movie.year is None else movie.year)
+        self.minutes.append(self._MISSING if movie.minutes is None else movie.minutes)
+        self.rating.append(movie.rating)
+        self.rating_count.append(movie.rating_count)
+        self.title.append(movie.title)
+        self.title_en.append(movie.title_en)
+        self.directors.append(movie.directors)
+        self.actors.append(movie.actors)
+        self.countries.append(movie.countries)
+        self.genres.append(movie.genres)
+        self.poster_url.append(movie.poster_url)
+        self.summary.append(movie.summary)
+        self.douban_id.append(movie.douban_id)
+        self.douban_url.append(None if movie.douban_url == SUBJECT_URL.format(movie.douban_id) else movie.douban_url)
+
+    def __len__(self) -> int:
+        return len(self.rank_num)
+
+    def __getitem__(self, index: int) -> Movie:
+        year, minutes = self.year[index], self.minutes[index]
+        return Movie(
+            self.rank_num[index], self.title[index], self.title_en[index], self.directors[index],
+            self.actors[index], None if year == self._MISSING else year, self.countries[index],
+            self.genres[index], self.rating[index], self.rating_count[index],
+            None if minutes == self._MISSING else minutes, self.poster_url[index], self.summary[index],
+            self.douban_id[index], self._douban_url(index),
+            tuple((column, texts[index]) for column, texts in self.texts.items() if index in texts)
+        )
+
+    def __iter__(self) -> Iterator[Movie]:
+        return (self[index] for index in range(len(self)))
+
+    def _douban_url(self, index: int) -> str:
+        """第index部电影的详情页地址"""
+        url = self.douban_url[index]
+        return SUBJECT_URL.format(self.douban_id[index]) if url is None else url
+
+    def _values(self, column: str) -> Iterable[Any]:
+        """按数据库列名取一整列的值，不复制已有的列；多值字段拼回原文，release_year和duration_min是整数列"""
+        if column in ('director', 'actors', 'country', 'genre'):
+            values = map(TEXT_COLUMNS[column][1], getattr(self, TEXT_COLUMNS[column][0]))
+        elif column in ('year', 'duration'):
+            # 年份和片长的取值很少，每个值只转换一次
+            numbers = self.year if column == 'year' else self.minutes
+            text = TEXT_COLUMNS[column][1]
+            cache = {value: text(None if value == self._MISSING else value) for value in set(numbers)}
+            values = map(cache.__getitem__, numbers)
+        elif column == 'release_year':
+            return (None if value == self._MISSING else value for value in self.year)
+        elif column == 'duration_min':
+            return (None if value == self._MISSING else value for value in self.minutes)
+        elif column == 'douban_url':
+            return (SUBJECT_URL.format(douban_id) if url is None else url
+                    for url, douban_id in zip(self.douban_url, self.douban_id))
+        else:
+            return getattr(self, column)
+        texts = self.texts.get(column)
+        if not texts:
+            return values
+        values = list(values)
+        for index, text in texts.items():
+            values[index] = text
+        return values
+
+    def column(self, column: str) -> List[Any]:
+        """按数据库列名取出一整列，字符串列和解析器产出的原文一致"""
+        return list(self._values(column))
+
+    def rows(self, columns: Optional[List[str]] = None, extra: Tuple[Any, ...] = ()) -> List[Tuple[Any, ...]]:
+        """按columns的顺序生成写库用的参数元组，extra里的值(如时间戳)追加到每一行末尾；各列一次zip成行，不生成中间列表"""
+        values = [self._values(column) for column in columns or MOVIE_COLUMNS]
+        values += [repeat(value, len(self)) for value in extra]
+        return list(zip(*values))
+
+    def digest(self) -> str:
+        """整批内容的哈希，用于判断这一页的解析结果有没有变化"""
+        sha1 = hashlib.sha1()
+        for row in self.rows():
+            sha1.update('\x1f'.join(map(str, row)).encode('utf-8'))
+            sha1.update(b'\x1e')
+        return sha1.hexdigest()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from mysql_helper import MySqlHelper
+from movie_record import MovieBatch
+
+# 国家分组，按顺序取第一个命中的关键词，和原来看板按LIKE分组的规则一致
+COUNTRY_GROUPS = [
+    ('美国', ('美国',)),
+    ('中国', ('中国', '香港', '台湾')),
+    ('日本', ('日本',)),
+    ('英国', ('英国',)),
+    ('法国', ('法国',)),
+    ('意大利', ('意大利',)),
+    ('德国', ('德国',))
+]
+OTHER_COUNTRY_GROUP = '其他'
+GROUP_ORDER = [group for group, _ in COUNTRY_GROUPS] + [OTHER_COUNTRY_GROUP]
+
+# 关联表的列，前几列是主键，其余列(顺序)变化时先删后插
+JUNCTIONS = {
+    'movie_country': (['movie_id', 'country_id'], ['position']),
+    'movie_genre': (['movie_id', 'genre_id'], ['position']),
+    'movie_person': (['movie_id', 'role', 'person_id'], ['position'])
+}
+
+
+def country_group(name: str) -> str:
+    """国家所属的分组"""
+    for group, keywords in COUNTRY_GROUPS:
+        if any(keyword in name for keyword in keywords):
+            return group
+    return OTHER_COUNTRY_GROUP
+
+
+def primary_country_group(names: Iterable[str]) -> Optional[str]:
+    """电影在看板上只归入一个分组：取它的各个国家里排在COUNTRY_GROUPS最前面的分组，没有国家返回None"""
+    groups = {country_group(name) for name in names}
+    return min(groups, key=GROUP_ORDER.index) if groups else None
+
+
+def _placeholders(count: int, width: int = 1) -> str:
+    """生成IN列表的占位符，width大于1时是行构造器"""
+    item = '%s' if width == 1 else '(' + ', '.join(['%s'] * width) + ')'
+    return ', '.join([item] * count)
+
+
+class MovieRelations:
+    """把电影的国家、类型、导演和演员写进查找表和关联表
+
+    关联表按电影对比现有的行，只删除和插入有变化的部分，内容没变的电影不产生写操作。
+    查找表的id不在进程里缓存：外层事务回滚后新插入的id会作废，缓存下来会指向不存在的行。
+    """
+
+    def __init__(self, db: MySqlHelper):
+        self.db = db
+
+    def _lookup(self, table: str, names: Set[str],
+                extra: Optional[Tuple[str, Callable[[str], Any]]] = None) -> Dict[str, int]:
+        """返回名称到id的映射，不存在的名称先插入；extra为(列名, 由名称计算列值的函数)"""
+        if not names:
+            return {}
+        ids = self._ids(table, names)
+        missing = sorted(names - ids.keys())
+        if missing:
+            # 只插入还没有的名称：InnoDB上每行INSERT ... ON DUPLICATE KEY UPDATE都会用掉一个自增值，
+            # 每次同步都把所有名称写一遍的话，SMALLINT的id几百次爬取后就用完了。
+            # 并发的爬虫可能刚插入同一个名称，IGNORE跳过它，下面重新查出id
+            columns = ['name'] + ([extra[0]] if extra else [])
+            rows = [(name,) + ((extra[1](name),) if extra else ()) for name in missing]
+            self.db.execute(f"INSERT IGNORE INTO {table} ({', '.join(columns)}) "
+                            f"VALUES {_placeholders(len(rows), len(columns))}",
+                            tuple(value for row in rows for value in row))
+            ids.update(self._ids(table, set(missing)))
+        return ids
+
+    def _ids(self, table: str, names: Set[str]) -> Dict[str, int]:
+        """查出已经存在的名称的id"""
+        names = sorted(names)
+        result = self.db.fetch_all(f"SELECT id, name FROM {table} WHERE name IN ({_placeholders(len(names))})",
+                                   tuple(names))
+        return {row['name']: row['id'] for row in result}
+
+    def _movie_ids(self, douban_ids: List[str]) -> Dict[str, int]:
+        """豆瓣ID到douban_movies.id的映射"""
+        result = self.db.fetch_all(
+            f"SELECT id, douban_id FROM douban_movies WHERE douban_id IN ({_placeholders(len(douban_ids))})",
+            tuple(douban_ids))
+        return {row['douban_id']: row['id'] for row in result}
+
+    @staticmethod
+    def _add(rows: Dict[Tuple, Tuple], key: Tuple, values: Tuple) -> None:
+        """同一部电影里重复出现的名称只保留第一次的位置"""
+        rows.setdefault(key, key + values)
+
+    def wanted_rows(self, batch: MovieBatch, movie_ids: Dict[str, int], country_ids: Dict[str, int],
+                    genre_ids: Dict[str, int], person_ids: Dict[str, int]) -> Dict[str, Set[Tuple]]:
+        """按批次内容计算每张关联表应有的行"""
+        wanted = {table: {} for table in JUNCTIONS}
+        for index in range(len(batch)):
+            movie_id = movie_ids.get(batch.douban_id[index])
+            if movie_id is None:
+                continue
+            for position, name in enumerate(batch.countries[index]):
+                self._add(wanted['movie_country'], (movie_id, country_ids[name]), (position,))
+            for position, name in enumerate(batch.genres[index]):
+                self._add(wanted['movie_genre'], (movie_id, genre_ids[name]), (position,))
+            for role, names in (('director', batch.directors[index]), ('actor', batch.actors[index])):
+                for position, name in enumerate(names):
+                    self._add(wanted['movie_person'], (movie_id, role, person_ids[name]), (position,))
+        return {table: set(rows.values()) for table, rows in wanted.items()}
+
+    def _existing_rows(self, table: str, movie_ids: Iterable[int]) -> Set[Tuple]:
+        """读出这些电影在关联表里现有的行，按主键前缀读取"""
+        keys, values = JUNCTIONS[table]
+        movie_ids = list(movie_ids)
+        result = self.db.fetch_all(
+            f"SELECT {', '.join(keys + values)} FROM {table} WHERE movie_id IN ({_placeholders(len(movie_ids))})",
+            tuple(movie_ids))
+        return {tuple(row[column] for column in keys + values) for row in result}
+
+    def sync(self, batch: MovieBatch) -> Dict[str, int]:
+        """让关联表和这一批电影的内容一致，电影行必须已经写入douban_movies，返回插入和删除的行数"""
+        stats = {'inserted': 0, 'deleted': 0}
+        douban_ids = [douban_id for douban_id in batch.douban_id if douban_id]
+        if not douban_ids:
+            return stats
+        movie_ids = self._movie_ids(douban_ids)
+        if not movie_ids:
+            return stats
+
+        wanted = self.wanted_rows(
+            batch, movie_ids,
+            self._lookup('country', {name for names in batch.countries for name in names}, ('country_group', country_group)),
+            self._lookup('genre', {name for names in batch.genres for name in names}),
+            self._lookup('person', {name for names in batch.directors + batch.actors for name in names}))
+
+        for table, (keys, values) in JUNCTIONS.items():
+            existing = self._existing_rows(table, movie_ids.values())
+            stale = existing - wanted[table]
+            added = wanted[table] - existing
+            if stale:
+                # 按主键删除，位置变化的行也在这里删掉后重新插入
+                stale_keys = [row[:len(keys)] for row in stale]
+                stats['deleted'] += self.db.execute(
+                    f"DELETE FROM {table} WHERE ({', '.join(keys)}) IN ({_placeholders(len(stale_keys), len(keys))})",
+                    tuple(value for key in stale_keys for value in key))
+            if added:
+                result = self.db.insert_rows(table, keys + values, sorted(added))
+                if result['failed']:
+                    raise RuntimeError(f"写入{table}失败: {result['failed'][0]['error']}")
+                stats['inserted'] += result['inserted']
+        return stats
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from mysql_helper import MySqlHelper
+from movie_record import MovieBatch, split_countries
+from movie_relations import primary_country_group
+
+# 评分和年代的分段，按顺序取第一个不低于下限的，和看板原来的CASE分段一致
+RATING_BUCKETS = [(9.0, '9.0-10.0'), (8.0, '8.0-8.9'), (7.0, '7.0-7.9'), (6.0, '6.0-6.9')]
+RATING_OTHER = '6.0以下'
+DECADE_BUCKETS = [(2020, '2020年代'), (2010, '2010年代'), (2000, '2000年代'), (1990, '1990年代'), (1980, '1980年代')]
+DECADE_OTHER = '1980年前'
+
+STATS_TABLES = ('movie_stats_rating', 'movie_stats_decade', 'movie_stats_country')
+
+
+def rating_bucket(rating: Optional[float]) -> Optional[str]:
+    """评分所在的分段，没有评分返回None"""
+    if rating is None:
+        return None
+    for lower, bucket in RATING_BUCKETS:
+        if rating >= lower:
+            return bucket
+    return RATING_OTHER
+
+
+def decade_bucket(year: Optional[int]) -> Optional[str]:
+    """年份所在的年代，没有年份返回None"""
+    if year is None:
+        return None
+    for lower, bucket in DECADE_BUCKETS:
+        if year >= lower:
+            return bucket
+    return DECADE_OTHER
+
+
+def contributions(rating: Optional[float], year: Optional[int], countries: Iterable[str]) -> List[Tuple[str, str]]:
+    """一部电影计入的(汇总表, 分段)，每部电影只计入一个国家分组，饼图各块加起来等于电影数"""
+    return [(table, bucket) for table, bucket in (('movie_stats_rating', rating_bucket(rating)),
+                                                  ('movie_stats_decade', decade_bucket(year)),
+                                                  ('movie_stats_country', primary_country_group(countries)))
+            if bucket is not None]
+
+
+def _row_contributions(row: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """数据库里一行电影计入的分段"""
+    year = row['year']
+    return contributions(None if row['rating'] is None else float(row['rating']),
+                         int(year) if year and year.isdigit() else None,
+                         split_countries(row['country'] or ''))
+
+
+def _batch_contributions(batch: MovieBatch, index: int) -> List[Tuple[str, str]]:
+    """批次里第index部电影计入的分段"""
+    movie = batch[index]
+    return contributions(movie.rating, movie.year, movie.countries)
+
+
+class MovieStats:
+    """评分、年代和国家分组的汇总表，在写电影的同一个事务里按变化的行增量维护
+
+    写之前锁住并读出这些电影的旧值，写完后只把旧值和新值的差加到汇总表上，
+    看板查询读汇总表的几行，不再对douban_movies做GROUP BY。
+    """
+
+    def __init__(self, db: MySqlHelper):
+        self.db = db
+
+    def snapshot(self, douban_ids: Iterable[str]) -> Dict[str, List[Tuple[str, str]]]:
+        """锁住并读出这些电影当前计入的分段，必须在写电影的事务里调用"""
+        douban_ids = [douban_id for douban_id in douban_ids if douban_id]
+        if not douban_ids:
+            return {}
+        # FOR UPDATE让并发写同一部电影的另一个爬虫等到本事务提交，避免两边按同一个旧值算差
+        rows = self.db.fetch_all(
+            f"SELECT douban_id, rating, year, country FROM douban_movies "
+            f"WHERE douban_id IN ({', '.join(['%s'] * len(douban_ids))}) FOR UPDATE",
+            tuple(douban_ids))
+        return {row['douban_id']: _row_contributions(row) for row in rows}
+
+    def apply(self, before: Dict[str, List[Tuple[str, str]]], batch: MovieBatch,
+              indexes: Iterable[int]) -> Dict[str, Counter]:
+        """把批次里已经写入的电影(indexes)相对before的变化加到汇总表上，返回各表的增量"""
+        delta = {table: Counter() for table in STATS_TABLES}
+        for index in indexes:
+            for table, bucket in before.get(batch.douban_id[index], []):
+                delta[table][bucket] -= 1
+            for table, bucket in _batch_contributions(batch, index):
+                delta[table][bucket] += 1
+        self._write(delta)
+        return delta
+
+    def remove(self, where: str, params: Tuple) -> Dict[str, Counter]:
+        """从汇总表里减掉即将删除的电影，必须和DELETE在同一个事务里调用"""
+        delta = {table: Counter() for table in STATS_TABLES}
+        rows = self.db.fetch_all(f"SELECT rating, year, country FROM douban_movies WHERE {where} FOR UPDATE", params)
+        for row in rows:
+            for table, bucket in _row_contributions(row):
+                delta[table][bucket] -= 1
+        self._write(delta)
+        return delta
+
+    def _write(self, delta: Dict[str, Counter]) -> None:
+        """把非零的增量一次性加到各汇总表上"""
+        for table, counter in delta.items():
+            changes = sorted((bucket, count) for bucket, count in counter.items() if count)
+            if not changes:
+                continue
+            self.db.execute(
+                f"INSERT INTO {table} (bucket, movie_count) VALUES {', '.join(['(%s, %s)'] * len(changes))} "
+                f"ON DUPLICATE KEY UPDATE movie_count = movie_count + VALUES(movie_count)",
+                tuple(value for change in changes for value in change))
+
+    def rebuild(self) -> Dict[str, Counter]:
+        """按douban_movies的全部数据重新计算汇总表，用于初始化或校正，不要和爬虫同时运行"""
+        totals = {table: Counter() for table in STATS_TABLES}
+        for row in self.db.fetch_iter("SELECT rating, year, country FROM douban_movies"):
+            for table, bucket in _row_contributions(row):
+                totals[table][bucket] += 1
+        with self.db.transaction():
+            for table, counter in totals.items():
+                self.db.execute(f"DELETE FROM {table}")
+                self._write({table: counter})
+        return totals
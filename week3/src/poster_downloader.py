@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import os
+import ssl
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+import aiohttp
+from mysql_helper import MySqlHelper
+from query_cache import shared_cache
+from rate_limiter import AsyncTokenBucket
+from poster_store import PosterStore, make_thumbnail
+
+# 加载环境变量
+load_dotenv()
+
+# 数据库配置
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', 3306)),
+    'user': os.getenv('DB_USER', ''),
+    'password': os.getenv('DB_PASSWORD', ''),
+    'database': os.getenv('DB_NAME', '')
+}
+
+# 海报下载配置
+POSTER_CONFIG = {
+    'root': os.getenv('POSTER_DIR', 'posters'),
+    'concurrency': int(os.getenv('POSTER_CONCURRENCY', 8)),
+    'rate': float(os.getenv('POSTER_RATE', 5.0)),
+    'thumb_size': int(os.getenv('POSTER_THUMB_SIZE', 160)),
+    'thumb_workers': int(os.getenv('POSTER_THUMB_WORKERS', 2))
+}
+
+# 每次从响应里读取的字节数，图片不会整张读进内存
+CHUNK_SIZE = 64 * 1024
+
+
+class PosterDownloader:
+    """海报下载：限制并发流式下载到磁盘，按SHA-256去重，缩略图在进程池里生成
+
+    上次下载时的地址和哈希记在douban_movies里，地址没变且文件还在的海报直接跳过，不发请求。
+    """
+
+    def __init__(self, root=None, concurrency=None, rate=None, thumb_size=None, thumb_workers=None,
+                 dry_run=False, timeout=30, insecure=False):
+        self.store = PosterStore(root or POSTER_CONFIG['root'])
+        self.concurrency = concurrency or POSTER_CONFIG['concurrency']
+        self.rate_limiter = AsyncTokenBucket(rate or POSTER_CONFIG['rate'], self.concurrency)
+        self.thumb_size = thumb_size or POSTER_CONFIG['thumb_size']
+        self.thumb_workers = POSTER_CONFIG['thumb_workers'] if thumb_workers is None else thumb_workers
+        # dry_run时不连数据库，调用方直接传入电影列表
+        self.dry_run = dry_run
+        self.timeout = timeout
+        # 默认校验证书；insecure只用于自签名证书的本地测试服务
+        self.ssl_context = False if insecure else ssl.create_default_context()
+        self.db = None if dry_run else MySqlHelper(**DB_CONFIG, cache=shared_cache())
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            # 豆瓣图片服务器会检查Referer
+            'Referer': 'https://movie.douban.com/'
+        }
+        self.stats = Counter()
+
+    def load_movies(self):
+        """读取有海报地址的电影及上次下载的记录"""
+        return self.db.fetch_all(
+            "SELECT douban_id, poster_url, poster_source_url, poster_sha256 FROM douban_movies "
+            "WHERE poster_url IS NOT NULL AND poster_url <> '' AND douban_id IS NOT NULL"
+        )
+
+    def plan(self, movies):
+        """把电影分成需要下载的和只需要补缩略图的，地址和哈希都没变的直接跳过"""
+        downloads, thumbs = [], set()
+        for movie in movies:
+            digest = movie.get('poster_sha256')
+            if movie.get('poster_source_url') == movie['poster_url'] and self.store.has(digest):
+                if self.store.has_thumb(digest, self.thumb_size):
+                    self.stats['skipped'] += 1
+                else:
+                    # 多部电影共用一张图时只补一次
+                    thumbs.add(digest)
+                continue
+            downloads.append(movie)
+        return downloads, thumbs
+
+    async def download(self, session, movie):
+        """流式下载一张海报，返回哈希，失败返回None"""
+        await self.rate_limiter.acquire()
+        writer = self.store.writer()
+        committed = False
+        try:
+            try:
+                async with session.get(movie['poster_url']) as response:
+                    if response.status != 200:
+                        self.stats['failed'] += 1
+                        print(f"下载海报失败: {movie['poster_url']} HTTP {response.status}")
+                        return None
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        writer.write(chunk)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.stats['failed'] += 1
+                print(f"下载海报失败: {movie['poster_url']} {e}")
+                return None
+            digest, created = writer.commit()
+            committed = True
+        finally:
+            # 网络错误、磁盘写满、任务被取消等任何原因没有归档成功，都删掉临时文件
+            if not committed:
+                writer.abort()
+
+        self.stats['downloaded'] += 1
+        self.stats['bytes'] += writer.size
+        if not created:
+            # 不同地址的同一张图只存一份
+            self.stats['deduplicated'] += 1
+        return digest
+
+    async def worker(self, queue, session, thumb, updates):
+        """下载协程：从队列取电影，下载后提交缩略图任务并记录要写回的哈希"""
+        while True:
+            movie = await queue.get()
+            try:
+                digest = await self.download(session, movie)
+                if digest is None:
+                    continue
+                thumb(digest)
+                updates.append({
+                    'douban_id': movie['douban_id'],
+                    'poster_sha256': digest,
+                    'poster_source_url': movie['poster_url'],
+                    'poster_downloaded_at': datetime.now()
+                })
+            finally:
+                queue.task_done()
+
+    async def ingest(self, downloads, thumbs):
+        """并发下载海报，同时在进程池里生成缩略图，返回要写回数据库的行"""
+        loop = asyncio.get_running_loop()
+        pool = ProcessPoolExecutor(max_workers=self.thumb_workers) if self.thumb_workers > 0 else None
+        thumb_tasks = {}
+
+        def thumb(digest):
+            # 同一个哈希只生成一次缩略图
+            if digest in thumb_tasks or self.store.has_thumb(digest, self.thumb_size):
+                return
+            thumb_tasks[digest] = loop.run_in_executor(
+                pool, make_thumbnail, self.store.object_path(digest),
+                self.store.thumb_path(digest, self.thumb_size), self.thumb_size)
+
+        for digest in thumbs:
+            thumb(digest)
+
+        queue = asyncio.Queue()
+        for movie in downloads:
+            queue.put_nowait(movie)
+        updates = []
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=self.ssl_context)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        try:
+            async with aiohttp.ClientSession(headers=self.headers, connector=connector, timeout=timeout) as session:
+                workers = [asyncio.create_task(self.worker(queue, session, thumb, updates))
+                           for _ in range(min(self.concurrency, max(1, len(downloads))))]
+                await queue.join()
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+            for digest, task in thumb_tasks.items():
+                try:
+                    await task
+                    self.stats['thumbnails'] += 1
+                except Exception as e:
+                    self.stats['thumb_errors'] += 1
+                    print(f"生成缩略图失败: {digest} {e}")
+        finally:
+            if pool:
+                pool.shutdown()
+        return updates
+
+    def save(self, updates):
+        """把海报哈希和下载地址写回douban_movies"""
+        if self.dry_run or not updates:
+            return
+        result = self.db.update_many('douban_movies', updates, 'douban_id')
+        for failed in result['failed']:
+            print(f"保存海报记录 {failed['row']['douban_id']} 失败: {failed['error']}")
+        print(f"已更新 {result['updated']} 部电影的海报记录")
+
+    def run(self, movies=None):
+        """运行下载，movies为空时从数据库读取，返回统计信息"""
+        movies = self.load_movies() if movies is None else movies
+        downloads, thumbs = self.plan(movies)
+        print(f"海报共 {len(movies)} 张，需要下载 {len(downloads)} 张，补缩略图 {len(thumbs)} 张，"
+              f"跳过 {self.stats['skipped']} 张")
+
+        start = time.monotonic()
+        updates = asyncio.run(self.ingest(downloads, thumbs)) if downloads or thumbs else []
+        self.save(updates)
+        stats = dict(self.stats, elapsed=round(time.monotonic() - start, 3))
+        print(f"\n海报下载统计: {stats}")
+        return stats
+
+    def close(self):
+        """关闭数据库连接"""
+        if self.db:
+            self.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='下载豆瓣电影海报并生成缩略图')
+    parser.add_argument('--root', help='海报存储目录')
+    parser.add_argument('--concurrency', type=int, help='同时下载的海报数上限')
+    parser.add_argument('--rate', type=float, help='每秒请求数')
+    parser.add_argument('--thumb-size', type=int, help='缩略图最长边像素')
+    parser.add_argument('--insecure', action='store_true', help='不校验HTTPS证书，只用于自签名证书的本地测试服务')
+    args = parser.parse_args()
+
+    downloader = PosterDownloader(root=args.root, concurrency=args.concurrency, rate=args.rate,
+                                  thumb_size=args.thumb_size, insecure=args.insecure)
+    try:
+        downloader.run()
+    except KeyboardInterrupt:
+        print("\n用户中断下载")
+    finally:
+        downloader.close()
+
+
+if __name__ == '__main__':
+    main()
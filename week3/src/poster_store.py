@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import uuid
+from PIL import Image
+
+
+def make_thumbnail(source: str, target: str, size: int) -> str:
+    """生成最长边不超过size的JPEG缩略图，模块级函数，可以直接交给进程池执行"""
+    with Image.open(source) as image:
+        # JPEG可以在解码时直接按比例缩小，省掉大部分解码工作
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+        image.thumbnail((size, size))
+        temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        image.save(temp_path, 'JPEG', quality=85, optimize=True)
+    os.replace(temp_path, target)
+    return target
+
+
+class PosterStore:
+    """按SHA-256内容寻址的海报存储，相同内容的图片只存一份
+
+    原图存在 objects/<前两位>/<sha256>，缩略图存在 thumbs/<sha256>_<尺寸>.jpg
+    """
+
+    def __init__(self, root: str = 'posters'):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.thumb_dir = os.path.join(root, 'thumbs')
+        for path in (self.tmp_dir, self.thumb_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def object_path(self, digest: str) -> str:
+        """原图路径，按哈希前两位分目录，避免单个目录文件过多"""
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def thumb_path(self, digest: str, size: int) -> str:
+        """缩略图路径"""
+        return os.path.join(self.thumb_dir, f'{digest}_{size}.jpg')
+
+    def has(self, digest: str) -> bool:
+        """原图是否已经存在"""
+        return bool(digest) and os.path.exists(self.object_path(digest))
+
+    def has_thumb(self, digest: str, size: int) -> bool:
+        """缩略图是否已经存在"""
+        return bool(digest) and os.path.exists(self.thumb_path(digest, size))
+
+    def writer(self) -> 'PosterWriter':
+        """返回一个边写边算哈希的临时文件"""
+        return PosterWriter(self)
+
+
+class PosterWriter:
+    """流式写入一张图片：数据块直接写进临时文件并同时计算哈希，完成后按哈希归档"""
+
+    def __init__(self, store: PosterStore):
+        self.store = store
+        self.temp_path = os.path.join(store.tmp_dir, uuid.uuid4().hex)
+        self._file = open(self.temp_path, 'wb')
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        """写入一个数据块"""
+        self._file.write(chunk)
+        self._sha256.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        """写完后按哈希归档，返回(哈希, 是否为新文件)；内容已存在时丢弃临时文件"""
+        self._file.close()
+        digest = self._sha256.hexdigest()
+        target = self.store.object_path(digest)
+        if os.path.exists(target):
+            os.remove(self.temp_path)
+            return digest, False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(self.temp_path, target)
+        return digest, True
+
+    def abort(self) -> None:
+        """下载失败时删除临时文件"""
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
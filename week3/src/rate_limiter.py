@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """令牌桶限速器，多个工作线程共享一个实例"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """rate为每秒补充的令牌数，burst为桶容量(允许的突发请求数)"""
+        if rate <= 0:
+            raise ValueError("rate必须大于0")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """按距上次补充经过的时间补充令牌，调用方需持有锁"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: int = 1) -> bool:
+        """尝试取令牌，不等待"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: int = 1) -> float:
+        """取令牌，令牌不足时阻塞等待，返回等待的秒数"""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return time.monotonic() - start
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate: float) -> None:
+        """调整令牌补充速率，供自适应限速使用"""
+        with self._lock:
+            self._refill()
+            self.rate = max(rate, 1e-6)
+
+
+class AsyncTokenBucket:
+    """asyncio版令牌桶，同一个事件循环里的所有协程共享一个实例"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """rate为每秒补充的令牌数，burst为桶容量(允许的突发请求数)"""
+        if rate <= 0:
+            raise ValueError("rate必须大于0")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        # 在事件循环里使用，不需要线程锁；等待令牌时排队，先来的协程先拿到
+        self._lock = None
+
+    def _refill(self):
+        """按距上次补充经过的时间补充令牌"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: int = 1) -> float:
+        """取令牌，令牌不足时让出事件循环等待，返回等待的秒数"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return time.monotonic() - start
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
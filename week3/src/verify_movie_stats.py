@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""汇总表校验：爬虫保存电影时增量维护的汇总表(MovieStats.apply/remove)和rebuild()全量重算的结果一致
+
+用法: python verify_movie_stats.py [--pages N] [--seed N]
+不连数据库：MemoryDB在内存里模拟douban_movies和汇总表，覆盖写入失败的行、
+replace模式清除当天数据后重新插入、以及内容哈希没变的upsert
+"""
+
+import argparse
+import copy
+import os
+import random
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from bench_parse import synthetic_page
+from crawl_checkpoint import CrawlCheckpoint
+from douban_spider import DoubanMovieSpider
+from movie_parser import get_parser
+from movie_stats import MovieStats, STATS_TABLES
+from mysql_helper import MySqlHelper
+
+
+class MemoryDB:
+    """只实现MovieStats和save_movies/clear_today用到的几个方法，douban_id唯一，fail_ids里的电影写入时报错"""
+
+    def __init__(self):
+        self.movies = {}
+        self.stats = {table: Counter() for table in STATS_TABLES}
+        self.fail_ids = set()
+
+    @contextmanager
+    def transaction(self):
+        """异常时恢复到事务开始前的状态"""
+        saved = copy.deepcopy((self.movies, self.stats))
+        try:
+            yield self
+        except BaseException:
+            self.movies, self.stats = saved
+            raise
+
+    def _today_rows(self, params):
+        """created_time落在[params[0], params[1])里的电影"""
+        return [douban_id for douban_id, row in self.movies.items() if params[0] <= row['created_time'] < params[1]]
+
+    def fetch_all(self, sql, params=None):
+        if 'douban_id IN' in sql:
+            return [dict(self.movies[douban_id], douban_id=douban_id) for douban_id in params
+                    if douban_id in self.movies]
+        if 'created_time >= %s' in sql:
+            return [self.movies[douban_id] for douban_id in self._today_rows(params)]
+        raise ValueError(f"MemoryDB不支持的查询: {sql}")
+
+    def fetch_iter(self, sql, params=None):
+        return iter(list(self.movies.values()))
+
+    def execute(self, sql, params=None):
+        table = sql.split()[2]
+        if sql.startswith('DELETE FROM douban_movies'):
+            removed = self._today_rows(params)
+            for douban_id in removed:
+                del self.movies[douban_id]
+            return len(removed)
+        if sql.startswith('DELETE FROM movie_stats_'):
+            self.stats[table].clear()
+            return 0
+        if sql.startswith('INSERT INTO movie_stats_'):
+            for bucket, count in zip(params[::2], params[1::2]):
+                self.stats[table][bucket] += count
+            return len(params) // 2
+        raise ValueError(f"MemoryDB不支持的语句: {sql}")
+
+    def _write(self, columns, rows, update_columns=None):
+        """逐行写入，和_write_rows整批失败后逐行重试的结果相同"""
+        result = {'written': 0, 'affected': 0, 'failed': []}
+        for index, row in enumerate(rows):
+            values = dict(zip(columns, row))
+            douban_id = values['douban_id']
+            if douban_id in self.fail_ids or (update_columns is None and douban_id in self.movies):
+                result['failed'].append({'index': index, 'row': values, 'error': f"模拟写入失败: {douban_id}"})
+                continue
+            values['content_hash'] = MySqlHelper._hash_values(values[column] for column in update_columns or [])
+            existing = self.movies.get(douban_id)
+            if existing is None:
+                self.movies[douban_id] = values
+                result['affected'] += 1
+            elif existing['content_hash'] != values['content_hash']:
+                # 和ON DUPLICATE KEY UPDATE一样只改update_columns，created_time保持不变
+                existing.update({column: values[column] for column in update_columns + ['content_hash']})
+                result['affected'] += 2
+            result['written'] += 1
+        return result
+
+    def insert_rows(self, table, columns, rows, batch_size=500):
+        result = self._write(columns, rows)
+        return {'inserted': result['written'], 'failed': result['failed']}
+
+    def upsert_rows(self, table, columns, rows, update_columns, hash_column='content_hash', batch_size=500):
+        return self._write(columns, rows, update_columns)
+
+
+def memory_spider(db, save_mode, checkpoint_path):
+    """只设置save_movies和clear_today用到的属性，不连数据库也不建HTTP连接"""
+    spider = DoubanMovieSpider.__new__(DoubanMovieSpider)
+    spider.db = db
+    spider.stats = MovieStats(db)
+    spider.relations = None
+    spider.save_mode = save_mode
+    spider.batch_size = 100
+    spider.checkpoint = CrawlCheckpoint(checkpoint_path)
+    return spider
+
+
+def check(db, step):
+    """增量维护的汇总表和按当前电影全量重算的结果比较，不一致时退出"""
+    incremental = {table: {bucket: count for bucket, count in counter.items() if count}
+                   for table, counter in db.stats.items()}
+    rebuilt = {table: dict(counter) for table, counter in MovieStats(db).rebuild().items()}
+    if incremental != rebuilt:
+        raise SystemExit(f"{step}: 增量结果和重算不一致\n增量: {incremental}\n重算: {rebuilt}")
+    print(f"{step}: 一致，{len(db.movies)} 部电影，国家分组 {rebuilt['movie_stats_country']}")
+
+
+def edit_movies(pages, rng, count):
+    """随机改几部电影的评分、年份和国家，返回改过的页"""
+    for movie in rng.sample([movie for page in pages for movie in page], count):
+        movie['rating'] = round(rng.uniform(5.0, 9.9), 1)
+        movie['year'] = str(rng.randint(1970, 2025))
+        movie['country'] = rng.choice(['美国', '日本 法国', '中国香港 英国', '韩国', '德国 美国'])
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='校验汇总表的增量维护和全量重算一致')
+    parser.add_argument('--pages', type=int, default=4, help='合成的Top250页数')
+    parser.add_argument('--seed', type=int, default=5, help='随机数种子')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    movie_parser = get_parser('lxml')
+    pages = [movie_parser.parse_movies(synthetic_page(start, rng)) for start in range(0, args.pages * 25, 25)]
+    ids = [movie['douban_id'] for page in pages for movie in page]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # upsert：失败的行不计入，内容没变的行不改变计数
+        db = MemoryDB()
+        spider = memory_spider(db, 'upsert', os.path.join(work_dir, 'upsert.db'))
+        db.fail_ids = set(rng.sample(ids, 5))
+        for page in pages:
+            spider.save_movies(copy.deepcopy(page))
+        check(db, 'upsert 首次保存(5部写入失败)')
+        db.fail_ids = set()
+        for page in pages:
+            spider.save_movies(copy.deepcopy(page))
+        check(db, 'upsert 重新保存(失败的补上，其余哈希不变)')
+        edit_movies(pages, rng, 15)
+        db.fail_ids = set(rng.sample(ids, 3))
+        for page in pages:
+            spider.save_movies(copy.deepcopy(page))
+        check(db, 'upsert 修改15部(其中3部更新失败)')
+        spider.checkpoint.close()
+
+        # replace：昨天保存过的电影再插入时唯一键冲突，今天的先清除再插入
+        db = MemoryDB()
+        spider = memory_spider(db, 'replace', os.path.join(work_dir, 'replace.db'))
+        spider.save_movies(copy.deepcopy(pages[0]))
+        yesterday = datetime.now() - timedelta(days=1)
+        for douban_id in [movie['douban_id'] for movie in pages[0]]:
+            db.movies[douban_id]['created_time'] = yesterday
+        for page in pages[1:]:
+            spider.save_movies(copy.deepcopy(page))
+        check(db, 'replace 首次保存(昨天已有第一页)')
+        spider.clear_today()
+        check(db, 'replace 清除今天的数据')
+        edit_movies(pages, rng, 15)
+        db.fail_ids = set(rng.sample(ids, 4))
+        for page in pages:
+            spider.save_movies(copy.deepcopy(page))
+        check(db, 'replace 重新插入(第一页冲突，另有4部写入失败)')
+        spider.checkpoint.close()
+    print("全部一致")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-from mysql_helper import MySqlHelper
+from mysql_helper import MySqlHelper, MySqlPool
+from query_cache import shared_cache
+from movie_analytics import (MovieAnalytics, RATING_EDGES, RATING_LABELS, DECADE_EDGES, DECADE_LABELS)
+from distribution_query import parse_spec, query_distribution, compile_distribution
+from movie_search import MovieSearch
 import os
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
 from dotenv import load_dotenv
 
+# brotli是可选依赖，没装时只用gzip压缩
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # 加载环境变量
 load_dotenv()
 
@@ -19,28 +35,213 @@ DB_CONFIG = {
     'database': os.getenv('DB_NAME', 'student_management')
 }
 
+# 所有请求和工作线程共享一个连接池
+db_pool = MySqlPool(
+    **DB_CONFIG,
+    pool_size=int(os.getenv('DB_POOL_SIZE', 5)),
+    max_idle_time=int(os.getenv('DB_POOL_MAX_IDLE', 300)),
+    checkout_timeout=float(os.getenv('DB_POOL_TIMEOUT', 10))
+)
+# QUERY_CACHE_PATH和爬虫指向同一个文件时，重复的查询直接从缓存返回，爬虫写入后自动失效
+query_cache = shared_cache()
+db = MySqlHelper(pool=db_pool, cache=query_cache)
+
+# 接口响应缓存配置：数据只在爬虫运行后变化，VERSION_TTL秒内不查数据库，直接用上次的数据版本
+RESPONSE_CONFIG = {
+    'cache_control': os.getenv('API_CACHE_CONTROL', 'public, max-age=60'),
+    'version_ttl': float(os.getenv('API_VERSION_TTL', 10)),
+    'max_entries': int(os.getenv('API_CACHE_MAX_ENTRIES', 256)),
+    'min_compress_bytes': int(os.getenv('API_MIN_COMPRESS_BYTES', 256))
+}
+
+
+# 看板接口读的表：douban_movies和爬虫增量维护的汇总表，任何一个变化都要换ETag
+VERSION_SQL = ("SELECT COUNT(*) as row_count, MAX(updated_time) as last_updated, "
+               + ", ".join(f"(SELECT MAX(updated_time) FROM {table}) as {table}"
+                           for table in ('movie_stats_rating', 'movie_stats_decade', 'movie_stats_country'))
+               + " FROM douban_movies")
+
+
+class DataVersion:
+    """数据版本(douban_movies的行数和最后更新时间，加上各汇总表的最后更新时间)，在ttl秒内复用上次查到的结果"""
+
+    def __init__(self, helper, ttl):
+        self.helper = helper
+        self.ttl = ttl
+        self._value = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """返回当前版本字符串，过期时查一次数据库"""
+        with self._lock:
+            if self._value is None or time.monotonic() - self._checked_at >= self.ttl:
+                # douban_movies的updated_time上有索引，MAX直接取索引末端；汇总表只有几行
+                row = self.helper.fetch_all(VERSION_SQL)[0]
+                self._value = ':'.join(str(value) for value in row.values())
+                self._checked_at = time.monotonic()
+            return self._value
+
+
+data_version = DataVersion(db, RESPONSE_CONFIG['version_ttl'])
+# 按请求路径缓存的响应体，每个条目记着数据版本和各种压缩后的内容，超过上限时淘汰最久没用的
+_responses = OrderedDict()
+_responses_lock = threading.Lock()
+
+
+def choose_encoding(accept_encoding):
+    """按Accept-Encoding里的q值选压缩方式，同样的q值优先br"""
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+    candidates = (['br'] if brotli else []) + ['gzip']
+    best = max(candidates, key=lambda name: weights.get(name, weights.get('*', 0.0)))
+    return best if weights.get(best, weights.get('*', 0.0)) > 0 else None
+
+
+def compress(body, encoding):
+    """按指定方式压缩响应体"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def cached_response(view):
+    """接口响应层：按数据版本和压缩方式生成强ETag，If-None-Match命中时不查数据库直接返回304，
+    响应体按版本缓存并按Accept-Encoding压缩，出错的响应不缓存"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            version = data_version.get()
+        except Exception as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+        version_tag = hashlib.md5(f"{version}|{request.full_path}".encode('utf-8')).hexdigest()
+        # 压缩和不压缩的响应体字节不同，强ETag必须不同
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        etag = f"{version_tag}-{encoding}" if encoding else version_tag
+        headers = {'Cache-Control': RESPONSE_CONFIG['cache_control'], 'Vary': 'Accept-Encoding'}
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+
+        key = request.full_path
+        with _responses_lock:
+            entry = _responses.get(key)
+            if entry is not None:
+                _responses.move_to_end(key)
+        if entry is None or entry['version_tag'] != version_tag:
+            result = view(*args, **kwargs)
+            if isinstance(result, tuple) or result.status_code != 200:
+                return result
+            entry = {'version_tag': version_tag, 'bodies': {None: result.get_data()}}
+            with _responses_lock:
+                _responses[key] = entry
+                _responses.move_to_end(key)
+                while len(_responses) > RESPONSE_CONFIG['max_entries']:
+                    _responses.popitem(last=False)
+
+        if len(entry['bodies'][None]) < RESPONSE_CONFIG['min_compress_bytes']:
+            # 太小的响应不压缩；ETag不变，同一个ETag仍然只对应这一份响应体
+            encoding = None
+        if encoding not in entry['bodies']:
+            # 同一版本只压缩一次，并发时重复压缩也没关系，结果相同
+            entry['bodies'][encoding] = compress(entry['bodies'][None], encoding)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        response = Response(entry['bodies'][encoding], mimetype='application/json', headers=headers)
+        response.set_etag(etag)
+        return response
+    return wrapper
+
+
+# douban_movies的内存副本(列式统计和搜索索引)，第一次请求时加载，之后数据版本变化时增量刷新
+analytics = MovieAnalytics(db)
+search_index = MovieSearch(db)
+_index_versions = {}
+_index_lock = threading.Lock()
+# 分段统计的默认分段，和汇总表一致
+DEFAULT_BUCKETS = {
+    'rating': (RATING_EDGES, RATING_LABELS),
+    'year': (DECADE_EDGES, DECADE_LABELS)
+}
+
+
+def current_index(index):
+    """让内存副本和当前数据版本一致后返回"""
+    version = data_version.get()
+    with _index_lock:
+        if _index_versions.get(id(index)) != version:
+            index.refresh()
+            _index_versions[id(index)] = version
+    return index
+
+
+def current_analytics():
+    """返回和当前数据版本一致的列式副本"""
+    return current_index(analytics)
+
+
+def analytics_filters():
+    """从查询参数解析筛选条件：year_from、year_to、rating_min、genre、country"""
+    filters = {}
+    for name, convert in (('year_from', int), ('year_to', int), ('rating_min', float), ('genre', str), ('country', str)):
+        value = request.args.get(name)
+        if value:
+            try:
+                filters[name] = convert(value)
+            except ValueError:
+                raise ValueError(f"参数{name}格式不正确: {value}")
+    return filters
+
+
+def analytics_response(compute):
+    """在内存副本上执行统计，参数错误返回400"""
+    try:
+        engine = current_analytics()
+        with engine.lock:
+            filters = analytics_filters()
+            mask = engine.filter_mask(**filters) if filters else None
+            result = compute(engine, mask)
+        return jsonify({
+            'status': 'success',
+            'data': result
+        })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @app.route('/api/movies/rating-distribution', methods=['GET'])
+@cached_response
 def get_rating_distribution():
     """获取电影评分分布数据"""
     try:
-        db = MySqlHelper(**DB_CONFIG)
+        # 汇总表由爬虫写电影时增量维护，这里只读几行
         sql = """
-        SELECT 
-            CASE 
-                WHEN rating >= 9.0 THEN '9.0-10.0'
-                WHEN rating >= 8.0 THEN '8.0-8.9'
-                WHEN rating >= 7.0 THEN '7.0-7.9'
-                WHEN rating >= 6.0 THEN '6.0-6.9'
-                ELSE '6.0以下'
-            END as rating_range,
-            COUNT(*) as count
-        FROM douban_movies 
-        WHERE rating IS NOT NULL
-        GROUP BY rating_range
+        SELECT bucket as rating_range, movie_count as count
+        FROM movie_stats_rating
+        WHERE movie_count > 0
         ORDER BY rating_range DESC
         """
         result = db.fetch_all(sql)
-        db.close()
         
         return jsonify({
             'status': 'success',
@@ -53,28 +254,17 @@ def get_rating_distribution():
         }), 500
 
 @app.route('/api/movies/year-distribution', methods=['GET'])
+@cached_response
 def get_year_distribution():
     """获取电影年份分布数据"""
     try:
-        db = MySqlHelper(**DB_CONFIG)
         sql = """
-        SELECT 
-            CASE 
-                WHEN year >= '2020' THEN '2020年代'
-                WHEN year >= '2010' THEN '2010年代'
-                WHEN year >= '2000' THEN '2000年代'
-                WHEN year >= '1990' THEN '1990年代'
-                WHEN year >= '1980' THEN '1980年代'
-                ELSE '1980年前'
-            END as decade,
-            COUNT(*) as count
-        FROM douban_movies 
-        WHERE year IS NOT NULL AND year != ''
-        GROUP BY decade
+        SELECT bucket as decade, movie_count as count
+        FROM movie_stats_decade
+        WHERE movie_count > 0
         ORDER BY decade DESC
         """
         result = db.fetch_all(sql)
-        db.close()
         
         return jsonify({
             'status': 'success',
@@ -87,31 +277,18 @@ def get_year_distribution():
         }), 500
 
 @app.route('/api/movies/country-distribution', methods=['GET'])
+@cached_response
 def get_country_distribution():
-    """获取电影国家分布数据"""
+    """获取电影国家分布数据，合拍片只计入排在最前面的一个国家分组"""
     try:
-        db = MySqlHelper(**DB_CONFIG)
         sql = """
-        SELECT 
-            CASE 
-                WHEN country LIKE '%美国%' THEN '美国'
-                WHEN country LIKE '%中国%' OR country LIKE '%香港%' OR country LIKE '%台湾%' THEN '中国'
-                WHEN country LIKE '%日本%' THEN '日本'
-                WHEN country LIKE '%英国%' THEN '英国'
-                WHEN country LIKE '%法国%' THEN '法国'
-                WHEN country LIKE '%意大利%' THEN '意大利'
-                WHEN country LIKE '%德国%' THEN '德国'
-                ELSE '其他'
-            END as country_group,
-            COUNT(*) as count
-        FROM douban_movies 
-        WHERE country IS NOT NULL AND country != ''
-        GROUP BY country_group
+        SELECT bucket as country_group, movie_count as count
+        FROM movie_stats_country
+        WHERE movie_count > 0
         ORDER BY count DESC
         LIMIT 8
         """
         result = db.fetch_all(sql)
-        db.close()
         
         return jsonify({
             'status': 'success',
@@ -123,5 +300,162 @@ def get_country_distribution():
             'message': str(e)
         }), 500
 
+@app.route('/api/movies/distribution', methods=['GET'])
+@cached_response
+def get_distribution():
+    """通用分布查询：field为统计字段，buckets为逗号分隔的分段下限，filters为逗号分隔的名称:值，
+    例如 ?field=rating&buckets=7,8,9&filters=year_from:2000,genre:剧情"""
+    try:
+        spec = parse_spec(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    try:
+        # 编译好的SQL按字段、分段和筛选条件名缓存；结果经过查询缓存，响应按数据版本缓存
+        result = query_distribution(db, spec)
+        return jsonify({
+            'status': 'success',
+            'data': result
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/movies/analytics/buckets', methods=['GET'])
+@cached_response
+def get_analytics_buckets():
+    """按评分或年代分段计数，field为rating或year，支持筛选参数"""
+    field = request.args.get('field', 'rating')
+
+    def compute(engine, mask):
+        if field not in DEFAULT_BUCKETS:
+            raise ValueError(f"不支持的分段字段: {field}")
+        edges, labels = DEFAULT_BUCKETS[field]
+        return engine.bucket_counts(field, edges, labels, mask)
+    return analytics_response(compute)
+
+@app.route('/api/movies/analytics/histogram', methods=['GET'])
+@cached_response
+def get_analytics_histogram():
+    """评分或年份的等宽直方图，bins为段数，min和max为范围"""
+    def compute(engine, mask):
+        field = request.args.get('field', 'rating')
+        bins = int(request.args.get('bins', 10))
+        if not 1 <= bins <= 200:
+            raise ValueError("bins必须在1到200之间")
+        low, high = request.args.get('min'), request.args.get('max')
+        value_range = (float(low), float(high)) if low and high else None
+        return engine.histogram(field, bins, value_range, mask)
+    return analytics_response(compute)
+
+@app.route('/api/movies/analytics/groups', methods=['GET'])
+@cached_response
+def get_analytics_groups():
+    """按国家分组、国家或类型计数，field为country_group、country或genre"""
+    def compute(engine, mask):
+        limit = request.args.get('limit')
+        return engine.group_counts(request.args.get('field', 'country_group'), mask, int(limit) if limit else None)
+    return analytics_response(compute)
+
+@app.route('/api/movies/analytics/stats', methods=['GET'])
+def get_analytics_stats():
+    """内存副本的行数和占用"""
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'rows': len(analytics),
+            'bytes': analytics.nbytes,
+            'countries': len(analytics.country_dict),
+            'genres': len(analytics.genre_dict),
+            'watermark': str(analytics.watermark) if analytics.watermark else None
+        }
+    })
+
+@app.route('/api/movies/search', methods=['GET'])
+@cached_response
+def search_movies():
+    """搜索标题、英文标题、导演和主演，cursor为上一页返回的next_cursor"""
+    try:
+        limit = int(request.args.get('limit', 20))
+        if not 1 <= limit <= 100:
+            raise ValueError("limit必须在1到100之间")
+        result, next_cursor = current_index(search_index).search(
+            request.args.get('q', ''), request.args.get('cursor') or None, limit)
+        return jsonify({
+            'status': 'success',
+            'data': result,
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/movies/suggest', methods=['GET'])
+@cached_response
+def suggest_movies():
+    """输入提示：标题或导演、主演以q开头的电影"""
+    try:
+        limit = int(request.args.get('limit', 10))
+        if not 1 <= limit <= 20:
+            raise ValueError("limit必须在1到20之间")
+        return jsonify({
+            'status': 'success',
+            'data': current_index(search_index).suggest(request.args.get('q', ''), limit)
+        })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/movies/search/stats', methods=['GET'])
+def get_search_stats():
+    """搜索索引的规模"""
+    return jsonify({
+        'status': 'success',
+        'data': search_index.stats()
+    })
+
+@app.route('/api/db/pool-stats', methods=['GET'])
+def get_pool_stats():
+    """获取数据库连接池统计"""
+    return jsonify({
+        'status': 'success',
+        'data': db_pool.stats()
+    })
+
+@app.route('/api/db/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """获取查询缓存统计"""
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'query_cache': query_cache.stats() if query_cache else None,
+            'compiled_distributions': compile_distribution.cache_info()._asdict()
+        }
+    })
+
 if __name__ == '__main__':
+    # 启动时先建好搜索索引，第一次搜索不用等；数据库不可用时留到第一次请求再建
+    try:
+        current_index(search_index)
+        print(f"搜索索引已建立: {search_index.stats()}")
+    except Exception as e:
+        print(f"建立搜索索引失败: {e}")
     app.run(debug=True, port=6000, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""分布统计基准：对比内存列式副本(MovieAnalytics)和原来每次查库的CASE分段SQL
+
+用法: python bench_analytics.py [--count N] [--rounds N] [--mysql]
+默认把合成数据写进内存SQLite执行原来的SQL；--mysql时用.env里的数据库，
+需要douban_movies里已经有数据(不会写入合成数据)
+"""
+
+import argparse
+import datetime
+import random
+import sqlite3
+import time
+from decimal import Decimal
+from movie_analytics import MovieAnalytics, RATING_EDGES, RATING_LABELS, DECADE_EDGES, DECADE_LABELS
+
+COUNTRIES = ['美国', '中国大陆', '中国香港', '中国台湾', '日本', '英国', '法国', '德国', '意大利', '韩国',
+             '印度', '西班牙', '加拿大', '澳大利亚', '泰国', '俄罗斯', '巴西', '瑞典', '丹麦', '伊朗']
+GENRES = ['剧情', '喜剧', '动作', '爱情', '科幻', '动画', '悬疑', '惊悚', '恐怖', '犯罪',
+          '奇幻', '冒险', '战争', '历史', '传记', '音乐', '家庭', '纪录片']
+
+# 看板原来的三条分段SQL
+SQL_QUERIES = {
+    'rating': """
+        SELECT CASE
+                WHEN rating >= 9.0 THEN '9.0-10.0'
+                WHEN rating >= 8.0 THEN '8.0-8.9'
+                WHEN rating >= 7.0 THEN '7.0-7.9'
+                WHEN rating >= 6.0 THEN '6.0-6.9'
+                ELSE '6.0以下'
+            END as rating_range,
+            COUNT(*) as count
+        FROM douban_movies
+        WHERE rating IS NOT NULL
+        GROUP BY rating_range
+        ORDER BY rating_range DESC
+    """,
+    'year': """
+        SELECT CASE
+                WHEN year >= '2020' THEN '2020年代'
+                WHEN year >= '2010' THEN '2010年代'
+                WHEN year >= '2000' THEN '2000年代'
+                WHEN year >= '1990' THEN '1990年代'
+                WHEN year >= '1980' THEN '1980年代'
+                ELSE '1980年前'
+            END as decade,
+            COUNT(*) as count
+        FROM douban_movies
+        WHERE year IS NOT NULL AND year != ''
+        GROUP BY decade
+        ORDER BY decade DESC
+    """,
+    'country': """
+        SELECT CASE
+                WHEN country LIKE '%美国%' THEN '美国'
+                WHEN country LIKE '%中国%' OR country LIKE '%香港%' OR country LIKE '%台湾%' THEN '中国'
+                WHEN country LIKE '%日本%' THEN '日本'
+                WHEN country LIKE '%英国%' THEN '英国'
+                WHEN country LIKE '%法国%' THEN '法国'
+                WHEN country LIKE '%意大利%' THEN '意大利'
+                WHEN country LIKE '%德国%' THEN '德国'
+                ELSE '其他'
+            END as country_group,
+            COUNT(*) as count
+        FROM douban_movies
+        WHERE country IS NOT NULL AND country != ''
+        GROUP BY country_group
+        ORDER BY count DESC
+        LIMIT 8
+    """
+}
+
+
+def synthetic_rows(count):
+    """生成count行(id, rating, year, country, genre, updated_time)，和数据库读出的类型一致"""
+    rng = random.Random(42)
+    start = datetime.datetime(2024, 1, 1)
+    rows = []
+    for movie_id in range(1, count + 1):
+        rating = None if rng.random() < 0.05 else Decimal(f"{rng.triangular(2.0, 9.9, 7.5):.1f}")
+        year = '' if rng.random() < 0.02 else str(rng.randint(1930, 2025))
+        country = ' / '.join(rng.sample(COUNTRIES, rng.choice((1, 1, 1, 2, 3))))
+        genre = ' '.join(rng.sample(GENRES, rng.randint(1, 3)))
+        rows.append((movie_id, rating, year, country, genre, start + datetime.timedelta(seconds=movie_id)))
+    return rows
+
+
+def sqlite_connection(rows):
+    """把合成数据写进内存SQLite"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE douban_movies (id INTEGER PRIMARY KEY, rating REAL, year TEXT, "
+                 "country TEXT, genre TEXT, updated_time TEXT)")
+    conn.executemany("INSERT INTO douban_movies VALUES (?, ?, ?, ?, ?, ?)",
+                     [(movie_id, None if rating is None else float(rating), year, country, genre, str(updated))
+                      for movie_id, rating, year, country, genre, updated in rows])
+    conn.commit()
+    return conn
+
+
+def timed(function, rounds):
+    """返回function的结果和平均耗时(秒)"""
+    result = function()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return result, (time.perf_counter() - start) / rounds
+
+
+def once(function):
+    """只执行一次的耗时(秒)"""
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比内存列式统计和SQL分段统计')
+    parser.add_argument('--count', type=int, default=1000000, help='合成电影数')
+    parser.add_argument('--rounds', type=int, default=20, help='每种查询的重复次数')
+    parser.add_argument('--mysql', action='store_true', help='用.env里的MySQL数据库代替合成数据')
+    args = parser.parse_args()
+
+    if args.mysql:
+        import os
+        from dotenv import load_dotenv
+        from mysql_helper import MySqlHelper
+        load_dotenv()
+        helper = MySqlHelper(host=os.getenv('DB_HOST', 'localhost'), port=int(os.getenv('DB_PORT', 3306)),
+                             user=os.getenv('DB_USER', 'root'), password=os.getenv('DB_PASSWORD', 'root1234'),
+                             database=os.getenv('DB_NAME', 'student_management'))
+        run_sql = lambda sql: helper.fetch_all(sql)
+        analytics = MovieAnalytics(helper)
+        start = time.perf_counter()
+        analytics.load()
+        load_time = time.perf_counter() - start
+        print(f"MySQL: {len(analytics)} 部电影")
+    else:
+        start = time.perf_counter()
+        rows = synthetic_rows(args.count)
+        print(f"生成 {len(rows)} 行合成数据: {time.perf_counter() - start:.1f} s")
+        conn = sqlite_connection(rows)
+        run_sql = lambda sql: conn.execute(sql).fetchall()
+        analytics = MovieAnalytics()
+        start = time.perf_counter()
+        analytics.load(rows)
+        load_time = time.perf_counter() - start
+        del rows
+
+    print(f"加载到内存: {load_time:.2f} s，列数据 {analytics.nbytes / 1024 / 1024:.1f} MiB，"
+          f"每部 {analytics.nbytes / max(len(analytics), 1):.1f} 字节")
+
+    # 不带筛选的统计在数据变化前只算一次，计时的是命中后的耗时；第一次的耗时另外打印
+    mask = analytics.filter_mask(year_from=2000, genre='剧情')
+    for name, function in (('rating', lambda: analytics.bucket_counts('rating', RATING_EDGES, RATING_LABELS)),
+                           ('country', lambda: analytics.group_counts('country_group', limit=8))):
+        elapsed = once(function)
+        print(f"{'首次 ' + name:>18}: {elapsed * 1e6:>10,.0f} µs")
+    memory_queries = {
+        'rating': lambda: analytics.bucket_counts('rating', RATING_EDGES, RATING_LABELS),
+        'year': lambda: analytics.bucket_counts('year', DECADE_EDGES, DECADE_LABELS),
+        'country': lambda: analytics.group_counts('country_group', limit=8),
+        'histogram': lambda: analytics.histogram('rating', 20, (0, 10)),
+        'genre(筛选后)': lambda: analytics.group_counts('genre', mask=mask),
+        'filter_mask': lambda: analytics.filter_mask(year_from=2000, genre='剧情')
+    }
+
+    for name, function in memory_queries.items():
+        result, elapsed = timed(function, args.rounds)
+        line = f"{'内存 ' + name:>18}: {elapsed * 1e6:>10,.0f} µs"
+        if name in SQL_QUERIES:
+            sql_result, sql_elapsed = timed(lambda: run_sql(SQL_QUERIES[name]), max(args.rounds // 5, 1))
+            line += f"   SQL: {sql_elapsed * 1e6:>12,.0f} µs   快 {sql_elapsed / elapsed:,.0f} 倍"
+            if name != 'country':
+                # 国家分组的语义不同(SQL只计第一个命中的分组，内存版计入合拍片涉及的每个分组)，不比较结果
+                sql_counts = {row[0] if isinstance(row, tuple) else list(row.values())[0]:
+                              row[1] if isinstance(row, tuple) else row['count'] for row in sql_result}
+                if sql_counts != {item['bucket']: item['count'] for item in result}:
+                    raise SystemExit(f"{name}分布和SQL结果不一致")
+        print(line)
+
+    # 增量刷新：改动1%的行
+    changed = [(int(movie_id), Decimal('8.8'), '2024', '美国', '剧情', datetime.datetime(2030, 1, 1))
+               for movie_id in analytics.ids[::100]]
+    elapsed = once(lambda: analytics.apply(changed))
+    print(f"增量更新 {len(changed)} 行: {elapsed * 1000:.1f} ms")
+    elapsed = once(memory_queries['rating'])
+    print(f"更新后第一次评分分布: {elapsed * 1e6:,.0f} µs")
+
+
+if __name__ == '__main__':
+    main()
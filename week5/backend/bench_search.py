@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""搜索基准：电影搜索索引(MovieSearch)的建索引时间、输入提示和搜索的延迟，并和LIKE '%x%'全表扫描对比
+
+用法: python bench_search.py [--count N] [--queries N]
+数据是合成的中文标题、英文标题和人名；LIKE的对比在内存SQLite里执行
+"""
+
+import argparse
+import datetime
+import random
+import sqlite3
+import time
+from decimal import Decimal
+from movie_search import MovieSearch
+
+CHARS = ('的一是不了人我在有他这中大来上个国到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可她里后小么心多'
+         '天而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现分将外')
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈'
+WORDS = ['the', 'dark', 'love', 'story', 'man', 'night', 'king', 'city', 'last', 'life', 'world', 'dream', 'house',
+         'star', 'war', 'girl', 'boy', 'blue', 'time', 'lost', 'road', 'secret', 'summer', 'winter', 'rain']
+
+
+def synthetic_rows(count):
+    """生成count行，列顺序和movie_search.LOAD_SQL一致"""
+    rng = random.Random(42)
+    people = [rng.choice(SURNAMES) + ''.join(rng.choice(CHARS) for _ in range(rng.randint(1, 2)))
+              for _ in range(max(count // 2, 100))]
+    start = datetime.datetime(2024, 1, 1)
+    rows = []
+    for movie_id in range(1, count + 1):
+        title = ''.join(rng.choice(CHARS) for _ in range(rng.randint(2, 8)))
+        title_en = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+        director = ' / '.join(rng.sample(people, rng.randint(1, 2)))
+        actors = ' / '.join(rng.sample(people, rng.randint(2, 6)))
+        rows.append((movie_id, title, title_en, director, actors, str(rng.randint(1930, 2025)),
+                     Decimal(f"{rng.uniform(2, 9.9):.1f}"), int(rng.paretovariate(1.2) * 100), str(1290000 + movie_id),
+                     start + datetime.timedelta(seconds=movie_id)))
+    return rows
+
+
+def latencies(function, arguments):
+    """逐个参数调用function，返回排好序的耗时(微秒)"""
+    result = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        result.append((time.perf_counter() - start) * 1e6)
+    return sorted(result)
+
+
+def report(name, values):
+    """打印中位数、P99和最大值"""
+    print(f"{name:>16}: 中位数 {values[len(values) // 2]:>9,.1f} µs   P99 {values[int(len(values) * 0.99)]:>9,.1f} µs"
+          f"   最大 {values[-1]:>10,.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='电影搜索索引的建索引和查询基准')
+    parser.add_argument('--count', type=int, default=100000, help='合成电影数')
+    parser.add_argument('--queries', type=int, default=2000, help='每种查询的次数')
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.count)
+    rng = random.Random(7)
+    samples = rng.sample(rows, min(args.queries, len(rows)))
+
+    index = MovieSearch()
+    start = time.perf_counter()
+    index.load(rows)
+    print(f"建索引 {len(rows)} 部电影: {time.perf_counter() - start:.2f} s")
+    print(f"索引规模: {index.stats()}")
+
+    # 输入提示：标题、英文标题或人名的前1到3个字
+    prefixes = []
+    for row in samples:
+        text = rng.choice([row[1], row[2], row[3].split(' / ')[0]])
+        prefixes.append(text[:rng.randint(1, 3)])
+    report('输入提示', latencies(lambda prefix: index.suggest(prefix, 10), prefixes))
+
+    # 搜索：标题或人名中间的2到4个字
+    queries = []
+    for row in samples:
+        text = rng.choice([row[1], row[4].split(' / ')[0]])
+        length = min(rng.randint(2, 4), len(text))
+        begin = rng.randint(0, len(text) - length)
+        queries.append(text[begin:begin + length])
+    report('搜索第一页', latencies(lambda query: index.search(query, limit=20), queries))
+    report('单字搜索', latencies(lambda query: index.search(query[0], limit=20), queries[:200]))
+
+    # 翻页：沿着cursor取完前5页
+    def paginate(query):
+        cursor = None
+        for _ in range(5):
+            _, cursor = index.search(query, cursor, 20)
+            if not cursor:
+                break
+    report('翻5页', latencies(paginate, queries[:200]))
+
+    # 增量更新：改1000部电影的标题
+    changed = [(row[0], row[1] + '续集') + row[2:9] + (datetime.datetime(2030, 1, 1),) for row in samples[:1000]]
+    start = time.perf_counter()
+    index.apply(changed)
+    print(f"增量更新 {len(changed)} 部: {(time.perf_counter() - start) * 1000:.1f} ms")
+    report('更新后输入提示', latencies(lambda prefix: index.suggest(prefix, 10), prefixes))
+
+    # 对比：原来只能用LIKE '%x%'扫描四个文本列
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE douban_movies (id INTEGER PRIMARY KEY, title TEXT, title_en TEXT, director TEXT, "
+                 "actors TEXT, rating_count INTEGER)")
+    conn.executemany("INSERT INTO douban_movies VALUES (?, ?, ?, ?, ?, ?)",
+                     [(row[0], row[1], row[2], row[3], row[4], row[7]) for row in rows])
+    like_sql = ("SELECT id, title FROM douban_movies WHERE title LIKE ? OR title_en LIKE ? OR director LIKE ? "
+                "OR actors LIKE ? ORDER BY rating_count DESC LIMIT 20")
+    report('SQLite LIKE', latencies(lambda query: conn.execute(like_sql, (f"%{query}%",) * 4).fetchall(),
+                                    queries[:100]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+from movie_analytics import RATING_EDGES, RATING_LABELS, DECADE_EDGES, DECADE_LABELS
+
+# 可以统计的字段：数值字段按分段下限计数，分类字段按查找表的名称计数
+# stats_table是爬虫增量维护的汇总表，默认分段且没有筛选时直接读它
+FIELDS = {
+    'rating': {'kind': 'numeric', 'column': 'm.rating', 'edges': RATING_EDGES, 'labels': RATING_LABELS,
+               'stats_table': 'movie_stats_rating'},
+    'year': {'kind': 'numeric', 'column': 'm.release_year', 'edges': DECADE_EDGES, 'labels': DECADE_LABELS,
+             'stats_table': 'movie_stats_decade'},
+    'duration': {'kind': 'numeric', 'column': 'm.duration_min', 'edges': [90, 120, 150],
+                 'labels': ['90分钟以下', '90-119分钟', '120-149分钟', '150分钟以上']},
+    # 汇总表里合拍片只算一个分组，这里按国家分组计数(合拍片计入涉及的每个分组)，不读汇总表
+    'country_group': {'kind': 'category', 'junction': 'movie_country', 'lookup': 'country', 'key': 'country_id',
+                      'expression': 'x.country_group'},
+    'country': {'kind': 'category', 'junction': 'movie_country', 'lookup': 'country', 'key': 'country_id',
+                'expression': 'x.name'},
+    'genre': {'kind': 'category', 'junction': 'movie_genre', 'lookup': 'genre', 'key': 'genre_id',
+              'expression': 'x.name'}
+}
+
+# 筛选条件都落在有索引的列上：年份和评分走idx_release_year_rating，类型和国家走查找表唯一键和关联表索引
+FILTERS = {
+    'year_from': ('m.release_year >= %s', int),
+    'year_to': ('m.release_year <= %s', int),
+    'rating_min': ('m.rating >= %s', float),
+    'rating_max': ('m.rating <= %s', float),
+    'genre': ('m.id IN (SELECT fg.movie_id FROM movie_genre fg JOIN genre fgn ON fgn.id = fg.genre_id '
+              'WHERE fgn.name = %s)', str),
+    'country': ('m.id IN (SELECT fc.movie_id FROM movie_country fc JOIN country fcn ON fcn.id = fc.country_id '
+                'WHERE fcn.name = %s)', str)
+}
+
+MAX_BUCKETS = 50
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+
+
+class DistributionSpec(NamedTuple):
+    """一次分布查询的参数，edges为空表示用字段的默认分段"""
+    field: str
+    edges: Tuple[float, ...]
+    filters: Tuple[Tuple[str, Any], ...]
+    limit: int
+
+
+class CompiledDistribution(NamedTuple):
+    """编译好的SQL：filter_names按占位符顺序排列，数值字段的labels和分段编号一一对应，from_stats表示读汇总表"""
+    sql: str
+    filter_names: Tuple[str, ...]
+    labels: Tuple[str, ...]
+    kind: str
+    from_stats: bool = False
+
+
+def _number(value: float) -> str:
+    """数字的文本形式，整数不带小数点"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def bucket_labels(edges: Sequence[float]) -> List[str]:
+    """按分段下限生成名称，第一段是低于第一个下限的部分"""
+    labels = [f"{_number(edges[0])}以下"]
+    labels += [f"{_number(low)}-{_number(high)}" for low, high in zip(edges, edges[1:])]
+    return labels + [f"{_number(edges[-1])}以上"]
+
+
+def parse_spec(args) -> DistributionSpec:
+    """从查询参数解析分布查询：field、buckets(逗号分隔的分段下限)、filters(逗号分隔的名称:值)、limit"""
+    field = args.get('field', 'rating')
+    if field not in FIELDS:
+        raise ValueError(f"不支持的字段: {field}，可选 {', '.join(FIELDS)}")
+
+    edges = ()
+    buckets = args.get('buckets', '').strip()
+    if buckets:
+        if FIELDS[field]['kind'] != 'numeric':
+            raise ValueError(f"字段{field}不支持分段")
+        try:
+            edges = tuple(float(item) for item in buckets.split(','))
+        except ValueError:
+            raise ValueError(f"分段格式不正确: {buckets}")
+        if len(edges) > MAX_BUCKETS or not all(math.isfinite(edge) for edge in edges) \
+                or any(low >= high for low, high in zip(edges, edges[1:])):
+            raise ValueError(f"分段下限必须是递增的数字，最多{MAX_BUCKETS}个")
+
+    filters = {}
+    for item in filter(None, (part.strip() for part in args.get('filters', '').split(','))):
+        name, _, value = item.partition(':')
+        name, value = name.strip(), value.strip()
+        if name not in FILTERS or not value:
+            raise ValueError(f"不支持的筛选条件: {item}，可选 {', '.join(FILTERS)}")
+        try:
+            filters[name] = FILTERS[name][1](value)
+        except ValueError:
+            raise ValueError(f"筛选条件{name}格式不正确: {value}")
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("limit必须是整数")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit必须在1到{MAX_LIMIT}之间")
+    # 筛选条件排序后参与编译缓存的键，书写顺序不同的同一个查询共用一条SQL
+    return DistributionSpec(field, edges, tuple(sorted(filters.items())), limit)
+
+
+@lru_cache(maxsize=256)
+def compile_distribution(field: str, edges: Tuple[float, ...], filter_names: Tuple[str, ...]) -> CompiledDistribution:
+    """把字段、分段和筛选条件名编译成SQL，同样的组合只编译一次；筛选值和limit作为参数传入"""
+    config = FIELDS[field]
+    conditions = [FILTERS[name][0] for name in filter_names]
+
+    if config.get('stats_table') and not edges and not filter_names:
+        # 汇总表里是默认分段的计数，只有几行
+        sql = f"SELECT bucket, movie_count as count FROM {config['stats_table']} WHERE movie_count > 0"
+        if config['kind'] == 'category':
+            sql += " ORDER BY count DESC, bucket LIMIT %s"
+        return CompiledDistribution(sql, (), tuple(config.get('labels', ())), config['kind'], True)
+
+    if config['kind'] == 'numeric':
+        edges = edges or tuple(config['edges'])
+        labels = tuple(config['labels']) if edges == tuple(config['edges']) else tuple(bucket_labels(edges))
+        column = config['column']
+        # INTERVAL返回值所在分段的编号：低于第一个下限为0，不低于最后一个下限为len(edges)
+        sql = (f"SELECT INTERVAL({column}, {', '.join(_number(edge) for edge in edges)}) as bucket_index, "
+               f"COUNT(*) as count FROM douban_movies m "
+               f"WHERE {' AND '.join([f'{column} IS NOT NULL'] + conditions)} "
+               f"GROUP BY bucket_index")
+        return CompiledDistribution(sql, filter_names, labels, 'numeric')
+
+    # 分类字段从关联表出发，有筛选条件时才连douban_movies；合拍片在同一分组里只算一次
+    sql = (f"SELECT {config['expression']} as bucket, COUNT(DISTINCT j.movie_id) as count "
+           f"FROM {config['junction']} j JOIN {config['lookup']} x ON x.id = j.{config['key']}")
+    if conditions:
+        sql += f" JOIN douban_movies m ON m.id = j.movie_id WHERE {' AND '.join(conditions)}"
+    sql += " GROUP BY bucket ORDER BY count DESC, bucket LIMIT %s"
+    return CompiledDistribution(sql, filter_names, (), 'category')
+
+
+def query_distribution(db, spec: DistributionSpec) -> List[Dict[str, Any]]:
+    """执行分布查询，返回[{'bucket': 名称, 'count': 数量}]；数值字段按分段顺序，分类字段按数量从多到少"""
+    filters = dict(spec.filters)
+    compiled = compile_distribution(spec.field, spec.edges, tuple(filters))
+    params = tuple(filters[name] for name in compiled.filter_names)
+    if compiled.kind == 'category':
+        params += (spec.limit,)
+    rows = db.fetch_all(compiled.sql, params or None)
+
+    if compiled.kind == 'category':
+        return [{'bucket': row['bucket'], 'count': int(row['count'])} for row in rows]
+    if compiled.from_stats:
+        # 汇总表按默认分段的顺序排列
+        counts = {row['bucket']: int(row['count']) for row in rows}
+        return [{'bucket': label, 'count': counts[label]} for label in compiled.labels if label in counts]
+    counts = {int(row['bucket_index']): int(row['count']) for row in rows}
+    return [{'bucket': label, 'count': counts[index]}
+            for index, label in enumerate(compiled.labels) if counts.get(index)]
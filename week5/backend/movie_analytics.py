@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# 国家分组，和week3/src/movie_relations.py的country_group规则一致
+COUNTRY_GROUPS = [
+    ('美国', ('美国',)),
+    ('中国', ('中国', '香港', '台湾')),
+    ('日本', ('日本',)),
+    ('英国', ('英国',)),
+    ('法国', ('法国',)),
+    ('意大利', ('意大利',)),
+    ('德国', ('德国',))
+]
+OTHER_COUNTRY_GROUP = '其他'
+GROUP_NAMES = [group for group, _ in COUNTRY_GROUPS] + [OTHER_COUNTRY_GROUP]
+
+# 看板原来的评分和年代分段：edges是各段的下限，labels比edges多一个(最低一段)
+RATING_EDGES = [6.0, 7.0, 8.0, 9.0]
+RATING_LABELS = ['6.0以下', '6.0-6.9', '7.0-7.9', '8.0-8.9', '9.0-10.0']
+DECADE_EDGES = [1980, 1990, 2000, 2010, 2020]
+DECADE_LABELS = ['1980年前', '1980年代', '1990年代', '2000年代', '2010年代', '2020年代']
+
+MISSING_YEAR = -1
+LOAD_SQL = "SELECT id, rating, year, country, genre, updated_time FROM douban_movies"
+
+
+def country_group(name: str) -> str:
+    """国家所属的分组"""
+    for group, keywords in COUNTRY_GROUPS:
+        if any(keyword in name for keyword in keywords):
+            return group
+    return OTHER_COUNTRY_GROUP
+
+
+def _parse_year(text: Any) -> int:
+    """四位数字的年份转成整数，其它返回MISSING_YEAR"""
+    return int(text) if text and len(text) == 4 and text.isdigit() else MISSING_YEAR
+
+
+class Dictionary:
+    """多值列的字典编码：每个不同的字符串对应一个从0开始的整数"""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def encode(self, names: Iterable[str]) -> List[int]:
+        """编码一行的多个值，同一行里重复的值只保留一次"""
+        codes = []
+        for name in names:
+            code = self._codes.get(name)
+            if code is None:
+                code = self._codes[name] = len(self.names)
+                self.names.append(name)
+            if code not in codes:
+                codes.append(code)
+        return codes
+
+    def code(self, name: str) -> Optional[int]:
+        """名称对应的编码，不存在返回None"""
+        return self._codes.get(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class MultiColumn:
+    """多值列，第i行的编码是codes[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self):
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.codes = np.zeros(0, dtype=np.int32)
+        self._row_index = None
+
+    def row_index(self) -> np.ndarray:
+        """每个编码所属的行号，数据变化前重复使用"""
+        if self._row_index is None:
+            self._row_index = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int64), np.diff(self.offsets))
+        return self._row_index
+
+    def update(self, n_rows: int, positions: np.ndarray, lists: Sequence[List[int]]) -> None:
+        """替换positions这些行的值，行号超出现有行数的是新增行，n_rows为更新后的总行数"""
+        rows = self.row_index()
+        keep = ~np.isin(rows, positions)
+        new_rows = np.repeat(positions.astype(np.int64), [len(codes) for codes in lists])
+        new_codes = np.fromiter(chain.from_iterable(lists), dtype=np.int32, count=len(new_rows))
+        rows = np.concatenate((rows[keep], new_rows))
+        codes = np.concatenate((self.codes[keep], new_codes))
+        # 稳定排序保证每行内部的顺序不变
+        order = np.argsort(rows, kind='stable')
+        self.codes = codes[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n_rows)))).astype(np.int64)
+        self._row_index = rows[order]
+
+    def reorder(self, order: np.ndarray) -> None:
+        """按order重排行，新的第i行是原来的第order[i]行"""
+        new_position = np.empty_like(order)
+        new_position[order] = np.arange(len(order))
+        rows = new_position[self.row_index()]
+        by_row = np.argsort(rows, kind='stable')
+        self.codes = self.codes[by_row]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(order))))).astype(np.int64)
+        self._row_index = rows[by_row]
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.codes.nbytes
+
+
+class MovieAnalytics:
+    """douban_movies的列式内存副本，分布统计用NumPy向量运算完成，不再每次查库
+
+    评分为float32(没有评分为NaN)，年份为int16，国家和类型字典编码后按行偏移存放；
+    每部电影所属的国家分组预先算成一个位图，分组计数时合拍片在同一分组里只算一次。
+    """
+
+    def __init__(self, helper=None):
+        self.helper = helper
+        # 刷新会替换整列，调用方连续做筛选和统计时先拿这把锁
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        """清空所有列"""
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.rating = np.zeros(0, dtype=np.float32)
+        self.year = np.zeros(0, dtype=np.int16)
+        self.countries = MultiColumn()
+        self.genres = MultiColumn()
+        self.country_dict = Dictionary()
+        self.genre_dict = Dictionary()
+        self.group_bits = np.zeros(0, dtype=np.uint8)
+        # 分段编号按(字段, 分段下限)缓存，不带筛选的统计结果按参数缓存，数据变化时都清空
+        self._buckets = {}
+        self._results = {}
+        # 已经加载到的最大updated_time，增量刷新从这里开始
+        self.watermark = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """列数据占用的字节数(不含字典)"""
+        return (self.ids.nbytes + self.rating.nbytes + self.year.nbytes + self.group_bits.nbytes
+                + self.countries.nbytes + self.genres.nbytes)
+
+    def load(self, rows: Optional[Iterable[Tuple]] = None) -> int:
+        """全量加载，rows为(id, rating, year, country, genre, updated_time)元组，为空时从数据库流式读取"""
+        if rows is None:
+            rows = self.helper.fetch_iter(LOAD_SQL + " ORDER BY id", as_dict=False)
+        with self.lock:
+            self._reset()
+            self.apply(rows)
+            return len(self)
+
+    def refresh(self) -> int:
+        """增量刷新：只读updated_time不早于上次水位的行；行数对不上(有行被删)时全量重新加载，返回读到的行数"""
+        with self.lock:
+            if self.watermark is None:
+                return self.load()
+            # 同一秒内可能还有没读到的更新，用>=重读一遍，重复应用结果不变
+            changed = self.apply(self.helper.fetch_iter(
+                LOAD_SQL + " WHERE updated_time >= %s ORDER BY id", (self.watermark,), as_dict=False))
+            total = self.helper.fetch_all("SELECT COUNT(*) as row_count FROM douban_movies")[0]['row_count']
+            if total != len(self):
+                return self.load()
+            return changed
+
+    def apply(self, rows: Iterable[Tuple]) -> int:
+        """把一批行写进列里：已有的id原地替换，新的id追加到末尾，返回行数"""
+        with self.lock:
+            ids, ratings, years, countries, genres = [], [], [], [], []
+            watermark = self.watermark
+            for movie_id, rating, year, country, genre, updated_time in rows:
+                ids.append(movie_id)
+                ratings.append(np.nan if rating is None else float(rating))
+                years.append(_parse_year(year))
+                # 国家之间是空格或/，类型之间是空格
+                countries.append(self.country_dict.encode((country or '').replace('/', ' ').split()))
+                genres.append(self.genre_dict.encode((genre or '').split()))
+                if updated_time is not None and (watermark is None or updated_time > watermark):
+                    watermark = updated_time
+            if not ids:
+                return 0
+
+            ids = np.asarray(ids, dtype=np.int64)
+            positions = np.searchsorted(self.ids, ids)
+            existing = (positions < len(self.ids)) & (self.ids[np.minimum(positions, len(self.ids) - 1)] == ids) \
+                if len(self.ids) else np.zeros(len(ids), dtype=bool)
+            new_ids = ids[~existing]
+            # id是自增主键，按id排序加载时新行都在末尾；乱序的新行整体重排一次
+            positions[~existing] = len(self.ids) + np.arange(len(new_ids))
+            n_rows = len(self.ids) + len(new_ids)
+            self.ids = np.concatenate((self.ids, new_ids))
+            self.rating = np.concatenate((self.rating, np.empty(len(new_ids), dtype=np.float32)))
+            self.year = np.concatenate((self.year, np.empty(len(new_ids), dtype=np.int16)))
+            self.rating[positions] = np.asarray(ratings, dtype=np.float32)
+            self.year[positions] = np.asarray(years, dtype=np.int16)
+            self.countries.update(n_rows, positions, countries)
+            self.genres.update(n_rows, positions, genres)
+            self.watermark = watermark
+            if len(new_ids) and np.any(np.diff(self.ids) < 0):
+                self._sort_by_id()
+            self._update_group_bits()
+            self._buckets = {}
+            self._results = {}
+            return len(ids)
+
+    def _sort_by_id(self) -> None:
+        """按id重排所有列，保证id可以二分查找"""
+        order = np.argsort(self.ids, kind='stable')
+        self.ids, self.rating, self.year = self.ids[order], self.rating[order], self.year[order]
+        self.countries.reorder(order)
+        self.genres.reorder(order)
+
+    def _update_group_bits(self) -> None:
+        """重新计算每部电影所属国家分组的位图"""
+        code_bits = np.array([1 << GROUP_NAMES.index(country_group(name)) for name in self.country_dict.names],
+                             dtype=np.uint8)
+        bits = np.zeros(len(self), dtype=np.uint8)
+        if len(self.countries.codes):
+            np.bitwise_or.at(bits, self.countries.row_index(), code_bits[self.countries.codes])
+        self.group_bits = bits
+
+    def filter_mask(self, year_from: Optional[int] = None, year_to: Optional[int] = None,
+                    rating_min: Optional[float] = None, genre: Optional[str] = None,
+                    country: Optional[str] = None) -> np.ndarray:
+        """按条件筛选电影，返回布尔掩码"""
+        with self.lock:
+            return self._filter_mask(year_from, year_to, rating_min, genre, country)
+
+    def _filter_mask(self, year_from, year_to, rating_min, genre, country) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        if year_from is not None:
+            mask &= self.year >= year_from
+        if year_to is not None:
+            mask &= (self.year <= year_to) & (self.year != MISSING_YEAR)
+        if rating_min is not None:
+            mask &= self.rating >= rating_min
+        for column, dictionary, name in ((self.genres, self.genre_dict, genre), (self.countries, self.country_dict, country)):
+            if name is None:
+                continue
+            code = dictionary.code(name)
+            matched = np.zeros(len(self), dtype=bool)
+            if code is not None:
+                matched[column.row_index()[column.codes == code]] = True
+            mask &= matched
+        return mask
+
+    def bucket_counts(self, field: str, edges: Sequence[float], labels: Sequence[str],
+                      mask: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """按下限edges分段计数，labels[0]是低于第一个下限的一段，没有值的行不计"""
+        if len(labels) != len(edges) + 1:
+            raise ValueError("分段名称必须比分段下限多一个")
+        if mask is None:
+            return self._memo(('buckets', field, tuple(edges), tuple(labels)),
+                              lambda: self.bucket_counts(field, edges, labels, np.ones(len(self), dtype=bool)))
+        with self.lock:
+            buckets = self._bucket_codes(field, tuple(edges))
+            buckets = buckets[mask]
+            # 没有值的行编号为len(labels)，计数后丢掉
+            counts = np.bincount(buckets, minlength=len(labels) + 1)[:len(labels)]
+        return [{'bucket': label, 'count': int(count)} for label, count in zip(labels, counts) if count]
+
+    def _bucket_codes(self, field: str, edges: Tuple[float, ...]) -> np.ndarray:
+        """每行所在分段的编号，同样的分段在数据变化前只算一次"""
+        key = (field, edges)
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            values, valid = self._values(field, None)
+            buckets = np.searchsorted(np.asarray(edges, dtype=values.dtype), values, side='right').astype(
+                np.uint8 if len(edges) < 255 else np.int32)
+            buckets[~valid] = len(edges) + 1
+            # 缓存的分段编号不会无限增多，超出时整个清掉
+            if len(self._buckets) >= 32:
+                self._buckets.clear()
+            self._buckets[key] = buckets
+        return buckets
+
+    def histogram(self, field: str, bins: int = 10, value_range: Optional[Tuple[float, float]] = None,
+                  mask: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """等宽直方图"""
+        if mask is None:
+            return self._memo(('histogram', field, bins, value_range),
+                              lambda: self.histogram(field, bins, value_range, np.ones(len(self), dtype=bool)))
+        values, valid = self._values(field, mask)
+        counts, edges = np.histogram(values[valid], bins=bins, range=value_range)
+        return [{'low': round(float(low), 4), 'high': round(float(high), 4), 'count': int(count)}
+                for low, high, count in zip(edges[:-1], edges[1:], counts)]
+
+    def group_counts(self, field: str, mask: Optional[np.ndarray] = None,
+                     limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按国家分组(country_group)、国家(country)或类型(genre)计数，按数量从多到少"""
+        if mask is None:
+            return self._memo(('groups', field), lambda: self._group_counts(field, None))[:limit]
+        return self._group_counts(field, mask)[:limit]
+
+    def _group_counts(self, field: str, mask: Optional[np.ndarray]) -> List[Dict[str, Any]]:
+        with self.lock:
+            if field == 'country_group':
+                bits = self.group_bits if mask is None else self.group_bits[mask]
+                counts = [(name, int(np.count_nonzero(bits & (1 << index)))) for index, name in enumerate(GROUP_NAMES)]
+            elif field in ('country', 'genre'):
+                column, dictionary = (self.countries, self.country_dict) if field == 'country' else (self.genres, self.genre_dict)
+                codes = column.codes if mask is None else column.codes[mask[column.row_index()]]
+                counts = [(dictionary.names[code], int(count))
+                          for code, count in enumerate(np.bincount(codes, minlength=len(dictionary)))]
+            else:
+                raise ValueError(f"不支持的分组字段: {field}")
+        counts = sorted((item for item in counts if item[1]), key=lambda item: item[1], reverse=True)
+        return [{'name': name, 'count': count} for name, count in counts]
+
+    def _memo(self, key: Tuple, compute) -> List[Dict[str, Any]]:
+        """不带筛选的统计结果在数据变化前只算一次，返回副本"""
+        with self.lock:
+            result = self._results.get(key)
+            if result is None:
+                if len(self._results) >= 256:
+                    self._results.clear()
+                result = self._results[key] = compute()
+            return [dict(item) for item in result]
+
+    def _values(self, field: str, mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """取出数值列和有值的行"""
+        with self.lock:
+            if field == 'rating':
+                values = self.rating
+                valid = ~np.isnan(values)
+            elif field == 'year':
+                values = self.year
+                valid = values != MISSING_YEAR
+            else:
+                raise ValueError(f"不支持的数值字段: {field}")
+            if mask is not None:
+                valid = valid & mask
+            return values, valid
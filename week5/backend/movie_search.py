@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+
+LOAD_SQL = ("SELECT id, title, title_en, director, actors, year, rating, rating_count, douban_id, updated_time "
+            "FROM douban_movies")
+# 建索引的文本字段，顺序也是搜索结果的匹配优先级
+TEXT_FIELDS = ('title', 'title_en', 'director', 'actors')
+# 匹配等级：标题开头 < 标题包含 < 导演包含 < 主演包含 < 各个词分散出现
+TIER_TITLE_PREFIX, TIER_TITLE, TIER_DIRECTOR, TIER_ACTORS, TIER_TERMS = range(5)
+
+WORD_PATTERN = re.compile(r'\w+')
+# 前缀范围内的条目不超过SCAN_LIMIT时直接扫描，超过时用预先算好的前TOP_K个
+SCAN_LIMIT = 256
+TOP_K = 64
+# 删除和被替换的文档超过这个比例时整体重建
+COMPACT_RATIO = 0.25
+# 一批新增的前缀键超过这个数时整体归并，否则逐个插入
+MERGE_THRESHOLD = 64
+KEY_END = '\U0010ffff'
+
+
+def normalize(text: Optional[str]) -> str:
+    """全角转半角、转小写，标点和空白统一成一个空格"""
+    return ' '.join(WORD_PATTERN.findall(unicodedata.normalize('NFKC', text or '').lower()))
+
+
+def index_tokens(text: str) -> Set[str]:
+    """文档的n-gram：每个词的单字和相邻两字，中文标题和人名不用分词"""
+    tokens = set()
+    for word in text.split():
+        tokens.update(word)
+        tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def query_tokens(text: str) -> Set[str]:
+    """查询的n-gram：单字的词查单字，其余查相邻两字"""
+    tokens = set()
+    for word in text.split():
+        tokens.update([word] if len(word) == 1 else (word[i:i + 2] for i in range(len(word) - 1)))
+    return tokens
+
+
+def split_names(text: Optional[str]) -> List[str]:
+    """导演和主演按/拆开"""
+    return [name.strip() for name in (text or '').split('/') if name.strip()]
+
+
+class MovieSearch:
+    """电影搜索：标题、英文标题、导演和主演的n-gram倒排索引，加上标题和人名的前缀索引做输入提示
+
+    文档只追加：电影更新后作为新文档加进索引，旧文档标记为删除，倒排表始终按文档号有序，
+    不需要从中间删除；删除的比例超过COMPACT_RATIO时从内存里的文档整体重建一次。
+    前缀索引是排好序的键数组(等价于压缩后的字典树)，前缀对应的是一段连续区间，
+    区间较大的前缀预先记下人气最高的TOP_K条，输入提示只需一次二分查找。
+    """
+
+    def __init__(self, helper=None):
+        self.helper = helper
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        """清空索引"""
+        # 文档号是下面几个列表的下标
+        self.docs: List[Tuple] = []
+        self.texts: List[Tuple[str, ...]] = []
+        self.popularity: List[int] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.positions: Dict[int, int] = {}
+        self.postings: Dict[str, np.ndarray] = {}
+        # 前缀索引：keys有序，entries[i]是(人气, 文档号, 原文)
+        self.keys: List[str] = []
+        self.entries: List[Tuple[int, int, str]] = []
+        self.top: Dict[str, List[Tuple[int, int, str]]] = {}
+        self.dead = 0
+        self.watermark = None
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def load(self, rows: Optional[Iterable[Tuple]] = None) -> int:
+        """全量建索引，rows为LOAD_SQL顺序的元组，为空时从数据库流式读取"""
+        if rows is None:
+            rows = self.helper.fetch_iter(LOAD_SQL + " ORDER BY id", as_dict=False)
+        with self.lock:
+            self._reset()
+            self.apply(rows)
+            return len(self)
+
+    def refresh(self) -> int:
+        """增量更新：只读updated_time不早于上次水位的行；行数对不上(有行被删)时全量重建，返回读到的行数"""
+        with self.lock:
+            if self.watermark is None:
+                return self.load()
+            changed = self.apply(self.helper.fetch_iter(
+                LOAD_SQL + " WHERE updated_time >= %s ORDER BY id", (self.watermark,), as_dict=False))
+            total = self.helper.fetch_all("SELECT COUNT(*) as row_count FROM douban_movies")[0]['row_count']
+            if total != len(self):
+                return self.load()
+            return changed
+
+    def apply(self, rows: Iterable[Tuple]) -> int:
+        """把一批行加进索引：新电影追加，已有的电影替换，内容没变的跳过，返回处理的行数"""
+        with self.lock:
+            first_new = len(self.docs)
+            new_postings = defaultdict(list)
+            new_entries = []
+            count = 0
+            for row in rows:
+                count += 1
+                doc = tuple(row[:9])
+                if row[9] is not None and (self.watermark is None or row[9] > self.watermark):
+                    self.watermark = row[9]
+                old = self.positions.get(doc[0])
+                if old is not None:
+                    if self.docs[old] == doc:
+                        continue
+                    self._delete(old)
+                position = len(self.docs)
+                texts = tuple(normalize(value) for value in doc[1:5])
+                self.docs.append(doc)
+                self.texts.append(texts)
+                self.popularity.append(-(doc[7] or 0))
+                self.positions[doc[0]] = position
+                for token in set().union(*(index_tokens(text) for text in texts)):
+                    new_postings[token].append(position)
+                for original in [doc[1], doc[2]] + split_names(doc[3]) + split_names(doc[4]):
+                    key = normalize(original)
+                    if key:
+                        new_entries.append((key, (self.popularity[position], position, original)))
+
+            if len(self.docs) > first_new:
+                self.alive = np.concatenate((self.alive, np.ones(len(self.docs) - first_new, dtype=bool)))
+                # 新文档号比已有的都大，追加到倒排表末尾后仍然有序
+                for token, positions in new_postings.items():
+                    array = np.asarray(positions, dtype=np.int32)
+                    existing = self.postings.get(token)
+                    self.postings[token] = array if existing is None else np.concatenate((existing, array))
+                self._add_entries(new_entries, rebuild=first_new == 0)
+
+            if self.dead > COMPACT_RATIO * len(self.docs):
+                self._compact()
+            return count
+
+    def _delete(self, position: int) -> None:
+        """标记文档删除，倒排表和前缀索引里的条目在查询时过滤"""
+        self.alive[position] = False
+        self.dead += 1
+
+    def _compact(self) -> None:
+        """丢掉已删除的文档，重新编号后整体重建"""
+        docs = [self.docs[position] for position in sorted(self.positions.values())]
+        watermark = self.watermark
+        self._reset()
+        self.apply(doc + (None,) for doc in docs)
+        self.watermark = watermark
+
+    def _add_entries(self, new_entries: List[Tuple[str, Tuple[int, int, str]]], rebuild: bool) -> None:
+        """把标题和人名加进前缀索引"""
+        if rebuild:
+            new_entries.sort(key=lambda item: item[0])
+            self.keys = [key for key, _ in new_entries]
+            self.entries = [entry for _, entry in new_entries]
+            self.top = {}
+            self._build_top('', 0, len(self.keys))
+            return
+        if len(new_entries) > MERGE_THRESHOLD:
+            # 逐个插入每次都要移动后面的元素，批量时排序后按插入点分段拼接，整个数组只复制一次
+            new_entries.sort(key=lambda item: item[0])
+            keys, entries, last = [], [], 0
+            for key, entry in new_entries:
+                point = bisect_right(self.keys, key, last)
+                keys += self.keys[last:point]
+                entries += self.entries[last:point]
+                keys.append(key)
+                entries.append(entry)
+                last = point
+            self.keys = keys + self.keys[last:]
+            self.entries = entries + self.entries[last:]
+        else:
+            for key, entry in new_entries:
+                index = bisect_right(self.keys, key)
+                self.keys.insert(index, key)
+                self.entries.insert(index, entry)
+        for key, entry in new_entries:
+            # 已经记下前TOP_K条的前缀，新条目人气更高时并进去
+            for length in range(1, len(key) + 1):
+                top = self.top.get(key[:length])
+                if top is not None and (len(top) < TOP_K or entry < top[-1]):
+                    top.append(entry)
+                    top.sort()
+                    del top[TOP_K:]
+
+    def _build_top(self, prefix: str, low: int, high: int) -> None:
+        """为条目数超过SCAN_LIMIT的前缀记下人气最高的TOP_K条，逐层向下直到区间足够小"""
+        if high - low <= SCAN_LIMIT:
+            return
+        if prefix:
+            self.top[prefix] = heapq.nsmallest(TOP_K, self.entries[low:high])
+        length = len(prefix) + 1
+        while low < high:
+            key = self.keys[low]
+            if len(key) < length:
+                # 和前缀完全相同的键没有下一层
+                low = bisect_right(self.keys, key, low, high)
+                continue
+            child = key[:length]
+            end = bisect_left(self.keys, child + KEY_END, low, high)
+            self._build_top(child, low, end)
+            low = end
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """输入提示：标题或人名以prefix开头的电影，按人气排序，同一部电影只出现一次"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self.lock:
+            low = bisect_left(self.keys, prefix)
+            high = bisect_left(self.keys, prefix + KEY_END, low)
+            if high - low <= SCAN_LIMIT:
+                candidates = sorted(self.entries[low:high])
+            else:
+                candidates = self.top.get(prefix)
+                if candidates is None or sum(1 for entry in candidates if self.alive[entry[1]]) < limit:
+                    # 增量加入后新变大的前缀，或者删除太多，重新算一次
+                    candidates = self.top[prefix] = heapq.nsmallest(TOP_K, self.entries[low:high])
+            result, seen = [], set()
+            for _, position, original in candidates:
+                if position in seen or not self.alive[position]:
+                    continue
+                seen.add(position)
+                result.append(dict(self._document(position), matched=original))
+                if len(result) >= limit:
+                    break
+            return result
+
+    def search(self, query: str, cursor: Optional[str] = None, limit: int = 20) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """全文搜索，按(匹配等级, 人气, id)排序，cursor为上一页返回的next_cursor，返回(结果, 下一页的cursor)"""
+        after = parse_cursor(cursor) if cursor else None
+        query = normalize(query)
+        if not query:
+            return [], None
+        with self.lock:
+            ranked = []
+            texts, popularity, docs, tier_of = self.texts, self.popularity, self.docs, self._tier
+            for position in self._candidates(query_tokens(query)).tolist():
+                tier = tier_of(texts[position], query)
+                if tier is None:
+                    continue
+                key = (tier, popularity[position], docs[position][0])
+                # 键集分页：只取排在上一页最后一条之后的结果，翻页期间有新数据也不会重复或漏掉
+                if after is None or key > after:
+                    ranked.append((key, position))
+            page = heapq.nsmallest(limit + 1, ranked)
+            result = [dict(self._document(position), tier=key[0]) for key, position in page[:limit]]
+            next_cursor = format_cursor(page[limit - 1][0]) if len(page) > limit else None
+            return result, next_cursor
+
+    def _candidates(self, tokens: Set[str]) -> np.ndarray:
+        """包含所有n-gram的有效文档，从最短的倒排表开始求交集"""
+        postings = []
+        for token in tokens:
+            array = self.postings.get(token)
+            if array is None:
+                return np.zeros(0, dtype=np.int32)
+            postings.append(array)
+        postings.sort(key=len)
+        result = postings[0]
+        for array in postings[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, array, assume_unique=True)
+        return result[self.alive[result]]
+
+    @staticmethod
+    def _tier(texts: Tuple[str, ...], query: str) -> Optional[int]:
+        """文档对查询的匹配等级，n-gram都命中但原文并不包含查询的返回None"""
+        title, title_en, director, actors = texts
+        if title.startswith(query) or title_en.startswith(query):
+            return TIER_TITLE_PREFIX
+        if query in title or query in title_en:
+            return TIER_TITLE
+        if query in director:
+            return TIER_DIRECTOR
+        if query in actors:
+            return TIER_ACTORS
+        combined = ' '.join(texts)
+        if all(word in combined for word in query.split()):
+            return TIER_TERMS
+        return None
+
+    def _document(self, position: int) -> Dict[str, Any]:
+        """接口返回的电影字段"""
+        movie_id, title, title_en, director, actors, year, rating, rating_count, douban_id = self.docs[position]
+        return {
+            'id': movie_id,
+            'title': title,
+            'title_en': title_en,
+            'director': director,
+            'year': year,
+            'rating': None if rating is None else float(rating),
+            'rating_count': rating_count,
+            'douban_id': douban_id
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """索引规模"""
+        with self.lock:
+            return {
+                'movies': len(self),
+                'documents': len(self.docs),
+                'deleted': self.dead,
+                'tokens': len(self.postings),
+                'postings': int(sum(len(array) for array in self.postings.values())),
+                'prefix_keys': len(self.keys),
+                'cached_prefixes': len(self.top),
+                'watermark': str(self.watermark) if self.watermark else None
+            }
+
+
+def format_cursor(key: Tuple[int, int, int]) -> str:
+    """排序键转成cursor字符串"""
+    return '.'.join(str(value) for value in key)
+
+
+def parse_cursor(cursor: str) -> Tuple[int, int, int]:
+    """解析cursor，格式不对抛ValueError"""
+    parts = cursor.split('.')
+    if len(parts) != 3:
+        raise ValueError(f"cursor格式不正确: {cursor}")
+    try:
+        return tuple(int(part) for part in parts)
+    except ValueError:
+        raise ValueError(f"cursor格式不正确: {cursor}")
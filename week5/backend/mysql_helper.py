@@ -3,13 +3,168 @@
 
 import mysql.connector
 from mysql.connector import Error
-from typing import List, Dict, Any, Optional, Tuple
+from mysql.connector.errors import PoolError
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Union
+from contextlib import contextmanager
+from collections import deque
+import threading
+import time
+from query_cache import QueryCache
+
+
+class MySqlPool:
+    """线程安全、有上限的MySQL连接池"""
+
+    def __init__(self, host='localhost', port=3306, user='root', password='', database='',
+                 pool_size=5, max_idle_time=300, checkout_timeout=10):
+        """初始化连接池，连接按需创建，最多pool_size个"""
+        self.config = {
+            'host': host,
+            'port': port,
+            'user': user,
+            'password': password,
+            'database': database,
+            'charset': 'utf8mb4',
+            'autocommit': True
+        }
+        self.pool_size = pool_size
+        self.max_idle_time = max_idle_time
+        self.checkout_timeout = checkout_timeout
+        # 空闲连接队列，元素为(连接, 归还时间)，后进先出以便冷连接自然过期
+        self._idle = deque()
+        self._created = 0
+        self._available = threading.Condition(threading.Lock())
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'recycled': 0,
+            'reconnects': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0
+        }
+
+    def _create_connection(self):
+        """建立一个新的物理连接"""
+        return mysql.connector.connect(**self.config)
+
+    def _discard(self, conn):
+        """关闭连接，忽略关闭时的异常"""
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def _acquire(self):
+        """从池中取出一个可用连接，池满时等待其他线程归还"""
+        start = time.monotonic()
+        conn = None
+        with self._available:
+            while True:
+                # 优先复用空闲连接，超过空闲时间的直接回收
+                while self._idle:
+                    candidate, released_at = self._idle.pop()
+                    if time.monotonic() - released_at > self.max_idle_time:
+                        self._discard(candidate)
+                        self._created -= 1
+                        self._stats['recycled'] += 1
+                        continue
+                    conn = candidate
+                    break
+                if conn is not None:
+                    break
+                # 没有空闲连接但还没到上限，占一个名额在锁外建连
+                if self._created < self.pool_size:
+                    self._created += 1
+                    break
+                remaining = self.checkout_timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolError(f"获取数据库连接超时({self.checkout_timeout}秒)")
+                self._available.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self._create_connection()
+            else:
+                # 借出前检查连接健康状态，断开的连接重连一次
+                try:
+                    conn.ping(reconnect=False)
+                except Error:
+                    self._discard(conn)
+                    conn = self._create_connection()
+                    with self._available:
+                        self._stats['reconnects'] += 1
+        except Error:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._available:
+            self._stats['checkouts'] += 1
+            self._stats['total_wait'] += waited
+            self._stats['max_wait'] = max(self._stats['max_wait'], waited)
+        return conn
+
+    def _release(self, conn, broken=False):
+        """归还连接，损坏的连接直接关闭并释放名额"""
+        with self._available:
+            if broken:
+                self._discard(conn)
+                self._created -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """以上下文管理器的方式借出连接，退出时自动归还"""
+        conn = self._acquire()
+        broken = False
+        try:
+            yield conn
+        except Error:
+            # 出错后连接状态不可信，丢弃而不是放回池中
+            broken = not conn.is_connected()
+            raise
+        finally:
+            self._release(conn, broken)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回连接池大小和等待时间统计"""
+        with self._available:
+            checkouts = self._stats['checkouts']
+            return {
+                'pool_size': self.pool_size,
+                'created': self._created,
+                'idle': len(self._idle),
+                'in_use': self._created - len(self._idle),
+                'checkouts': checkouts,
+                'timeouts': self._stats['timeouts'],
+                'recycled': self._stats['recycled'],
+                'reconnects': self._stats['reconnects'],
+                'avg_wait_ms': round(self._stats['total_wait'] / checkouts * 1000, 3) if checkouts else 0.0,
+                'max_wait_ms': round(self._stats['max_wait'] * 1000, 3)
+            }
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._available:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+                self._created -= 1
+
 
 class MySqlHelper:
     """MySQL数据库操作工具类"""
-    
-    def __init__(self, host='localhost', port=3306, user='root', password='', database=''):
-        """初始化数据库连接"""
+
+    def __init__(self, host='localhost', port=3306, user='root', password='', database='',
+                 pool: Optional[MySqlPool] = None, cache: Optional[QueryCache] = None):
+        """初始化数据库连接，传入pool时每次操作从连接池借用连接，传入cache时缓存fetch_all的结果"""
+        self.pool = pool
+        self.cache = cache
         self.config = {
             'host': host,
             'port': port,
@@ -21,8 +176,9 @@ class MySqlHelper:
         }
         self.connection = None
         self.cursor = None
-        self.connect()
-    
+        if self.pool is None:
+            self.connect()
+
     def connect(self):
         """建立数据库连接"""
         try:
@@ -30,18 +186,63 @@ class MySqlHelper:
             self.cursor = self.connection.cursor(dictionary=True)
         except Error as e:
             raise
-    
+
+    @contextmanager
+    def _get_cursor(self):
+        """获取游标，使用连接池时游标随连接一起归还"""
+        if self.pool is None:
+            yield self.cursor
+            return
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
     def fetch_all(self, sql: str, params: Optional[Tuple] = None) -> List[Dict[str, Any]]:
         """查询多条记录"""
+        def load():
+            with self._get_cursor() as cursor:
+                cursor.execute(sql, params or ())
+                return cursor.fetchall()
         try:
-            self.cursor.execute(sql, params or ())
-            return self.cursor.fetchall()
+            if self.cache is None:
+                return load()
+            # 爬虫写入后通过共享的代数文件让这里的缓存失效
+            return self.cache.get_or_load(sql, params, load)
         except Error as e:
             raise
-    
+
+    def fetch_iter(self, sql: str, params: Optional[Tuple] = None, chunk_size: int = 1000,
+                   as_dict: bool = True) -> Iterator[Union[Dict[str, Any], Tuple]]:
+        """流式查询，非缓冲游标按块拉取，as_dict=False时直接返回元组行"""
+        # 非缓冲游标在读完之前会占住连接：有连接池时借一个连接专门给这次迭代用，否则单独建一个连接
+        connection = self.pool._acquire() if self.pool is not None else mysql.connector.connect(**self.config)
+        cursor = connection.cursor(buffered=False, dictionary=as_dict)
+        finished = False
+        try:
+            cursor.execute(sql, params or ())
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+            finished = True
+        finally:
+            # 调用方提前停止或出错时结果集还没读完，直接断开连接让服务端丢弃剩余数据，读完的连接放回池里
+            try:
+                cursor.close()
+            except Error:
+                finished = False
+            if self.pool is not None:
+                self.pool._release(connection, broken=not finished)
+            else:
+                connection.close()
+
     def close(self):
-        """关闭数据库连接"""
+        """关闭数据库连接，连接池由创建者负责关闭"""
         if self.cursor:
             self.cursor.close()
         if self.connection and self.connection.is_connected():
-            self.connection.close()
\ No newline at end of file
+            self.connection.close()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+# SQL里出现在这些关键字后面的是表名
+TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE|TABLE)\s+`?(\w+)`?', re.IGNORECASE)
+# ON DUPLICATE KEY UPDATE后面是列名，提取表名前先去掉
+DUPLICATE_PATTERN = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b.*', re.IGNORECASE | re.DOTALL)
+# 加锁读和结果随时间变化的查询不缓存
+UNCACHEABLE_PATTERN = re.compile(
+    r'\bFOR\s+UPDATE\b|\bLOCK\s+IN\s+SHARE\s+MODE\b|\b(?:NOW|RAND|UUID|CURDATE|CURTIME|SYSDATE)\s*\(|\bCURRENT_(?:DATE|TIME)',
+    re.IGNORECASE)
+# 解析不出表名的写操作让所有缓存失效
+ALL_TABLES = '*'
+
+
+def normalize_sql(sql: str) -> str:
+    """合并空白，格式不同的同一条SQL用同一个缓存键"""
+    return ' '.join(sql.split())
+
+
+def sql_tables(sql: str) -> Tuple[str, ...]:
+    """提取SQL涉及的表名(小写、去重、排序)"""
+    return tuple(sorted({name.lower() for name in TABLE_PATTERN.findall(DUPLICATE_PATTERN.sub('', sql))}))
+
+
+def cacheable(sql: str) -> bool:
+    """只缓存结果确定的普通SELECT"""
+    words = sql.split(None, 1)
+    return bool(words) and words[0].upper() == 'SELECT' and not UNCACHEABLE_PATTERN.search(sql)
+
+
+def _copy(value: Any) -> Any:
+    """返回结果的浅拷贝，调用方修改返回的行不会影响缓存"""
+    if isinstance(value, list):
+        return [dict(row) if isinstance(row, dict) else row for row in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+def _estimate_size(value: Any) -> int:
+    """粗略估计结果占用的字节数"""
+    if value is None:
+        return 0
+    rows = value if isinstance(value, list) else [value]
+    size = sys.getsizeof(rows)
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        size += sys.getsizeof(row) + sum(sys.getsizeof(item) for item in values)
+    return size
+
+
+class GenerationStore:
+    """每张表的写入代数，写操作提交后加一，缓存条目记下查询时的代数，对不上就作废
+
+    path为空时只在本进程内有效；指向同一个SQLite文件时，一个进程的写入会让其它进程的缓存失效。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._generations: Dict[str, int] = {}
+        self._data_version = None
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+            # WAL模式下读写互不阻塞
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS table_generation '
+                               '(table_name TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+
+    def _reload(self) -> None:
+        """从文件重新读出所有代数"""
+        self._generations = dict(self._conn.execute('SELECT table_name, generation FROM table_generation'))
+
+    def snapshot(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """返回这些表(以及全局)当前的代数"""
+        with self._lock:
+            if self._conn is not None:
+                # data_version只在别的连接提交后变化，没变时不用重新读表
+                version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+                if version != self._data_version:
+                    self._reload()
+                    self._data_version = version
+            generations = self._generations
+            return (generations.get(ALL_TABLES, 0),) + tuple(generations.get(table, 0) for table in tables)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        """这些表的代数加一"""
+        tables = sorted(set(tables))
+        if not tables:
+            return
+        with self._lock:
+            if self._conn is None:
+                for table in tables:
+                    self._generations[table] = self._generations.get(table, 0) + 1
+                return
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'INSERT INTO table_generation (table_name, generation) VALUES (?, 1) '
+                    'ON CONFLICT(table_name) DO UPDATE SET generation = generation + 1',
+                    [(table,) for table in tables])
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                self._conn.execute('ROLLBACK')
+                raise
+            # 自己的提交不会改变data_version，直接重新读一次
+            self._reload()
+
+    def close(self) -> None:
+        """关闭文件"""
+        if self._conn is not None:
+            self._conn.close()
+
+
+class QueryCache:
+    """查询结果缓存，键为规范化的SQL加参数，按条目数和字节数LRU淘汰
+
+    写操作经过MySqlHelper提交后让涉及的表代数加一，之前缓存的结果随之作废；
+    max_age是兜底的过期时间，防止不经过MySqlHelper的写入让缓存一直不更新。
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024,
+                 max_age: float = 300, generation_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.generations = GenerationStore(generation_path)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'invalidations': 0, 'uncacheable': 0}
+
+    def get_or_load(self, sql: str, params: Optional[Tuple], load: Callable[[], Any]) -> Any:
+        """命中且代数没变时返回缓存的结果，否则调用load查询并缓存"""
+        if not cacheable(sql):
+            with self._lock:
+                self._stats['uncacheable'] += 1
+            return load()
+        normalized = normalize_sql(sql)
+        try:
+            key = (normalized, tuple(params or ()))
+            hash(key)
+        except TypeError:
+            key = (normalized, repr(params))
+        tables = sql_tables(normalized)
+        # 先记下代数再查询：查询期间有写入提交时，这个结果下次读取时就会作废
+        snapshot = self.generations.snapshot(tables)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry['snapshot'] == snapshot and time.monotonic() - entry['stored_at'] < self.max_age:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return _copy(entry['value'])
+                self._stats['stale'] += 1
+                self._remove(key)
+            self._stats['misses'] += 1
+
+        value = load()
+        size = _estimate_size(value)
+        if self.max_entries > 0 and size <= self.max_bytes:
+            with self._lock:
+                self._remove(key)
+                self._entries[key] = {'snapshot': snapshot, 'stored_at': time.monotonic(),
+                                      'value': _copy(value), 'size': size}
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self._stats['evictions'] += 1
+        return value
+
+    def _remove(self, key) -> None:
+        """删除一个条目，调用方持有锁"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry['size']
+
+    def invalidate_sql(self, sql: str) -> None:
+        """一条写操作提交后调用，解析不出表名时让所有缓存失效"""
+        self.invalidate(sql_tables(sql) or (ALL_TABLES,))
+
+    def invalidate(self, tables: Iterable[str]) -> None:
+        """让这些表相关的缓存失效，条目在下次读取时发现代数变化后删除"""
+        tables = [table.lower() for table in tables]
+        if not tables:
+            return
+        self.generations.bump(tables)
+        with self._lock:
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """命中、未命中、淘汰等计数和当前占用"""
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """清空本进程的缓存条目"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def close(self) -> None:
+        """关闭代数文件"""
+        self.generations.close()
+
+
+def shared_cache() -> Optional[QueryCache]:
+    """按环境变量创建查询缓存，QUERY_CACHE_PATH为空时不启用
+
+    爬虫和接口进程指向同一个QUERY_CACHE_PATH，爬虫写入后接口进程的缓存随之失效。
+    """
+    path = os.getenv('QUERY_CACHE_PATH', '')
+    if not path:
+        return None
+    return QueryCache(max_entries=int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 1024)),
+                      max_bytes=int(os.getenv('QUERY_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+                      max_age=float(os.getenv('QUERY_CACHE_MAX_AGE', 300)),
+                      generation_path=path)